@@ -1,13 +1,10 @@
 import os
 from flask import Flask
-from flask import redirect, url_for
+from flask import redirect, url_for, jsonify
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
 from sqlalchemy.orm import DeclarativeBase
 from flask_login import LoginManager
 from flask_wtf.csrf import CSRFProtect
-import logging
-from logging.handlers import RotatingFileHandler
 
 class Base(DeclarativeBase):
     pass
@@ -15,7 +12,6 @@ class Base(DeclarativeBase):
 csrf = CSRFProtect()
 
 db = SQLAlchemy(model_class=Base)
-migrate = Migrate()
 login = LoginManager()
 
 def create_app():
@@ -26,28 +22,74 @@ def create_app():
     app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['OPENAI_API_KEY'] = os.environ.get('OPENAI_API_KEY')
+    app.config['OPENAI_MAX_CONNECTIONS'] = int(os.environ.get('OPENAI_MAX_CONNECTIONS', 100))
+    app.config['OPENAI_ASYNC_MAX_CONNECTIONS'] = int(os.environ.get('OPENAI_ASYNC_MAX_CONNECTIONS', 500))
+    app.config['OPENAI_MAX_KEEPALIVE_CONNECTIONS'] = int(os.environ.get('OPENAI_MAX_KEEPALIVE_CONNECTIONS', 20))
+    app.config['OPENAI_VERIFY_TTL_SECONDS'] = int(os.environ.get('OPENAI_VERIFY_TTL_SECONDS', 3600))
+    app.config['OPENAI_VERIFY_MODEL'] = os.environ.get('OPENAI_VERIFY_MODEL', 'gpt-4')
+    app.config['JOB_LEASE_SECONDS'] = int(os.environ.get('JOB_LEASE_SECONDS', 300))
+    app.config['JOB_MAX_ATTEMPTS'] = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+    app.config['JOB_POLL_INTERVAL'] = float(os.environ.get('JOB_POLL_INTERVAL', 2))
+    app.config['ASGI_JOB_CONCURRENCY'] = int(os.environ.get('ASGI_JOB_CONCURRENCY', 50))
+    app.config['CHAPTER_TEXT_CONCURRENCY'] = int(os.environ.get('CHAPTER_TEXT_CONCURRENCY', 4))
+    app.config['CHAPTER_AUDIO_CONCURRENCY'] = int(os.environ.get('CHAPTER_AUDIO_CONCURRENCY', 4))
+    app.config['CHAPTER_SECTIONS_ENABLED'] = os.environ.get('CHAPTER_SECTIONS_ENABLED', 'false').lower() == 'true'
+    app.config['CHAPTER_SECTION_CONCURRENCY'] = int(os.environ.get('CHAPTER_SECTION_CONCURRENCY', 4))
+    app.config['CHAPTER_SECTION_MAX_TOKENS'] = int(os.environ.get('CHAPTER_SECTION_MAX_TOKENS', 1200))
+    app.config['TTS_SEGMENT_MAX_CHARS'] = int(os.environ.get('TTS_SEGMENT_MAX_CHARS', 1500))
+    app.config['TTS_SEGMENT_CONCURRENCY'] = int(os.environ.get('TTS_SEGMENT_CONCURRENCY', 4))
+    app.config['TTS_CACHE_ENABLED'] = os.environ.get('TTS_CACHE_ENABLED', 'true').lower() == 'true'
+    app.config['TTS_CACHE_DIR'] = os.environ.get('TTS_CACHE_DIR', 'static/audio/cache')
+    app.config['TTS_CACHE_MAX_BYTES'] = int(os.environ.get('TTS_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+    app.config['HLS_SEGMENT_SECONDS'] = float(os.environ.get('HLS_SEGMENT_SECONDS', 6))
+    app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE', 'false').lower() == 'true'
+    app.config['AUDIO_STREAM_IDLE_TIMEOUT'] = int(os.environ.get('AUDIO_STREAM_IDLE_TIMEOUT', 60))
+    app.config['TTS_COST_PER_MILLION_CHARS'] = float(os.environ.get('TTS_COST_PER_MILLION_CHARS', 15.0))
+    app.config['RATE_LIMIT_ENABLED'] = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    app.config['RATE_LIMIT_MAX_WAIT_SECONDS'] = int(os.environ.get('RATE_LIMIT_MAX_WAIT_SECONDS', 300))
+    app.config['OPENAI_CHAT_RPM'] = int(os.environ.get('OPENAI_CHAT_RPM', 500))
+    app.config['OPENAI_CHAT_TPM'] = int(os.environ.get('OPENAI_CHAT_TPM', 40000))
+    app.config['OPENAI_TTS_RPM'] = int(os.environ.get('OPENAI_TTS_RPM', 50))
+    app.config['OPENAI_COMPLETION_TOKEN_ESTIMATE'] = int(os.environ.get('OPENAI_COMPLETION_TOKEN_ESTIMATE', 1500))
+    app.config['PROMPT_TEMPLATE_TTL_SECONDS'] = int(os.environ.get('PROMPT_TEMPLATE_TTL_SECONDS', 60))
+    app.config['OUTLINE_RESPONSES_TOKEN_BUDGET'] = int(os.environ.get('OUTLINE_RESPONSES_TOKEN_BUDGET', 4000))
+    app.config['LLM_CACHE_ENABLED'] = os.environ.get('LLM_CACHE_ENABLED', 'false').lower() == 'true'
+    app.config['LLM_CACHE_TTL_SECONDS'] = int(os.environ.get('LLM_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+    app.config['LLM_CACHE_MAX_ENTRIES'] = int(os.environ.get('LLM_CACHE_MAX_ENTRIES', 10000))
+    app.config['USAGE_LEDGER_ENABLED'] = os.environ.get('USAGE_LEDGER_ENABLED', 'true').lower() == 'true'
+    app.config['USAGE_LEDGER_BATCH_SIZE'] = int(os.environ.get('USAGE_LEDGER_BATCH_SIZE', 100))
+    app.config['USAGE_LEDGER_FLUSH_SECONDS'] = float(os.environ.get('USAGE_LEDGER_FLUSH_SECONDS', 2.0))
+    app.config['LOG_FILE'] = os.environ.get('LOG_FILE', 'logs/audiov4.log')
+    app.config['LOG_FILE_SUFFIX'] = os.environ.get('LOG_FILE_SUFFIX', '')
+    app.config['LOG_LEVEL'] = os.environ.get('LOG_LEVEL', 'INFO').upper()
+    app.config['LOG_MAX_BYTES'] = int(os.environ.get('LOG_MAX_BYTES', 10 * 1024 ** 2))
+    app.config['LOG_BACKUP_COUNT'] = int(os.environ.get('LOG_BACKUP_COUNT', 10))
+    app.config['LOG_QUEUE_SIZE'] = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+    app.config['LOG_SAMPLING_ENABLED'] = os.environ.get('LOG_SAMPLING_ENABLED', 'true').lower() == 'true'
+    app.config['LOG_SAMPLE_BURST'] = int(os.environ.get('LOG_SAMPLE_BURST', 20))
+    app.config['LOG_SAMPLE_RATE'] = int(os.environ.get('LOG_SAMPLE_RATE', 100))
+    app.config['QUERY_BUDGET_STRICT'] = os.environ.get('QUERY_BUDGET_STRICT', 'false').lower() == 'true'
     
     # Initialize extensions
     db.init_app(app)
-    migrate.init_app(app, db)
     login.init_app(app)
     csrf.init_app(app)
     login.login_view = 'auth.login'
+    if os.environ.get('FLASK_RUN_FROM_CLI') == 'true':
+        # Flask-Migrate loads Alembic, which only the `flask db` commands need
+        from flask_migrate import Migrate
+        Migrate(app, db)
+    
+    from services import metrics
+    metrics.init_app(app)
     
     # Setup logging
-    if not os.path.exists('logs'):
-        os.mkdir('logs')
-    file_handler = RotatingFileHandler('logs/audiov4.log', maxBytes=10240, backupCount=10)
-    file_handler.setFormatter(logging.Formatter(
-        '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-    ))
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.setLevel(logging.INFO)
+    from services import structured_logging
+    structured_logging.init_app(app)
     app.logger.info('AudioV4 startup')
     
     # Register blueprints
-    from routes import templates, questionnaires, outlines, audiobooks, prompts
+    from routes import templates, questionnaires, outlines, audiobooks, prompts, usage
     
     # Configure user loader
     from models import User
@@ -61,10 +103,17 @@ def create_app():
     app.register_blueprint(outlines.bp)
     app.register_blueprint(audiobooks.bp)
     app.register_blueprint(prompts.bp)
+    app.register_blueprint(usage.bp)
     
     # Add root route
     @app.route('/')
     def index():
         return redirect(url_for('templates.list_templates'))
     
+    @app.route('/health/openai')
+    def openai_health():
+        from services.openai_client import health_check
+        result = health_check()
+        return jsonify(result), 200 if result['ok'] else 503
+    
     return app
@@ -0,0 +1,22 @@
+"""ASGI entry point: ``uvicorn asgi:application``.
+
+Outline generation and live chapter audio are served by async views on the
+event loop, so one process can hold hundreds of slow OpenAI calls at once;
+everything else runs through the regular Flask app. Audiobook generation
+jobs also run on the event loop, up to ``ASGI_JOB_CONCURRENCY`` at a time
+(0 leaves them to worker.py), with the async AI and audio services.
+``main.py`` remains the plain WSGI entry point.
+"""
+from app import create_app
+from services.async_jobs import AsyncJobRunner
+from services.async_views import AsgiApp
+# Loaded up front so the first request doesn't block the event loop importing openai,
+# and to register the async audiobook job handler
+import services.async_audiobook_service  # noqa: F401
+
+app = create_app()
+application = AsgiApp(app, job_runner=AsyncJobRunner(app) if app.config['ASGI_JOB_CONCURRENCY'] else None)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run('asgi:application', host='0.0.0.0', port=5000)
@@ -0,0 +1,344 @@
+"""Benchmark outline and audiobook generation end to end against a fake OpenAI API.
+
+Starts the stand-in from fake_openai.py, builds the app with ``create_app``
+and runs ``--books`` books through the real routes from ``--concurrency``
+clients. For each book a client submits a questionnaire response, generates
+its outline (as XHR, or as server-sent events with ``--stream``), queues
+the audiobook and polls its status. In-process job workers run the queued
+audiobooks, as worker.py would.
+
+Reports requests per second and p50/p95/p99 latency per route, the time
+each stage took, and the app's own LLM and TTS call timings. Nothing leaves
+the machine and nothing is billed:
+
+    python benchmarks/end_to_end.py --books 20 --concurrency 4 --save before.json
+    # ... change something ...
+    python benchmarks/end_to_end.py --books 20 --concurrency 4 --baseline before.json
+
+Keep the fake API options the same between a baseline and the runs compared
+against it. Uses a throwaway SQLite database unless ``--database-url`` is
+given; SQLite serializes writes, so use PostgreSQL for high concurrency.
+Never point it at a database whose data you want to keep.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_openai
+
+CSRF_TOKEN = re.compile(r'name="csrf_token" value="([^"]+)"')
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--books', type=int, default=10, help='books to generate')
+    parser.add_argument('--concurrency', type=int, default=4, help='clients running books at once')
+    parser.add_argument('--workers', type=int, default=2, help='in-process job workers')
+    parser.add_argument('--stream', action='store_true', help='generate outlines over server-sent events')
+    parser.add_argument('--sections', action='store_true', help='write chapters section by section')
+    parser.add_argument('--poll-interval', type=float, default=0.25, help='seconds between status polls')
+    parser.add_argument('--timeout', type=float, default=600, help='seconds to wait for each audiobook')
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    parser.add_argument('--save', help='write the results as JSON to this file')
+    parser.add_argument('--baseline', help='compare with results saved by an earlier --save')
+    parser.add_argument('--max-regression', type=float,
+                        help='with --baseline, exit non-zero if a p50 or p95 got this many percent slower')
+    fake_openai.add_arguments(parser)
+    return parser.parse_args()
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of sorted ``samples``."""
+    if not samples:
+        return None
+    return samples[min(len(samples) - 1, max(0, round(fraction * len(samples)) - 1))]
+
+class Recorder:
+    """Thread-safe latency samples and error counts by name."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, name, seconds, ok=True):
+        with self.lock:
+            if ok:
+                self.samples[name].append(seconds)
+            else:
+                self.errors[name] += 1
+
+    def summary(self, wall_seconds):
+        summary = {}
+        for name in sorted(set(self.samples) | set(self.errors)):
+            samples = sorted(self.samples[name])
+            summary[name] = {
+                'count': len(samples),
+                'errors': self.errors[name],
+                'rps': round(len(samples) / wall_seconds, 2) if wall_seconds else None,
+                **{f'p{int(fraction * 100)}_ms': round(percentile(samples, fraction) * 1000, 1) if samples else None
+                   for fraction in (0.5, 0.95, 0.99)},
+                'mean_ms': round(sum(samples) / len(samples) * 1000, 1) if samples else None,
+            }
+        return summary
+
+class Client:
+    """A browser session: a test client with its own cookies and CSRF token."""
+
+    def __init__(self, app, recorder):
+        self.client = app.test_client()
+        self.recorder = recorder
+        page = self.client.get('/templates')
+        self.csrf_token = CSRF_TOKEN.search(page.get_data(as_text=True)).group(1)
+
+    def request(self, name, method, url, expect=(200,), **kwargs):
+        headers = {'X-CSRFToken': self.csrf_token, **kwargs.pop('headers', {})}
+        started = time.perf_counter()
+        response = self.client.open(url, method=method, headers=headers, **kwargs)
+        ok = response.status_code in expect
+        self.recorder.record(name, time.perf_counter() - started, ok)
+        if not ok:
+            raise RuntimeError(f"{method} {url} returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+        return response
+
+def run_book(app, fake, http, stages, template_id, args, index):
+    started = time.perf_counter()
+    client = Client(app, http)
+    answers = {'0': {'0': f"Book {index}: " + fake.prose(120)}}
+    response = client.request('POST /questionnaires/respond', 'POST', f'/questionnaires/respond/{template_id}',
+                              json=answers)
+    response_id = response.get_json()['redirect_url'].rstrip('/').rsplit('/', 1)[-1]
+
+    outline_started = time.perf_counter()
+    if args.stream:
+        # Timed to the response headers; the whole stream is the outline stage
+        response = client.request('POST /outlines/generate (stream)', 'POST', f'/outlines/generate/{response_id}',
+                                  json={}, headers={'Accept': 'text/event-stream'}, buffered=False)
+        outline_url = None
+        event = None
+        for line in _lines(response.response):
+            if line.startswith('event:'):
+                if event is None:
+                    stages.record('outline first event', time.perf_counter() - outline_started)
+                event = line[len('event:'):].strip()
+            elif line.startswith('data:') and event in ('done', 'error'):
+                data = json.loads(line[len('data:'):])
+                if event == 'error':
+                    raise RuntimeError(f"Streamed outline for response {response_id} failed: {data['message']}")
+                outline_url = data['redirect_url']
+        response.close()
+        if outline_url is None:
+            raise RuntimeError(f"Streamed outline for response {response_id} did not finish")
+    else:
+        response = client.request('POST /outlines/generate', 'POST', f'/outlines/generate/{response_id}',
+                                  json={}, headers={'X-Requested-With': 'XMLHttpRequest'})
+        outline_url = response.get_json()['redirect_url']
+    stages.record('outline', time.perf_counter() - outline_started)
+    outline_id = outline_url.rstrip('/').rsplit('/', 1)[-1]
+
+    queued = time.perf_counter()
+    response = client.request('POST /audiobooks/generate', 'POST', f'/audiobooks/generate/{outline_id}',
+                              expect=(202,), headers={'X-Requested-With': 'XMLHttpRequest'})
+    audiobook_id = response.get_json()['audiobook_id']
+
+    seen = set()
+    while True:
+        status = client.request('GET /audiobooks/status', 'GET', f'/audiobooks/{audiobook_id}/status').get_json()
+        elapsed = time.perf_counter() - queued
+        job = status['job'] or {}
+        if job.get('status') in ('running', 'completed') and 'started' not in seen:
+            seen.add('started')
+            stages.record('audiobook queued to running', elapsed)
+        if any(chapter['audio'] == 'ready' for chapter in status['chapters']) and 'first' not in seen:
+            seen.add('first')
+            stages.record('audiobook first chapter ready', elapsed)
+        if status['status'] == 'completed':
+            stages.record('audiobook completed', elapsed)
+            break
+        if status['status'] == 'failed' or job.get('status') == 'failed':
+            stages.record('audiobook completed', elapsed, ok=False)
+            raise RuntimeError(f"Audiobook {audiobook_id} failed: {job.get('error')}")
+        if elapsed > args.timeout:
+            stages.record('audiobook completed', elapsed, ok=False)
+            raise RuntimeError(f"Audiobook {audiobook_id} not done after {args.timeout}s")
+        time.sleep(args.poll_interval)
+    stages.record('book', time.perf_counter() - started)
+
+def _lines(chunks):
+    buffer = ''
+    for chunk in chunks:
+        buffer += chunk.decode('utf-8') if isinstance(chunk, bytes) else chunk
+        *lines, buffer = buffer.split('\n')
+        yield from lines
+    if buffer:
+        yield buffer
+
+def run_workers(app, count, stop):
+    from services.job_queue import JobQueue
+
+    def work(index):
+        with app.app_context():
+            queue = JobQueue()
+            worker_id = f"benchmark:{os.getpid()}:{index}"
+            while not stop.is_set():
+                job = queue.claim(worker_id)
+                if job is None:
+                    stop.wait(0.05)
+                    continue
+                queue.run(job, worker_id)
+
+    threads = [threading.Thread(target=work, args=(index,), name=f"benchmark-worker-{index}", daemon=True)
+               for index in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+def service_calls():
+    """``{'service operation': [count, total seconds]}`` from the app's own metrics."""
+    from services.metrics import SERVICE_CALL_SECONDS
+    totals = defaultdict(lambda: [0, 0.0])
+    for metric in SERVICE_CALL_SECONDS.collect():
+        for sample in metric.samples:
+            key = f"{sample.labels['service']} {sample.labels['operation']}"
+            if sample.name.endswith('_count'):
+                totals[key][0] += sample.value
+            elif sample.name.endswith('_sum'):
+                totals[key][1] += sample.value
+    return totals
+
+def service_call_summary(before, after):
+    summary = {}
+    for key, (count, seconds) in sorted(after.items()):
+        count -= before.get(key, [0, 0.0])[0]
+        seconds -= before.get(key, [0, 0.0])[1]
+        if count:
+            summary[key] = {'count': int(count), 'mean_ms': round(seconds / count * 1000, 1)}
+    return summary
+
+def print_results(results):
+    print(f"\n{results['books']} books in {results['wall_seconds']}s "
+          f"({results['books_per_minute']} books/minute, {results['failed_books']} failed)")
+    for section, title in (('http', 'route'), ('stages', 'stage')):
+        print(f"\n{title:<36} {'count':>6} {'errors':>6} {'rps':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        for name, stats in results[section].items():
+            print(f"{name:<36} {stats['count']:>6} {stats['errors']:>6} {stats['rps'] or 0:>7} "
+                  + ' '.join(f"{stats[key] if stats[key] is not None else '-':>9}"
+                             for key in ('p50_ms', 'p95_ms', 'p99_ms')))
+    print(f"\n{'service call':<36} {'count':>6} {'mean ms':>9}")
+    for name, stats in results['service_calls'].items():
+        print(f"{name:<36} {stats['count']:>6} {stats['mean_ms']:>9}")
+    print(f"\nfake OpenAI: {', '.join(f'{name} {count}' for name, count in results['fake_openai'].items())}")
+
+def compare(results, baseline, max_regression):
+    """Print changes against ``baseline``; return the regressions over ``max_regression`` percent."""
+    regressions = []
+    print(f"\n{'compared with baseline':<48} {'baseline':>9} {'now':>9} {'change':>8}")
+    rows = [('books/minute', baseline.get('books_per_minute'), results['books_per_minute'], False)]
+    for section in ('http', 'stages'):
+        for name, stats in results[section].items():
+            old = baseline.get(section, {}).get(name)
+            if not old:
+                continue
+            for key in ('p50_ms', 'p95_ms'):
+                rows.append((f"{name} {key[:3]}", old.get(key), stats.get(key), True))
+    for label, old, new, lower_is_better in rows:
+        if not old or new is None:
+            continue
+        change = (new - old) / old * 100
+        print(f"{label:<48} {old:>9} {new:>9} {change:>+7.1f}%")
+        slower = change if lower_is_better else -change
+        if max_regression is not None and slower > max_regression:
+            regressions.append(f"{label}: {old} -> {new} ({change:+.1f}%)")
+    return regressions
+
+def main():
+    args = parse_args()
+    # Audio files are written relative to the working directory, which moves to a scratch directory
+    save, baseline_path = (os.path.abspath(path) if path else None for path in (args.save, args.baseline))
+    scratch = tempfile.mkdtemp(prefix='audiov4-bench-')
+    fake = fake_openai.from_arguments(args).start()
+
+    os.environ['DATABASE_URL'] = args.database_url or 'sqlite:///' + os.path.join(scratch, 'bench.db')
+    os.environ['OPENAI_BASE_URL'] = fake.url
+    os.environ['OPENAI_API_KEY'] = 'fake'
+    os.environ['LOG_FILE'] = os.path.join(scratch, 'logs', 'bench.log')
+    os.environ['CHAPTER_SECTIONS_ENABLED'] = 'true' if args.sections else 'false'
+    for name, value in (('OPENAI_CHAT_RPM', '100000'), ('OPENAI_CHAT_TPM', '100000000'),
+                        ('OPENAI_TTS_RPM', '100000'), ('TTS_CACHE_ENABLED', 'false')):
+        os.environ.setdefault(name, value)
+    os.chdir(scratch)
+
+    from app import create_app, db
+    import models
+    import services.audiobook_service  # noqa: F401 - registers the audiobook job handler
+    import services.ai_service  # noqa: F401 - keeps the first-use import out of the timings
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        template = models.Template(title='Benchmark', description='End-to-end benchmark',
+                                   sections=[{'title': 'About the book', 'questions': [{'text': 'What is it about?'}]}])
+        db.session.add(template)
+        db.session.commit()
+        template_id = template.id
+    app.test_client().get('/health/openai')
+
+    http, stages = Recorder(), Recorder()
+    stop = threading.Event()
+    workers = run_workers(app, args.workers, stop)
+    calls_before = service_calls()
+    failed = 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = [pool.submit(run_book, app, fake, http, stages, template_id, args, index) for index in range(args.books)]
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                failed += 1
+                print(f"Book failed: {e}", file=sys.stderr)
+    wall_seconds = time.perf_counter() - started
+    stop.set()
+    for worker in workers:
+        worker.join()
+    fake.stop()
+
+    results = {
+        'options': {name: value for name, value in vars(args).items()
+                    if name not in ('save', 'baseline', 'max_regression', 'database_url')},
+        'books': args.books,
+        'failed_books': failed,
+        'wall_seconds': round(wall_seconds, 2),
+        'books_per_minute': round((args.books - failed) / wall_seconds * 60, 2),
+        'http': http.summary(wall_seconds),
+        'stages': stages.summary(wall_seconds),
+        'service_calls': service_call_summary(calls_before, service_calls()),
+        'fake_openai': dict(fake.counts),
+    }
+    print_results(results)
+    if save:
+        with open(save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved results to {args.save}")
+
+    regressions = []
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        if baseline.get('options') != results['options']:
+            print("\nWarning: the baseline was run with different options", file=sys.stderr)
+        regressions = compare(results, baseline, args.max_regression)
+    for regression in regressions:
+        print(f"Regression: {regression}", file=sys.stderr)
+    sys.exit(1 if failed or regressions else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+"""A local stand-in for the OpenAI chat, speech and models endpoints.
+
+Used by end_to_end.py, and can be run on its own so a real app server can
+be pointed at it with ``OPENAI_BASE_URL``:
+
+    python benchmarks/fake_openai.py --port 8765 --chat-latency lognormal:800,0.4
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=fake python main.py
+
+Chat requests get an outline in the JSON shape AIService expects, or a few
+paragraphs of chapter text, streamed as server-sent events when asked.
+Speech requests get silent 128 kbps MP3 frames, as many as the input would
+take to read aloud. Latencies are drawn from configurable distributions,
+and a share of requests, or the first few, can be answered with 429s.
+
+Latency specs are ``fixed:MS``, ``uniform:LOW_MS,HIGH_MS``,
+``normal:MEAN_MS,STDDEV_MS`` or ``lognormal:MEDIAN_MS,SIGMA``.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+import math
+import random
+import threading
+import time
+
+# One MPEG-1 Layer III frame at 128 kbps, 44.1 kHz: 417 bytes, 1152 samples
+MP3_FRAME = bytes([0xFF, 0xFB, 0x90, 0x64]) + bytes(413)
+MP3_FRAME_SECONDS = 1152 / 44100
+WORDS = ('the quiet river carried every story past the old mill while lanterns flickered along '
+         'the bank and travellers paused to listen before walking on toward the distant hills').split()
+
+class Latency:
+    """Seconds drawn from a latency spec."""
+
+    def __init__(self, spec):
+        self.spec = spec
+        kind, _, params = spec.partition(':')
+        values = [float(value) for value in params.split(',')] if params else []
+        samplers = {
+            'fixed': (1, lambda rng, ms: ms),
+            'uniform': (2, lambda rng, low, high: rng.uniform(low, high)),
+            'normal': (2, lambda rng, mean, stddev: rng.gauss(mean, stddev)),
+            'lognormal': (2, lambda rng, median, sigma: rng.lognormvariate(math.log(median), sigma)),
+        }
+        if kind not in samplers or len(values) != samplers[kind][0]:
+            raise ValueError(f"Bad latency spec '{spec}'; use fixed:MS, uniform:LOW,HIGH, "
+                             f"normal:MEAN,STDDEV or lognormal:MEDIAN,SIGMA")
+        self.sampler = samplers[kind][1]
+        self.values = values
+
+    def sample(self, rng):
+        return max(0.0, self.sampler(rng, *self.values)) / 1000
+
+class FakeOpenAI:
+    """Serve the fake API on a background thread; ``url`` is the base URL to give the client."""
+
+    def __init__(self, host='127.0.0.1', port=0, chat_latency='lognormal:800,0.4',
+                 speech_latency='lognormal:1500,0.3', stream_interval_ms=20, rate_limit_rate=0.0,
+                 rate_limit_first=0, retry_after_ms=200, chapters=5, chapter_words=300, chars_per_second=15, seed=None):
+        self.chat_latency = Latency(chat_latency)
+        self.speech_latency = Latency(speech_latency)
+        self.stream_interval = stream_interval_ms / 1000
+        self.rate_limit_rate = rate_limit_rate
+        self.rate_limit_first = rate_limit_first
+        self.requests = 0
+        self.retry_after_ms = retry_after_ms
+        self.chapters = chapters
+        self.chapter_words = chapter_words
+        self.chars_per_second = chars_per_second
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {'chat': 0, 'chat_stream': 0, 'speech': 0, 'models': 0, 'rate_limited': 0}
+        self.server = ThreadingHTTPServer((host, port), _handler(self))
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='fake-openai', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def draw(self, latency):
+        with self.lock:
+            return latency.sample(self.rng)
+
+    def rate_limited(self):
+        with self.lock:
+            self.requests += 1
+            return self.requests <= self.rate_limit_first or self.rng.random() < self.rate_limit_rate
+
+    def outline(self):
+        return {
+            'title': 'A Benchmark Book',
+            'chapters': [{
+                'number': number,
+                'title': f"Chapter {number}",
+                'summary': f"What happens in chapter {number}.",
+                'key_points': [f"First point of chapter {number}", f"Second point of chapter {number}"],
+                'estimated_duration': '10 minutes'
+            } for number in range(1, self.chapters + 1)]
+        }
+
+    def prose(self, words):
+        with self.lock:
+            chosen = [self.rng.choice(WORDS) for _ in range(words)]
+        sentences = [' '.join(chosen[i:i + 12]).capitalize() + '.' for i in range(0, len(chosen), 12)]
+        return '\n\n'.join(' '.join(sentences[i:i + 5]) for i in range(0, len(sentences), 5))
+
+    def speech(self, text):
+        frames = max(1, math.ceil(len(text) / self.chars_per_second / MP3_FRAME_SECONDS))
+        return MP3_FRAME * frames
+
+def _handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if not self.path.startswith('/v1/models/'):
+                return self._json(404, {'error': {'message': 'Not found', 'type': 'invalid_request_error'}})
+            fake.count('models')
+            self._json(200, {'id': self.path.rsplit('/', 1)[-1], 'object': 'model', 'created': 0, 'owned_by': 'fake'})
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            if self.path == '/v1/chat/completions':
+                self._chat(body)
+            elif self.path == '/v1/audio/speech':
+                self._speech(body)
+            else:
+                self._json(404, {'error': {'message': 'Not found', 'type': 'invalid_request_error'}})
+
+        def _chat(self, body):
+            time.sleep(fake.draw(fake.chat_latency))
+            if self._rate_limit():
+                return
+            system = next((m['content'] for m in body.get('messages', []) if m['role'] == 'system'), '')
+            if 'outline' in system.lower():
+                content = json.dumps(fake.outline())
+            else:
+                content = fake.prose(min(fake.chapter_words, body.get('max_tokens') or fake.chapter_words))
+            prompt_tokens = sum(len(m.get('content', '')) for m in body.get('messages', [])) // 4
+            usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': len(content) // 4,
+                     'total_tokens': prompt_tokens + len(content) // 4}
+
+            if not body.get('stream'):
+                fake.count('chat')
+                return self._json(200, {
+                    'id': 'chatcmpl-fake', 'object': 'chat.completion', 'created': int(time.time()),
+                    'model': body['model'],
+                    'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content},
+                                 'finish_reason': 'stop'}],
+                    'usage': usage
+                })
+
+            fake.count('chat_stream')
+            self._start(200, 'text/event-stream')
+            for i in range(0, len(content), 16):
+                self._event({'choices': [{'index': 0, 'delta': {'content': content[i:i + 16]}, 'finish_reason': None}]},
+                            body)
+                time.sleep(fake.stream_interval)
+            self._event({'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]}, body)
+            if (body.get('stream_options') or {}).get('include_usage'):
+                self._event({'choices': [], 'usage': usage}, body)
+            self._chunk(b'data: [DONE]\n\n')
+            self._chunk(b'')
+
+        def _speech(self, body):
+            time.sleep(fake.draw(fake.speech_latency))
+            if self._rate_limit():
+                return
+            fake.count('speech')
+            audio = fake.speech(body.get('input', ''))
+            self._start(200, 'audio/mpeg')
+            for i in range(0, len(audio), 64 * 1024):
+                self._chunk(audio[i:i + 64 * 1024])
+            self._chunk(b'')
+
+        def _rate_limit(self):
+            if not fake.rate_limited():
+                return False
+            fake.count('rate_limited')
+            self._json(429, {'error': {'message': 'Rate limit reached', 'type': 'requests',
+                                       'code': 'rate_limit_exceeded'}},
+                       {'retry-after-ms': str(fake.retry_after_ms), 'retry-after': str(fake.retry_after_ms / 1000)})
+            return True
+
+        def _limit_headers(self):
+            # Generous limits, so the app's own rate limiter isn't what gets measured
+            return {
+                'x-ratelimit-limit-requests': '100000', 'x-ratelimit-remaining-requests': '99999',
+                'x-ratelimit-limit-tokens': '100000000', 'x-ratelimit-remaining-tokens': '99999999',
+            }
+
+        def _json(self, status, payload, headers=None):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            for name, value in {**self._limit_headers(), **(headers or {})}.items():
+                self.send_header(name, value)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _start(self, status, content_type):
+            self.send_response(status)
+            for name, value in self._limit_headers().items():
+                self.send_header(name, value)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+
+        def _chunk(self, data):
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        def _event(self, chunk, body):
+            chunk = {'id': 'chatcmpl-fake', 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                     'model': body['model'], **chunk}
+            self._chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+
+    return Handler
+
+def add_arguments(parser):
+    """Options shared by this script and end_to_end.py."""
+    parser.add_argument('--chat-latency', default='lognormal:800,0.4', help='chat latency before the first token')
+    parser.add_argument('--speech-latency', default='lognormal:1500,0.3', help='speech latency before the audio')
+    parser.add_argument('--stream-interval-ms', type=float, default=20, help='delay between streamed chunks')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='share of requests answered with 429')
+    parser.add_argument('--rate-limit-first', type=int, default=0, help='answer the first N requests with 429')
+    parser.add_argument('--retry-after-ms', type=int, default=200, help='retry-after sent with 429s')
+    parser.add_argument('--chapters', type=int, default=5, help='chapters per outline')
+    parser.add_argument('--chapter-words', type=int, default=300, help='words per chapter or section')
+    parser.add_argument('--chars-per-second', type=float, default=15, help='speaking rate of the canned audio')
+    parser.add_argument('--seed', type=int, help='seed for latencies, 429s and text')
+
+def from_arguments(args, **kwargs):
+    return FakeOpenAI(chat_latency=args.chat_latency, speech_latency=args.speech_latency,
+                      stream_interval_ms=args.stream_interval_ms, rate_limit_rate=args.rate_limit_rate,
+                      rate_limit_first=args.rate_limit_first, retry_after_ms=args.retry_after_ms, chapters=args.chapters,
+                      chapter_words=args.chapter_words, chars_per_second=args.chars_per_second,
+                      seed=args.seed, **kwargs)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    add_arguments(parser)
+    args = parser.parse_args()
+    fake = from_arguments(args, host=args.host, port=args.port)
+    print(f"Fake OpenAI API at {fake.url}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(fake.counts))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""Benchmark the list views' queries as the tables grow.
+
+Seeds questionnaire responses in steps up to ``--rows`` and, at each size,
+times the first page, a page deep in the list reached by cursor, and the
+same deep page reached with ``OFFSET`` for comparison. Keyset pages should
+stay flat while the OFFSET column grows with the table.
+
+    python benchmarks/list_pagination.py --rows 300000
+
+Uses a throwaway SQLite database unless ``--database-url`` is given. Never
+point it at a database whose data you want to keep.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=300000, help='rows to grow the table to')
+    parser.add_argument('--steps', type=int, default=4, help='number of sizes to measure')
+    parser.add_argument('--per-page', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=20, help='timed runs per query')
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    return parser.parse_args()
+
+def timed(func, repeat):
+    """Median wall time of ``func`` in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+def seed(db, models, template_id, start, count, base_time):
+    batch = 5000
+    for offset in range(start, start + count, batch):
+        rows = [{
+            'id': str(uuid.uuid4()),
+            'template_id': template_id,
+            'responses': {'0': {'0': f'answer {i}'}},
+            # Roughly one in twenty responses is deleted, like real usage
+            'status': 'deleted' if i % 20 == 0 else 'submitted',
+            'created_at': base_time + timedelta(seconds=i),
+            'updated_at': base_time + timedelta(seconds=i),
+        } for i in range(offset, min(offset + batch, start + count))]
+        db.session.execute(db.insert(models.QuestionnaireResponse), rows)
+        db.session.commit()
+
+def main():
+    args = parse_args()
+    os.environ['DATABASE_URL'] = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    os.environ.setdefault('OPENAI_API_KEY', 'unused')
+
+    from app import create_app, db
+    import models
+    from services.pagination import encode_cursor, paginate
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        template = models.Template(title='Benchmark', sections=[])
+        db.session.add(template)
+        db.session.commit()
+
+        def base_query():
+            return models.QuestionnaireResponse.query.filter(models.QuestionnaireResponse.status != 'deleted')
+
+        def first_page():
+            return paginate(base_query(), models.QuestionnaireResponse, per_page=args.per_page)
+
+        print(f"{'rows':>10} {'first page':>12} {'keyset deep':>12} {'offset deep':>12}")
+        base_time = datetime(2024, 1, 1)
+        seeded = 0
+        for step in range(1, args.steps + 1):
+            target = args.rows * step // args.steps
+            seed(db, models, template.id, seeded, target - seeded, base_time)
+            seeded = target
+
+            # A page about half-way down the list, reached both ways
+            depth = seeded // 2
+            middle = base_query().order_by(
+                models.QuestionnaireResponse.created_at.desc(), models.QuestionnaireResponse.id.desc()
+            ).offset(depth).first()
+            cursor = encode_cursor(middle)
+
+            def keyset_page():
+                return paginate(base_query(), models.QuestionnaireResponse, cursor=cursor, per_page=args.per_page)
+
+            def offset_page():
+                return base_query().order_by(
+                    models.QuestionnaireResponse.created_at.desc(), models.QuestionnaireResponse.id.desc()
+                ).offset(depth).limit(args.per_page).all()
+
+            print(f"{seeded:>10} {timed(first_page, args.repeat):>10.2f}ms "
+                  f"{timed(keyset_page, args.repeat):>10.2f}ms {timed(offset_page, args.repeat):>10.2f}ms")
+            db.session.expire_all()
+
+if __name__ == '__main__':
+    main()
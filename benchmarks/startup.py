@@ -0,0 +1,136 @@
+"""Profile imports at startup and check cold start against a budget.
+
+Each target is started in a fresh interpreter, the way a deploy, an
+autoscaled worker or a one-off CLI job would start it:
+
+    main    import main.py, which builds the web app
+    worker  build the app and load the job handlers, as worker.py does
+    cli     list the commands of the migrations.py CLI
+
+By default every target is run once under ``python -X importtime`` and the
+slowest top-level packages and modules are reported:
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --target cli --top 40
+
+With ``--check`` each target is started ``--runs`` times instead. The
+script exits non-zero if a median cold start is over its budget, or if a
+target loaded a module that should only load on first use (openai, httpx,
+tiktoken, and alembic outside the CLI). tests/test_startup.py runs the same
+check with the test suite.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TARGETS = {
+    'main': ['-c', 'import main'],
+    'worker': ['-c', 'from app import create_app; import services.audiobook_service; create_app()'],
+    'cli': ['-m', 'flask', '--app', 'migrations', '--help'],
+}
+# Milliseconds for a median cold start, generous enough for a slow CI machine
+BUDGETS_MS = {'main': 1500, 'worker': 1500, 'cli': 2500}
+# Loaded on first use; the app and worker must start without them
+LAZY_MODULES = ('openai', 'httpx', 'tiktoken', 'alembic')
+# The flask CLI always loads Flask-Migrate's `db` commands, and Alembic with them
+EAGER_ALLOWED = {'cli': ('alembic',)}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--target', choices=sorted(TARGETS), action='append',
+                        help='target to run, may be repeated (default: all)')
+    parser.add_argument('--top', type=int, default=20, help='packages and modules to list')
+    parser.add_argument('--check', action='store_true', help='time cold starts and enforce the budgets')
+    parser.add_argument('--runs', type=int, default=5, help='cold starts per target with --check')
+    parser.add_argument('--budget-ms', type=float, help='one budget for every target, overriding the defaults')
+    return parser.parse_args()
+
+def environment(scratch):
+    env = dict(os.environ)
+    # Starting the app doesn't connect, but it needs a URL and somewhere to log
+    env.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(scratch, 'startup.db'))
+    env['LOG_FILE'] = os.path.join(scratch, 'startup.log')
+    env['PYTHONDONTWRITEBYTECODE'] = '1'
+    return env
+
+def run(target, env, *options):
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, *options, *TARGETS[target]], cwd=ROOT, env=env,
+                            capture_output=True, text=True)
+    elapsed = (time.perf_counter() - started) * 1000
+    if result.returncode != 0:
+        sys.exit(f"{target} failed to start:\n{result.stderr}")
+    return elapsed, result
+
+def import_times(stderr):
+    """``(module, self_us, cumulative_us)`` from ``-X importtime`` output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+def profile(target, env, top):
+    elapsed, result = run(target, env, '-X', 'importtime')
+    rows = import_times(result.stderr)
+    packages = defaultdict(int)
+    for name, self_us, _ in rows:
+        packages[name.split('.')[0]] += self_us
+
+    print(f"\n{target}: {elapsed:.0f} ms wall, {sum(packages.values()) / 1000:.0f} ms importing "
+          f"{len(rows)} modules")
+    print(f"  {'package':<32} {'self ms':>9}")
+    for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        print(f"  {package:<32} {self_us / 1000:>9.1f}")
+    print(f"  {'module':<48} {'cumulative ms':>14}")
+    for name, _, cumulative_us in sorted(rows, key=lambda row: -row[2])[:top]:
+        print(f"  {name:<48} {cumulative_us / 1000:>14.1f}")
+
+def eager_modules(target, env):
+    """The ``LAZY_MODULES`` that ``target`` imported while starting."""
+    loaded = {name.split('.')[0] for name, _, _ in import_times(run(target, env, '-X', 'importtime')[1].stderr)}
+    return [module for module in LAZY_MODULES
+            if module in loaded and module not in EAGER_ALLOWED.get(target, ())]
+
+def check(target, env, runs, budget_ms):
+    samples = sorted(run(target, env)[0] for _ in range(runs))
+    median = samples[len(samples) // 2]
+    failures = []
+    if median > budget_ms:
+        failures.append(f"{target}: median cold start {median:.0f} ms is over the {budget_ms:.0f} ms budget")
+
+    eager = eager_modules(target, env)
+    if eager:
+        failures.append(f"{target}: loaded at startup but should load on first use: {', '.join(eager)}")
+
+    print(f"{target:<8} median {median:>6.0f} ms  (min {samples[0]:.0f}, max {samples[-1]:.0f}, "
+          f"budget {budget_ms:.0f})  {'FAIL' if failures else 'ok'}")
+    return failures
+
+def main():
+    args = parse_args()
+    targets = args.target or list(TARGETS)
+    with tempfile.TemporaryDirectory() as scratch:
+        env = environment(scratch)
+        if not args.check:
+            for target in targets:
+                profile(target, env, args.top)
+            return
+
+        failures = []
+        for target in targets:
+            failures += check(target, env, args.runs, args.budget_ms or BUDGETS_MS[target])
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,45 @@
 from app import create_app, db
-from flask_migrate import Migrate, upgrade
 from flask.cli import FlaskGroup
+import click
 
+# Under the flask CLI, create_app() sets up Flask-Migrate for the `flask db` commands
 app = create_app()
-migrate = Migrate(app, db)
 cli = FlaskGroup(app)
 
+@app.cli.command('generate-outlines')
+@click.option('--status', help='Only responses with this status, e.g. submitted.')
+@click.option('--template-id', help='Only responses to this template.')
+@click.option('--since', type=click.DateTime(), help='Only responses created on or after this date.')
+@click.option('--until', type=click.DateTime(), help='Only responses created before this date.')
+@click.option('--limit', type=int, help='Generate at most this many outlines.')
+@click.option('--concurrency', type=int, default=4, show_default=True, help='Outlines generated at once.')
+@click.option('--batch-size', type=int, default=20, show_default=True, help='Outlines saved per commit.')
+@click.option('--dry-run', is_flag=True, help='Only list the responses that would be processed.')
+def generate_outlines(status, template_id, since, until, limit, concurrency, batch_size, dry_run):
+    """Generate outlines for questionnaire responses that don't have one.
+
+    Safe to re-run after an interruption: responses that already have an
+    outline are skipped.
+    """
+    from services.bulk_outlines import BulkOutlineGenerator, select_responses
+
+    responses = select_responses(status=status, template_id=template_id, since=since, until=until, limit=limit)
+    click.echo(f"{len(responses)} responses without an outline selected")
+    if dry_run:
+        for response in responses:
+            click.echo(response.id)
+        return
+    if not responses:
+        return
+
+    summary = BulkOutlineGenerator(concurrency=concurrency, batch_size=batch_size, echo=click.echo).run(responses)
+    click.echo(
+        f"Generated {summary['generated']} of {summary['selected']} outlines"
+        f" ({summary['failed']} failed) in {summary['elapsed_seconds']}s,"
+        f" {summary['outlines_per_minute']} outlines/minute"
+        + (" - interrupted, run again to continue" if summary['interrupted'] else "")
+    )
+
 if __name__ == '__main__':
     with app.app_context():
         # Create all tables
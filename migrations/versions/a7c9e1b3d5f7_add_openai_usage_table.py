@@ -0,0 +1,48 @@
+"""Add openai_usage table
+
+Revision ID: a7c9e1b3d5f7
+Revises: f6b8d0a2c4e6
+Create Date: 2024-12-02 11:05:27.481920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c9e1b3d5f7'
+down_revision = 'f6b8d0a2c4e6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('openai_usage',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('kind', sa.String(length=10), nullable=False),
+    sa.Column('model', sa.String(length=50), nullable=False),
+    sa.Column('operation', sa.String(length=50), nullable=True),
+    sa.Column('status', sa.String(length=10), nullable=True),
+    sa.Column('prompt_tokens', sa.Integer(), nullable=True),
+    sa.Column('completion_tokens', sa.Integer(), nullable=True),
+    sa.Column('input_chars', sa.Integer(), nullable=True),
+    sa.Column('latency_ms', sa.Float(), nullable=True),
+    sa.Column('retries', sa.Integer(), nullable=True),
+    sa.Column('outline_id', sa.String(length=36), nullable=True),
+    sa.Column('audiobook_id', sa.String(length=36), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('openai_usage', schema=None) as batch_op:
+        batch_op.create_index('ix_openai_usage_outline_id', ['outline_id'], unique=False)
+        batch_op.create_index('ix_openai_usage_audiobook_id', ['audiobook_id'], unique=False)
+        batch_op.create_index('ix_openai_usage_created_at', ['created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('openai_usage', schema=None) as batch_op:
+        batch_op.drop_index('ix_openai_usage_created_at')
+        batch_op.drop_index('ix_openai_usage_audiobook_id')
+        batch_op.drop_index('ix_openai_usage_outline_id')
+
+    op.drop_table('openai_usage')
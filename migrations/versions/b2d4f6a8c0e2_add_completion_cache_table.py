@@ -0,0 +1,39 @@
+"""Add completion cache table
+
+Revision ID: b2d4f6a8c0e2
+Revises: a1c3e5f7b9d1
+Create Date: 2024-11-28 16:41:07.882514
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b2d4f6a8c0e2'
+down_revision = 'a1c3e5f7b9d1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('completion_cache',
+    sa.Column('key', sa.String(length=64), nullable=False),
+    sa.Column('model', sa.String(length=50), nullable=False),
+    sa.Column('content', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.Column('last_used_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('key')
+    )
+    with op.batch_alter_table('completion_cache', schema=None) as batch_op:
+        batch_op.create_index('ix_completion_cache_expires_at', ['expires_at'], unique=False)
+        batch_op.create_index('ix_completion_cache_last_used_at', ['last_used_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('completion_cache', schema=None) as batch_op:
+        batch_op.drop_index('ix_completion_cache_last_used_at')
+        batch_op.drop_index('ix_completion_cache_expires_at')
+
+    op.drop_table('completion_cache')
@@ -0,0 +1,28 @@
+"""Add chapter durations and the single-file book to audiobooks
+
+Revision ID: b8d0f2a4c6e8
+Revises: a7c9e1b3d5f7
+Create Date: 2024-12-06 10:14:52.318207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8d0f2a4c6e8'
+down_revision = 'a7c9e1b3d5f7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('audiobooks', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('chapter_durations', sa.JSON(), nullable=True))
+        batch_op.add_column(sa.Column('book_file', sa.String(length=255), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('audiobooks', schema=None) as batch_op:
+        batch_op.drop_column('book_file')
+        batch_op.drop_column('chapter_durations')
@@ -0,0 +1,31 @@
+"""Add rate limit buckets table
+
+Revision ID: c3e5a7b9d1f3
+Revises: b2d4f6a8c0e2
+Create Date: 2024-11-29 11:06:52.317940
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3e5a7b9d1f3'
+down_revision = 'b2d4f6a8c0e2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('rate_limit_buckets',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('capacity', sa.Float(), nullable=False),
+    sa.Column('tokens', sa.Float(), nullable=False),
+    sa.Column('refill_rate', sa.Float(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('rate_limit_buckets')
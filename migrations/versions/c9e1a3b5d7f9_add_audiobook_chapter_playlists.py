@@ -0,0 +1,26 @@
+"""Add HLS chapter playlists to audiobooks
+
+Revision ID: c9e1a3b5d7f9
+Revises: b8d0f2a4c6e8
+Create Date: 2024-12-09 14:41:08.902716
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c9e1a3b5d7f9'
+down_revision = 'b8d0f2a4c6e8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('audiobooks', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('chapter_playlists', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('audiobooks', schema=None) as batch_op:
+        batch_op.drop_column('chapter_playlists')
@@ -0,0 +1,26 @@
+"""Add chapter hashes to audiobooks
+
+Revision ID: d4f6b8c0e2a4
+Revises: c3e5a7b9d1f3
+Create Date: 2024-11-29 15:27:33.640118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4f6b8c0e2a4'
+down_revision = 'c3e5a7b9d1f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('audiobooks', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('chapter_hashes', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('audiobooks', schema=None) as batch_op:
+        batch_op.drop_column('chapter_hashes')
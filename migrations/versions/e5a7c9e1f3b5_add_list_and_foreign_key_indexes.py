@@ -0,0 +1,40 @@
+"""Add list and foreign key indexes
+
+Revision ID: e5a7c9e1f3b5
+Revises: d4f6b8c0e2a4
+Create Date: 2024-11-30 10:12:08.215734
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a7c9e1f3b5'
+down_revision = 'd4f6b8c0e2a4'
+branch_labels = None
+depends_on = None
+
+# (index name, table, columns)
+INDEXES = [
+    ('ix_questionnaire_responses_template_id', 'questionnaire_responses', ['template_id']),
+    ('ix_book_outlines_questionnaire_id', 'book_outlines', ['questionnaire_id']),
+    ('ix_audiobooks_outline_id', 'audiobooks', ['outline_id']),
+    ('ix_questionnaire_responses_created_at_id', 'questionnaire_responses', ['created_at', 'id']),
+    ('ix_templates_is_active_created_at_id', 'templates', ['is_active', 'created_at', 'id']),
+    ('ix_prompt_templates_is_active_created_at_id', 'prompt_templates', ['is_active', 'created_at', 'id']),
+]
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction; it keeps
+    # the tables writable on Postgres while the indexes are built
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,69 @@
+"""Add summary columns for list pages
+
+Revision ID: f6b8d0a2c4e6
+Revises: e5a7c9e1f3b5
+Create Date: 2024-11-30 16:41:52.903316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f6b8d0a2c4e6'
+down_revision = 'e5a7c9e1f3b5'
+branch_labels = None
+depends_on = None
+
+
+def _count_answers(responses):
+    # Frozen copy of models.count_answers
+    if isinstance(responses, dict):
+        return sum(_count_answers(value) for value in responses.values())
+    return 0 if responses in (None, '', [], {}) else 1
+
+
+def _backfill(table, key, summarize):
+    bind = op.get_bind()
+    rows = bind.execute(sa.select(table.c.id, table.c[key])).all()
+    for row_id, document in rows:
+        bind.execute(table.update().where(table.c.id == row_id).values(**summarize(document)))
+
+
+def upgrade():
+    with op.batch_alter_table('templates', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('section_count', sa.Integer(), nullable=True))
+
+    with op.batch_alter_table('questionnaire_responses', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('answer_count', sa.Integer(), nullable=True))
+
+    with op.batch_alter_table('book_outlines', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('title', sa.String(length=255), nullable=True))
+        batch_op.add_column(sa.Column('chapter_count', sa.Integer(), nullable=True))
+
+    templates = sa.table('templates', sa.column('id', sa.String), sa.column('sections', sa.JSON),
+                         sa.column('section_count', sa.Integer))
+    _backfill(templates, 'sections', lambda sections: {'section_count': len(sections or [])})
+
+    responses = sa.table('questionnaire_responses', sa.column('id', sa.String), sa.column('responses', sa.JSON),
+                         sa.column('answer_count', sa.Integer))
+    _backfill(responses, 'responses', lambda document: {'answer_count': _count_answers(document)})
+
+    outlines = sa.table('book_outlines', sa.column('id', sa.String), sa.column('chapters', sa.JSON),
+                        sa.column('title', sa.String), sa.column('chapter_count', sa.Integer))
+    _backfill(outlines, 'chapters', lambda chapters: {
+        'title': ((chapters or {}).get('title') or '')[:255] or None,
+        'chapter_count': len((chapters or {}).get('chapters') or [])
+    })
+
+
+def downgrade():
+    with op.batch_alter_table('book_outlines', schema=None) as batch_op:
+        batch_op.drop_column('chapter_count')
+        batch_op.drop_column('title')
+
+    with op.batch_alter_table('questionnaire_responses', schema=None) as batch_op:
+        batch_op.drop_column('answer_count')
+
+    with op.batch_alter_table('templates', schema=None) as batch_op:
+        batch_op.drop_column('section_count')
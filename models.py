@@ -2,6 +2,13 @@ from app import db
 from datetime import datetime
 import uuid
 from flask_login import UserMixin
+from sqlalchemy.orm import validates
+
+def count_answers(responses):
+    """Number of non-empty answers in a (possibly nested) responses document."""
+    if isinstance(responses, dict):
+        return sum(count_answers(value) for value in responses.values())
+    return 0 if responses in (None, '', [], {}) else 1
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -20,44 +27,78 @@ class Template(db.Model):
     title = db.Column(db.String(255), nullable=False)
     description = db.Column(db.Text)
     sections = db.Column(db.JSON, nullable=False)
+    section_count = db.Column(db.Integer, default=0)  # kept in sync with sections for list pages
     version = db.Column(db.Integer, default=1)
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     questionnaire_responses = db.relationship('QuestionnaireResponse', backref='template', lazy=True)
+    
+    __table_args__ = (
+        db.Index('ix_templates_is_active_created_at_id', 'is_active', 'created_at', 'id'),
+    )
+    
+    @validates('sections')
+    def _sync_section_count(self, key, sections):
+        self.section_count = len(sections or [])
+        return sections
 
 class QuestionnaireResponse(db.Model):
     __tablename__ = 'questionnaire_responses'
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    template_id = db.Column(db.String(36), db.ForeignKey('templates.id'), nullable=False)
+    template_id = db.Column(db.String(36), db.ForeignKey('templates.id'), nullable=False, index=True)
     responses = db.Column(db.JSON, nullable=False)
+    answer_count = db.Column(db.Integer, default=0)  # kept in sync with responses for list pages
     status = db.Column(db.String(20), default='submitted')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     book_outline = db.relationship('BookOutline', backref='questionnaire', lazy=True, uselist=False)
+    
+    __table_args__ = (
+        db.Index('ix_questionnaire_responses_created_at_id', 'created_at', 'id'),
+    )
+    
+    @validates('responses')
+    def _sync_answer_count(self, key, responses):
+        self.answer_count = count_answers(responses)
+        return responses
 
 class BookOutline(db.Model):
     __tablename__ = 'book_outlines'
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    questionnaire_id = db.Column(db.String(36), db.ForeignKey('questionnaire_responses.id'), nullable=False)
+    questionnaire_id = db.Column(db.String(36), db.ForeignKey('questionnaire_responses.id'), nullable=False, index=True)
     chapters = db.Column(db.JSON, nullable=False)
+    # Kept in sync with chapters for list pages
+    title = db.Column(db.String(255))
+    chapter_count = db.Column(db.Integer, default=0)
     status = db.Column(db.String(20), default='draft')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     audiobook = db.relationship('Audiobook', backref='outline', lazy=True, uselist=False)
+    
+    @validates('chapters')
+    def _sync_summary(self, key, chapters):
+        chapters = chapters or {}
+        self.title = (chapters.get('title') or '')[:255] or None
+        self.chapter_count = len(chapters.get('chapters') or [])
+        return chapters
 
 class Audiobook(db.Model):
     __tablename__ = 'audiobooks'
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    outline_id = db.Column(db.String(36), db.ForeignKey('book_outlines.id'), nullable=False)
+    outline_id = db.Column(db.String(36), db.ForeignKey('book_outlines.id'), nullable=False, index=True)
     chapter_files = db.Column(db.JSON, nullable=False)
+    chapter_hashes = db.Column(db.JSON)  # chapter number -> hash of the outline chapter its audio was made from
     total_duration = db.Column(db.Integer)
+    chapter_durations = db.Column(db.JSON)  # chapter number -> seconds
+    book_file = db.Column(db.String(255))  # all chapters in one MP3 with ID3 chapter markers
+    chapter_playlists = db.Column(db.JSON)  # chapter number -> HLS media playlist, relative to the audiobook's HLS directory
     status = db.Column(db.String(20), default='generating')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -73,4 +114,65 @@ class PromptTemplate(db.Model):
     variables = db.Column(db.JSON)  # Store variable definitions
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
\ No newline at end of file
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_prompt_templates_is_active_created_at_id', 'is_active', 'created_at', 'id'),
+    )
+
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    type = db.Column(db.String(50), nullable=False)
+    resource_id = db.Column(db.String(36), index=True)  # e.g. the audiobook being generated
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    status = db.Column(db.String(20), default='queued')  # 'queued', 'running', 'completed' or 'failed'
+    attempts = db.Column(db.Integer, default=0)
+    max_attempts = db.Column(db.Integer, default=3)
+    locked_by = db.Column(db.String(64))
+    lease_expires_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    completed_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        db.Index('ix_jobs_status_lease_expires_at', 'status', 'lease_expires_at'),
+    )
+
+class CompletionCacheEntry(db.Model):
+    __tablename__ = 'completion_cache'
+    
+    key = db.Column(db.String(64), primary_key=True)  # sha256 of model, messages and sampling parameters
+    model = db.Column(db.String(50), nullable=False)
+    content = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class RateLimitBucket(db.Model):
+    __tablename__ = 'rate_limit_buckets'
+    
+    name = db.Column(db.String(50), primary_key=True)  # e.g. 'chat:requests', 'tts:requests'
+    capacity = db.Column(db.Float, nullable=False)
+    tokens = db.Column(db.Float, nullable=False)
+    refill_rate = db.Column(db.Float, nullable=False)  # tokens per second
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+class OpenAIUsage(db.Model):
+    __tablename__ = 'openai_usage'
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    kind = db.Column(db.String(10), nullable=False)  # 'chat' or 'tts'
+    model = db.Column(db.String(50), nullable=False)
+    operation = db.Column(db.String(50))
+    status = db.Column(db.String(10), default='ok')  # 'ok' or 'error'
+    prompt_tokens = db.Column(db.Integer)
+    completion_tokens = db.Column(db.Integer)
+    input_chars = db.Column(db.Integer)  # TTS input length
+    latency_ms = db.Column(db.Float)
+    retries = db.Column(db.Integer, default=0)
+    outline_id = db.Column(db.String(36), index=True)
+    audiobook_id = db.Column(db.String(36), index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
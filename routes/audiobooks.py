@@ -1,50 +1,248 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for
+from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, current_app, Response, send_file, send_from_directory, abort
 from models import BookOutline, Audiobook, db
-from services.audio_service import AudioService
-from services.ai_service import AIService
+from services.audiobook_service import AudiobookService, hls_dir
+from services.audio_service import AUDIO_DIR, PARTIAL_SUFFIX, chapter_filename
+from services import hls
+from services.query_budget import query_budget
+from services.async_views import async_view, StreamingResponse
+from sqlalchemy.orm import joinedload
+from werkzeug.exceptions import HTTPException
+import asyncio
+import os
+import time
+import uuid
 
 bp = Blueprint('audiobooks', __name__)
 
+LIVE_AUDIO_HEADERS = {
+    'Cache-Control': 'no-store',
+    'Accept-Ranges': 'none',
+    'X-Accel-Buffering': 'no'
+}
+
 @bp.route('/audiobooks/generate/<outline_id>', methods=['POST'])
 def generate_audiobook(outline_id):
     outline = BookOutline.query.get_or_404(outline_id)
-    ai_service = AIService()
-    audio_service = AudioService()
-    
+
     try:
-        audiobook = Audiobook(
-            outline_id=outline_id,
-            chapter_files={},
-            status='generating'
-        )
-        db.session.add(audiobook)
-        db.session.commit()
-        
-        chapter_files = {}
-        for chapter in outline.chapters['chapters']:
-            # Generate detailed chapter content
-            content = ai_service.generate_chapter_content(chapter)
-            
-            # Convert to audio
-            audio_file = audio_service.generate_chapter_audio(
-                content, 
-                chapter['number']
-            )
-            
-            chapter_files[str(chapter['number'])] = audio_file
-        
-        audiobook.chapter_files = chapter_files
-        audiobook.status = 'completed'
-        db.session.commit()
-        
-        flash('Audiobook generated successfully!', 'success')
+        # Generation runs in the background workers; see worker.py
+        audiobook = AudiobookService().start_generation(outline)
+        current_app.logger.info(f"Queued audiobook {audiobook.id} for outline {outline_id}")
+
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return jsonify({
+                'success': True,
+                'message': 'Audiobook generation started.',
+                'audiobook_id': audiobook.id,
+                'status_url': url_for('audiobooks.audiobook_status', audiobook_id=audiobook.id),
+                'redirect_url': url_for('audiobooks.view_audiobook', audiobook_id=audiobook.id)
+            }), 202
+
+        flash('Audiobook generation started. This page will update as chapters finish.', 'info')
         return redirect(url_for('audiobooks.view_audiobook', audiobook_id=audiobook.id))
     except Exception as e:
         db.session.rollback()
+        current_app.logger.error(f"Error queueing audiobook generation: {str(e)}")
         flash(f'Error generating audiobook: {str(e)}', 'error')
         return redirect(url_for('outlines.view_outline', outline_id=outline_id))
 
+def _runs_jobs_in_process():
+    return (request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+            and 'async_job_runner' in current_app.extensions)
+
+@async_view('audiobooks.generate_audiobook', when=_runs_jobs_in_process)
+async def generate_audiobook_async(outline_id):
+    """``generate_audiobook`` for AJAX requests when asgi.py runs the jobs itself.
+
+    The job is queued as usual, then this process's job runner is woken so
+    it claims the job straight away and generates the book on the event
+    loop with the async services.
+    """
+    try:
+        audiobook_id = await asyncio.to_thread(_start_generation, outline_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        await asyncio.to_thread(db.session.rollback)
+        current_app.logger.error(f"Error queueing audiobook generation: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f'Error generating audiobook: {str(e)}'
+        }), 500
+    current_app.extensions['async_job_runner'].wake()
+    current_app.logger.info(f"Queued audiobook {audiobook_id} for outline {outline_id}")
+    return jsonify({
+        'success': True,
+        'message': 'Audiobook generation started.',
+        'audiobook_id': audiobook_id,
+        'status_url': url_for('audiobooks.audiobook_status', audiobook_id=audiobook_id),
+        'redirect_url': url_for('audiobooks.view_audiobook', audiobook_id=audiobook_id)
+    }), 202
+
+def _start_generation(outline_id):
+    outline = BookOutline.query.get_or_404(outline_id)
+    audiobook_id = AudiobookService().start_generation(outline).id
+    # Ends the transaction so the response doesn't hold a pooled connection
+    db.session.rollback()
+    return audiobook_id
+
 @bp.route('/audiobooks/<audiobook_id>')
+@query_budget(3)
 def view_audiobook(audiobook_id):
-    audiobook = Audiobook.query.get_or_404(audiobook_id)
+    audiobook = Audiobook.query.options(joinedload(Audiobook.outline)).get_or_404(audiobook_id)
     return render_template('audiobooks/view.html', audiobook=audiobook)
+
+@bp.route('/audiobooks/<audiobook_id>/status')
+@query_budget(3)
+def audiobook_status(audiobook_id):
+    audiobook = Audiobook.query.options(joinedload(Audiobook.outline)).get_or_404(audiobook_id)
+    return jsonify(AudiobookService().status(audiobook))
+
+@bp.route('/audiobooks/<audiobook_id>/chapters/<int:chapter_number>/audio')
+def chapter_audio(audiobook_id, chapter_number):
+    """Serve a chapter's audio, following it live while it is being synthesized.
+
+    Finished files get Range/206 responses, ETags and sendfile through
+    ``send_file``. A chapter that is still being synthesized is streamed
+    from its growing .partial file until synthesis completes.
+    """
+    audiobook = Audiobook.query.get_or_404(audiobook_id)
+    filename = (audiobook.chapter_files or {}).get(str(chapter_number)) or chapter_filename(chapter_number, audiobook.id)
+    audio_path = os.path.abspath(os.path.join(AUDIO_DIR, filename))
+
+    if os.path.exists(audio_path):
+        response = send_file(audio_path, mimetype='audio/mpeg', conditional=True, etag=True)
+        # Regenerating a chapter replaces the file at this URL, so caches must revalidate against the ETag
+        response.cache_control.public = True
+        response.cache_control.no_cache = True
+        response.cache_control.max_age = None
+        return response
+
+    partial_path = audio_path + PARTIAL_SUFFIX
+    try:
+        partial = open(partial_path, 'rb')
+    except FileNotFoundError:
+        return jsonify({
+            'success': False,
+            'message': 'Chapter audio is not available yet.'
+        }), 404
+
+    current_app.logger.info(f"Streaming chapter {chapter_number} of audiobook {audiobook_id} while it is synthesized")
+    idle_timeout = current_app.config['AUDIO_STREAM_IDLE_TIMEOUT']
+    return Response(_follow(partial, partial_path, idle_timeout), mimetype='audio/mpeg', headers=LIVE_AUDIO_HEADERS)
+
+@bp.route('/audiobooks/<audiobook_id>/book.mp3')
+def book_audio(audiobook_id):
+    """The whole audiobook as one MP3 with ID3 chapter markers."""
+    audiobook = Audiobook.query.options(joinedload(Audiobook.outline)).get_or_404(audiobook_id)
+    if not audiobook.book_file or not os.path.exists(os.path.join(AUDIO_DIR, audiobook.book_file)):
+        return jsonify({
+            'success': False,
+            'message': 'The audiobook file is not available yet.'
+        }), 404
+    title = audiobook.outline.title or 'audiobook'
+    response = send_file(os.path.abspath(os.path.join(AUDIO_DIR, audiobook.book_file)), mimetype='audio/mpeg',
+                         conditional=True, etag=True, download_name=f"{title}.mp3")
+    # Rebuilt in place when chapters are regenerated, like the chapter files
+    response.cache_control.public = True
+    response.cache_control.no_cache = True
+    response.cache_control.max_age = None
+    return response
+
+@bp.route('/audiobooks/<audiobook_id>/hls/<path:filename>')
+def hls_file(audiobook_id, filename):
+    """HLS playlists and segments.
+
+    Segments and chapter playlists live in directories named after their
+    content, so they are cached forever. The book and master playlists
+    change when chapters are regenerated and are revalidated instead.
+    """
+    try:
+        uuid.UUID(audiobook_id)
+    except ValueError:
+        abort(404)
+    mimetype = 'application/vnd.apple.mpegurl' if filename.endswith('.m3u8') else 'audio/mpeg'
+    # Without a max_age the response is sent with no-cache
+    max_age = None if filename in hls.MUTABLE_FILES else 31536000
+    response = send_from_directory(os.path.abspath(hls_dir(audiobook_id)), filename, mimetype=mimetype,
+                                   conditional=True, etag=True, max_age=max_age)
+    if max_age:
+        response.cache_control.immutable = True
+    return response
+
+def _synthesizing():
+    path = os.path.join(AUDIO_DIR, chapter_filename(request.view_args['chapter_number'], request.view_args['audiobook_id']))
+    return not os.path.exists(path) and os.path.exists(path + PARTIAL_SUFFIX)
+
+@async_view('audiobooks.chapter_audio', when=_synthesizing)
+async def chapter_audio_live(audiobook_id, chapter_number):
+    """Follow a chapter that is being synthesized when served by asgi.py.
+
+    Waiting for the file to grow is an ``asyncio.sleep`` rather than a
+    thread blocked in ``time.sleep``. Finished chapters go to the sync view.
+    """
+    await asyncio.to_thread(_find_audiobook, audiobook_id)
+    partial_path = os.path.abspath(os.path.join(AUDIO_DIR, chapter_filename(chapter_number, audiobook_id))) + PARTIAL_SUFFIX
+    try:
+        partial = open(partial_path, 'rb')
+    except FileNotFoundError:
+        return jsonify({
+            'success': False,
+            'message': 'Chapter audio is not available yet.'
+        }), 404
+
+    current_app.logger.info(f"Streaming chapter {chapter_number} of audiobook {audiobook_id} while it is synthesized")
+    idle_timeout = current_app.config['AUDIO_STREAM_IDLE_TIMEOUT']
+    return StreamingResponse(_follow_async(partial, partial_path, idle_timeout), mimetype='audio/mpeg',
+                             headers=LIVE_AUDIO_HEADERS)
+
+def _follow(partial, partial_path, idle_timeout, chunk_size=64 * 1024, poll_interval=0.25):
+    """Yield bytes from a file that another process is still writing.
+
+    The writer renames the .partial file into place when it is done (or
+    removes it on failure), and the open handle keeps reading the same file
+    either way. Streaming stops once the .partial name is gone and the
+    handle is drained, or when the file stops growing for ``idle_timeout``
+    seconds.
+    """
+    with partial:
+        idle_since = time.monotonic()
+        while True:
+            chunk = partial.read(chunk_size)
+            if chunk:
+                idle_since = time.monotonic()
+                yield chunk
+                continue
+            if not os.path.exists(partial_path):
+                # Drain anything written between the last read and the rename
+                rest = partial.read()
+                if rest:
+                    yield rest
+                return
+            if time.monotonic() - idle_since > idle_timeout:
+                return
+            time.sleep(poll_interval)
+
+def _find_audiobook(audiobook_id):
+    # Ends the transaction so the stream doesn't hold a pooled connection
+    Audiobook.query.get_or_404(audiobook_id)
+    db.session.rollback()
+
+async def _follow_async(partial, partial_path, idle_timeout, chunk_size=64 * 1024, poll_interval=0.25):
+    """``_follow`` for async views."""
+    with partial:
+        idle_since = time.monotonic()
+        while True:
+            chunk = partial.read(chunk_size)
+            if chunk:
+                idle_since = time.monotonic()
+                yield chunk
+                continue
+            if not os.path.exists(partial_path):
+                rest = partial.read()
+                if rest:
+                    yield rest
+                return
+            if time.monotonic() - idle_since > idle_timeout:
+                return
+            await asyncio.sleep(poll_interval)
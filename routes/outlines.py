@@ -1,29 +1,36 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, current_app
+from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, current_app, Response, stream_with_context
 from models import QuestionnaireResponse, BookOutline, db
-from services.ai_service import AIService
+from services.async_views import async_view, StreamingResponse
+from services.query_budget import query_budget
+from services import usage_ledger
 from flask_wtf.csrf import validate_csrf, ValidationError
+from sqlalchemy.orm import joinedload
+import asyncio
+import json
+import uuid
 
 bp = Blueprint('outlines', __name__)
 
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no'
+}
+
 @bp.route('/outlines/generate/<response_id>', methods=['POST'])
 def generate_outline(response_id):
-    # Validate CSRF token
-    try:
-        if request.is_json:
-            validate_csrf(request.headers.get('X-CSRFToken'))
-        else:
-            validate_csrf(request.form.get('csrf_token'))
-    except ValidationError:
-        current_app.logger.error("CSRF validation failed for outline generation")
-        if request.is_json:
-            return jsonify({
-                'success': False,
-                'message': 'Invalid CSRF token'
-            }), 400
-        flash('Invalid CSRF token', 'error')
-        return redirect(url_for('questionnaires.view_response', response_id=response_id))
+    csrf_error = _check_csrf(response_id)
+    if csrf_error is not None:
+        return csrf_error
     response = QuestionnaireResponse.query.get_or_404(response_id)
+    
+    if request.accept_mimetypes.best == 'text/event-stream':
+        return _stream_outline(response)
+    
+    # openai is loaded on first use rather than at startup
+    from services.ai_service import AIService
     ai_service = AIService()
+    # The id is chosen up front so the OpenAI usage ledger can attribute the calls to the outline
+    outline_id = str(uuid.uuid4())
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         # Handle AJAX request
@@ -34,10 +41,12 @@ def generate_outline(response_id):
             response.status = 'processing'
             db.session.commit()
             
-            outline_data = ai_service.generate_outline(response.responses)
+            with usage_ledger.owner(outline_id=outline_id):
+                outline_data = ai_service.generate_outline(response.responses)
             current_app.logger.info(f"AI outline generation completed for response {response_id}")
             
             outline = BookOutline(
+                id=outline_id,
                 questionnaire_id=response_id,
                 chapters=outline_data,
                 status='draft'
@@ -71,9 +80,11 @@ def generate_outline(response_id):
     # Handle regular POST request
     try:
         current_app.logger.info(f"Starting outline generation for response {response_id}")
-        outline_data = ai_service.generate_outline(response.responses)
+        with usage_ledger.owner(outline_id=outline_id):
+            outline_data = ai_service.generate_outline(response.responses)
         
         outline = BookOutline(
+            id=outline_id,
             questionnaire_id=response_id,
             chapters=outline_data,
             status='draft'
@@ -91,7 +102,189 @@ def generate_outline(response_id):
         flash('Error generating outline. Please try again.', 'error')
         return redirect(url_for('questionnaires.view_response', response_id=response_id))
 
+def _check_csrf(response_id):
+    """Return an error response if the request's CSRF token is invalid."""
+    try:
+        if request.is_json:
+            validate_csrf(request.headers.get('X-CSRFToken'))
+        else:
+            validate_csrf(request.form.get('csrf_token'))
+    except ValidationError:
+        current_app.logger.error("CSRF validation failed for outline generation")
+        if request.is_json:
+            return jsonify({
+                'success': False,
+                'message': 'Invalid CSRF token'
+            }), 400
+        flash('Invalid CSRF token', 'error')
+        return redirect(url_for('questionnaires.view_response', response_id=response_id))
+    return None
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _stream_outline(response):
+    """Stream outline generation to the browser as Server-Sent Events.
+
+    Emits ``title`` and ``chapter`` events as the model writes them, then
+    ``done`` with the saved outline's URL, or ``error``.
+    """
+    response_id = response.id
+
+    def generate():
+        try:
+            current_app.logger.info(f"Starting streamed outline generation for response {response_id}")
+            from services.ai_service import AIService
+            ai_service = AIService()
+            
+            questionnaire = db.session.get(QuestionnaireResponse, response_id)
+            questionnaire.status = 'processing'
+            db.session.commit()
+            
+            outline_id = str(uuid.uuid4())
+            outline_data = None
+            with usage_ledger.owner(outline_id=outline_id):
+                for event, data in ai_service.stream_outline(questionnaire.responses):
+                    if event == 'outline':
+                        outline_data = data
+                    else:
+                        yield _sse(event, data)
+            current_app.logger.info(f"AI outline streaming completed for response {response_id}")
+            
+            outline = BookOutline(
+                id=outline_id,
+                questionnaire_id=response_id,
+                chapters=outline_data,
+                status='draft'
+            )
+            db.session.add(outline)
+            db.session.commit()
+            current_app.logger.info(f"Outline saved to database with id {outline.id}")
+            
+            yield _sse('done', {
+                'message': 'Outline generated successfully!',
+                'redirect_url': url_for('outlines.view_outline', outline_id=outline.id)
+            })
+        except ValueError as e:
+            db.session.rollback()
+            current_app.logger.error(f"Validation error during outline generation: {str(e)}")
+            yield _sse('error', {'message': str(e)})
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Error streaming outline: {str(e)}")
+            yield _sse('error', {'message': 'An error occurred while generating the outline. Please try again.'})
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+def _generates_async():
+    return (request.accept_mimetypes.best == 'text/event-stream'
+            or request.headers.get('X-Requested-With') == 'XMLHttpRequest')
+
+@async_view('outlines.generate_outline', when=_generates_async)
+async def generate_outline_async(response_id):
+    """``generate_outline`` for streamed and AJAX requests when served by asgi.py.
+
+    The OpenAI call is awaited on the event loop and database work runs in
+    a worker thread, so a slow completion doesn't hold a thread. Plain form
+    posts still go to the sync view.
+    """
+    csrf_error = _check_csrf(response_id)
+    if csrf_error is not None:
+        return csrf_error
+    await asyncio.to_thread(_find_response, response_id)
+
+    if request.accept_mimetypes.best == 'text/event-stream':
+        return StreamingResponse(_stream_outline_async(response_id), mimetype='text/event-stream',
+                                 headers=SSE_HEADERS)
+
+    outline_id = str(uuid.uuid4())
+    try:
+        current_app.logger.info(f"Starting outline generation for response {response_id}")
+        from services.async_ai_service import AsyncAIService
+        ai_service = await AsyncAIService.create()
+        responses = await asyncio.to_thread(_start_processing, response_id)
+        with usage_ledger.owner(outline_id=outline_id):
+            outline_data = await ai_service.generate_outline(responses)
+        current_app.logger.info(f"AI outline generation completed for response {response_id}")
+        await asyncio.to_thread(_save_outline, outline_id, response_id, outline_data)
+
+        return jsonify({
+            'success': True,
+            'message': 'Outline generated successfully!',
+            'redirect_url': url_for('outlines.view_outline', outline_id=outline_id)
+        })
+    except ValueError as e:
+        await asyncio.to_thread(db.session.rollback)
+        current_app.logger.error(f"Validation error during outline generation: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        await asyncio.to_thread(db.session.rollback)
+        current_app.logger.error(f"Error generating outline: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'An error occurred while generating the outline. Please try again.'
+        }), 500
+
+async def _stream_outline_async(response_id):
+    try:
+        current_app.logger.info(f"Starting streamed outline generation for response {response_id}")
+        from services.async_ai_service import AsyncAIService
+        ai_service = await AsyncAIService.create()
+        responses = await asyncio.to_thread(_start_processing, response_id)
+
+        outline_id = str(uuid.uuid4())
+        outline_data = None
+        with usage_ledger.owner(outline_id=outline_id):
+            async for event, data in ai_service.stream_outline(responses):
+                if event == 'outline':
+                    outline_data = data
+                else:
+                    yield _sse(event, data)
+        current_app.logger.info(f"AI outline streaming completed for response {response_id}")
+        await asyncio.to_thread(_save_outline, outline_id, response_id, outline_data)
+
+        yield _sse('done', {
+            'message': 'Outline generated successfully!',
+            'redirect_url': url_for('outlines.view_outline', outline_id=outline_id)
+        })
+    except ValueError as e:
+        await asyncio.to_thread(db.session.rollback)
+        current_app.logger.error(f"Validation error during outline generation: {str(e)}")
+        yield _sse('error', {'message': str(e)})
+    except Exception as e:
+        await asyncio.to_thread(db.session.rollback)
+        current_app.logger.error(f"Error streaming outline: {str(e)}")
+        yield _sse('error', {'message': 'An error occurred while generating the outline. Please try again.'})
+
+# These run in a worker thread and end their transaction, so no pooled
+# connection is held while a request waits on OpenAI
+
+def _find_response(response_id):
+    QuestionnaireResponse.query.get_or_404(response_id)
+    db.session.rollback()
+
+def _start_processing(response_id):
+    response = db.session.get(QuestionnaireResponse, response_id)
+    response.status = 'processing'
+    responses = response.responses
+    db.session.commit()
+    return responses
+
+def _save_outline(outline_id, response_id, outline_data):
+    db.session.add(BookOutline(
+        id=outline_id,
+        questionnaire_id=response_id,
+        chapters=outline_data,
+        status='draft'
+    ))
+    db.session.commit()
+    current_app.logger.info(f"Outline saved to database with id {outline_id}")
+
 @bp.route('/outlines/<outline_id>')
+@query_budget(3)
 def view_outline(outline_id):
-    outline = BookOutline.query.get_or_404(outline_id)
+    outline = BookOutline.query.options(joinedload(BookOutline.audiobook)).get_or_404(outline_id)
     return render_template('outlines/view.html', outline=outline)
@@ -1,14 +1,26 @@
 from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, current_app
 from models import PromptTemplate, db
 from flask_wtf.csrf import validate_csrf, ValidationError
+from services.pagination import paginate
+from services.query_budget import query_budget
+from services import prompt_templates
+from services.prompt_templates import PromptTemplateError
 
 bp = Blueprint('prompts', __name__)
 
 @bp.route('/prompts')
+@query_budget(4)
 def list_prompts():
-    prompts = PromptTemplate.query.filter_by(is_active=True).all()
+    cursor = request.args.get('cursor')
+    page = paginate(
+        PromptTemplate.query.filter_by(is_active=True),
+        PromptTemplate,
+        cursor=cursor,
+        per_page=request.args.get('per_page', type=int)
+    )
+    prompts = page.items
     
-    if not prompts:
+    if not prompts and not cursor:
         # Create default prompt template
         default_prompt = PromptTemplate(
             name="Default Book Outline Generator",
@@ -43,15 +55,17 @@ Ensure each chapter is substantial enough for audio content but not too long for
         )
         db.session.add(default_prompt)
         db.session.commit()
+        prompt_templates.invalidate()
         prompts = [default_prompt]
         
-    return render_template('prompts/list.html', prompts=prompts)
+    return render_template('prompts/list.html', prompts=prompts, next_cursor=page.next_cursor)
 
 @bp.route('/prompts/create', methods=['GET', 'POST'])
 def create_prompt():
     if request.method == 'POST':
         try:
             data = request.get_json()
+            prompt_templates.validate(data['type'], data['template_content'], data.get('variables', {}))
             prompt = PromptTemplate(
                 name=data['name'],
                 description=data['description'],
@@ -61,12 +75,18 @@ def create_prompt():
             )
             db.session.add(prompt)
             db.session.commit()
+            prompt_templates.invalidate()
             
             return jsonify({
                 'success': True,
                 'message': 'Prompt template created successfully!',
                 'redirect_url': url_for('prompts.view_prompt', prompt_id=prompt.id)
             })
+        except PromptTemplateError as e:
+            return jsonify({
+                'success': False,
+                'message': str(e)
+            }), 400
         except Exception as e:
             current_app.logger.error(f"Error creating prompt template: {str(e)}")
             return jsonify({
@@ -88,6 +108,7 @@ def edit_prompt(prompt_id):
     if request.method == 'POST':
         try:
             data = request.get_json()
+            prompt_templates.validate(data['type'], data['template_content'], data.get('variables', {}))
             prompt.name = data['name']
             prompt.description = data['description']
             prompt.type = data['type']
@@ -95,11 +116,17 @@ def edit_prompt(prompt_id):
             prompt.variables = data.get('variables', {})
             
             db.session.commit()
+            prompt_templates.invalidate(prompt.id)
             return jsonify({
                 'success': True,
                 'message': 'Prompt template updated successfully!',
                 'redirect_url': url_for('prompts.view_prompt', prompt_id=prompt.id)
             })
+        except PromptTemplateError as e:
+            return jsonify({
+                'success': False,
+                'message': str(e)
+            }), 400
         except Exception as e:
             current_app.logger.error(f"Error updating prompt template: {str(e)}")
             return jsonify({
@@ -124,6 +151,7 @@ def delete_prompt(prompt_id):
         prompt = PromptTemplate.query.get_or_404(prompt_id)
         prompt.is_active = False  # Soft delete
         db.session.commit()
+        prompt_templates.invalidate(prompt.id)
         
         return jsonify({
             'success': True,
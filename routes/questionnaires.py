@@ -1,16 +1,28 @@
 from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, current_app
 from models import QuestionnaireResponse, Template, db
 from flask_wtf.csrf import validate_csrf, ValidationError
+from services.pagination import paginate
+from services.query_budget import query_budget
+from sqlalchemy.orm import joinedload, load_only
 import traceback
 
 bp = Blueprint('questionnaires', __name__)
 
 @bp.route('/questionnaires/list')
+@query_budget(3)
 def list_responses():
-    responses = QuestionnaireResponse.query.filter(
-        QuestionnaireResponse.status != 'deleted'
-    ).order_by(QuestionnaireResponse.created_at.desc()).all()
-    return render_template('questionnaires/list.html', responses=responses)
+    page = paginate(
+        # The list never touches the responses or sections documents
+        QuestionnaireResponse.query.options(
+            load_only(QuestionnaireResponse.id, QuestionnaireResponse.template_id, QuestionnaireResponse.status,
+                      QuestionnaireResponse.answer_count, QuestionnaireResponse.created_at),
+            joinedload(QuestionnaireResponse.template).load_only(Template.id, Template.title)
+        ).filter(QuestionnaireResponse.status != 'deleted'),
+        QuestionnaireResponse,
+        cursor=request.args.get('cursor'),
+        per_page=request.args.get('per_page', type=int)
+    )
+    return render_template('questionnaires/list.html', responses=page.items, next_cursor=page.next_cursor)
 
 @bp.route('/questionnaires/respond/<template_id>', methods=['GET', 'POST'])
 def respond(template_id):
@@ -80,9 +92,12 @@ def respond(template_id):
     return render_template('questionnaires/respond.html', template=template)
 
 @bp.route('/questionnaires/response/<response_id>')
+@query_budget(3)
 def view_response(response_id):
     try:
-        response = QuestionnaireResponse.query.get_or_404(response_id)
+        response = QuestionnaireResponse.query.options(
+            joinedload(QuestionnaireResponse.template)
+        ).get_or_404(response_id)
         return render_template('questionnaires/view.html', response=response)
     except Exception as e:
         current_app.logger.error(f"Error viewing response {response_id}: {str(e)}")
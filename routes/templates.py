@@ -1,13 +1,22 @@
 from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, current_app
 from models import Template, db
 from flask_wtf.csrf import validate_csrf, ValidationError
+from services.pagination import paginate
+from services.query_budget import query_budget
+from sqlalchemy.orm import defer
 
 bp = Blueprint('templates', __name__)
 
 @bp.route('/templates')
+@query_budget(2)
 def list_templates():
-    templates = Template.query.filter_by(is_active=True).all()
-    return render_template('templates/list.html', templates=templates)
+    page = paginate(
+        Template.query.options(defer(Template.sections)).filter_by(is_active=True),
+        Template,
+        cursor=request.args.get('cursor'),
+        per_page=request.args.get('per_page', type=int)
+    )
+    return render_template('templates/list.html', templates=page.items, next_cursor=page.next_cursor)
 
 @bp.route('/templates/create', methods=['GET', 'POST'])
 def create_template():
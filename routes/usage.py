@@ -0,0 +1,14 @@
+from flask import Blueprint, render_template, request, jsonify
+from services import usage_ledger
+from services.query_budget import query_budget
+
+bp = Blueprint('usage', __name__)
+
+@bp.route('/usage')
+@query_budget(3)
+def usage_summary():
+    days = max(1, min(request.args.get('days', 30, type=int), 365))
+    summary = usage_ledger.summary(days)
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(summary)
+    return render_template('usage/summary.html', summary=summary)
@@ -1,31 +1,38 @@
 import openai
 from flask import current_app
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
 import json
 import time
-from tenacity import retry, stop_after_attempt, wait_exponential
 from openai import RateLimitError, APIError
+from services.completion_cache import CompletionCache
+from services import openai_client
+from services.openai_client import openai_retry
+from services.rate_limiter import RateLimiter, estimate_tokens
+from services.outline_stream import OutlineStreamParser
+from services.metrics import instrument
+from services import usage_ledger
+from services import prompt_templates
+from services.prompt_templates import PromptTemplateError
+from services import prompt_builder
 
 class AIService:
     def __init__(self):
-        self.client = openai.OpenAI(
-            api_key=current_app.config['OPENAI_API_KEY']
-        )
+        self.client = openai_client.get_client()
         self.max_retries = 3
         self.base_wait = 1
+        self.cache = CompletionCache() if current_app.config['LLM_CACHE_ENABLED'] else None
+        self.rate_limiter = RateLimiter()
         self._verify_api_key()
 
     def _verify_api_key(self):
-        """Verify that the OpenAI API key is valid and working."""
+        """Verify that the OpenAI API key is valid and working.
+
+        The result is cached per process, so this only reaches the API once
+        per ``OPENAI_VERIFY_TTL_SECONDS``.
+        """
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "Verify API connection"},
-                    {"role": "user", "content": "Test"}
-                ],
-                max_tokens=5
-            )
-            current_app.logger.info("OpenAI API key verification successful")
+            openai_client.verify_api_key()
         except openai.AuthenticationError as e:
             current_app.logger.error(f"OpenAI API authentication failed: {str(e)}")
             raise ValueError("Invalid API key. Please check your OpenAI API key configuration.")
@@ -36,26 +43,18 @@ class AIService:
             current_app.logger.error(f"OpenAI API key verification failed: {str(e)}")
             raise ValueError("Failed to verify OpenAI API key. Please check your configuration.")
     
-    @retry(stop=stop_after_attempt(3), 
-           wait=wait_exponential(multiplier=1, min=4, max=10),
-           retry=lambda e: isinstance(e, (RateLimitError, APIError)))
-    def generate_outline(self, questionnaire_responses):
+    @instrument('llm', 'generate_outline')
+    @openai_retry
+    def generate_outline(self, questionnaire_responses, use_cache=True):
         try:
-            prompt = self._create_outline_prompt(questionnaire_responses)
             current_app.logger.info("Generating outline with OpenAI")
             
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are an expert book outline creator specializing in creating well-structured, engaging book outlines. Focus on maintaining narrative flow and ensuring each chapter builds upon previous ones."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                presence_penalty=0.3,
-                frequency_penalty=0.3
+            outline = self._complete(
+                **self._outline_request(questionnaire_responses),
+                use_cache=use_cache,
+                parse=json.loads,
+                operation='outline'
             )
-            
-            outline = json.loads(response.choices[0].message.content)
             current_app.logger.info("Successfully generated outline")
             return outline
             
@@ -72,27 +71,106 @@ class AIService:
             current_app.logger.error(f"AI Outline Generation Error: {str(e)}")
             raise
     
-    @retry(stop=stop_after_attempt(3), 
-           wait=wait_exponential(multiplier=1, min=4, max=10),
-           retry=lambda e: isinstance(e, (RateLimitError, APIError)))
-    def generate_chapter_content(self, outline_chapter):
+    @instrument('llm', 'stream_outline')
+    def stream_outline(self, questionnaire_responses, use_cache=True):
+        """Generate an outline with a streamed completion.
+
+        Yields ``('title', str)`` and ``('chapter', dict)`` events as soon as
+        each part of the outline is complete, then ``('outline', dict)`` with
+        the whole parsed outline.
+        """
+        request = self._outline_request(questionnaire_responses)
+        cache = self.cache if use_cache else None
+        key = CompletionCache.key(**request) if cache else None
+        parser = OutlineStreamParser()
+
+        cached = cache.get(key) if cache else None
+        if cached is not None:
+            current_app.logger.info("Completion cache hit for streamed outline")
+            yield from parser.feed(cached)
+            yield ('outline', parser.result())
+            return
+
+        current_app.logger.info("Streaming outline from OpenAI")
+        raw = None
+        usage = None
+        completed = False
+        try:
+            raw, started = self._open_stream(**request)
+            for chunk in raw.parse():
+                if chunk.usage:
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield from parser.feed(delta)
+            completed = True
+            outline = parser.result()
+        except json.JSONDecodeError as e:
+            current_app.logger.error(f"Invalid JSON in streamed response: {str(e)}")
+            raise ValueError("Failed to parse AI response")
+        except RateLimitError as e:
+            current_app.logger.warning(f"Rate limit hit while streaming outline: {str(e)}")
+            raise
+        except APIError as e:
+            current_app.logger.error(f"OpenAI API Error while streaming outline: {str(e)}")
+            raise
+        finally:
+            # Streams that fail to open are recorded by _open_stream
+            if raw is not None:
+                usage_ledger.record(
+                    'chat', request['model'], 'outline_stream',
+                    time.monotonic() - started,
+                    status='ok' if completed else 'error',
+                    prompt_tokens=usage.prompt_tokens if usage else None,
+                    completion_tokens=usage.completion_tokens if usage else None,
+                    retries_taken=raw.retries_taken
+                )
+
+        if cache:
+            cache.set(key, request['model'], json.dumps(outline))
+        current_app.logger.info("Successfully streamed outline")
+        yield ('outline', outline)
+
+    @openai_retry
+    def _open_stream(self, model, messages, **params):
+        """Open a streamed completion; returns the raw response and when it was requested."""
+        # Only opening the stream is retried; a stream that fails midway is not replayed
+        self.rate_limiter.acquire('chat', estimate_tokens(messages, params.get('max_tokens')))
+        started = time.monotonic()
+        try:
+            raw = self.client.chat.completions.with_raw_response.create(
+                model=model,
+                messages=messages,
+                stream=True,
+                stream_options={'include_usage': True},
+                **params
+            )
+        except Exception as e:
+            usage_ledger.record('chat', model, 'outline_stream', time.monotonic() - started, status='error')
+            if isinstance(e, RateLimitError):
+                self.rate_limiter.penalize('chat', e.response.headers)
+            raise
+        self.rate_limiter.observe('chat', raw.headers)
+        return raw, started
+
+    @instrument('llm', 'generate_chapter_content')
+    def generate_chapter_content(self, outline_chapter, use_cache=True):
+        if self._writes_in_sections(outline_chapter):
+            return self._generate_chapter_in_sections(outline_chapter, use_cache)
+        return self._generate_chapter(outline_chapter, use_cache)
+
+    @openai_retry
+    def _generate_chapter(self, outline_chapter, use_cache=True):
         try:
-            prompt = self._create_chapter_prompt(outline_chapter)
             current_app.logger.info(f"Generating content for chapter {outline_chapter.get('number', 'unknown')}")
             
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are an expert book writer with a talent for creating engaging, flowing narrative content that maintains consistency and readability while being suitable for audio format."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                presence_penalty=0.3,
-                frequency_penalty=0.3,
-                max_tokens=2000
+            content = self._complete(
+                **self._chapter_request(outline_chapter),
+                use_cache=use_cache,
+                operation='chapter'
             )
-            
-            content = response.choices[0].message.content
             current_app.logger.info(f"Successfully generated chapter {outline_chapter.get('number', 'unknown')} content")
             return content
             
@@ -105,11 +183,189 @@ class AIService:
         except Exception as e:
             current_app.logger.error(f"AI Chapter Generation Error: {str(e)}")
             raise
+
+    def _writes_in_sections(self, outline_chapter):
+        return current_app.config['CHAPTER_SECTIONS_ENABLED'] and len(self._plan_sections(outline_chapter)) > 1
+
+    def _plan_sections(self, outline_chapter):
+        # One section per key point, in outline order
+        return [point for point in outline_chapter.get('key_points', []) if point]
+
+    def _generate_chapter_in_sections(self, outline_chapter, use_cache=True):
+        """Write each section of a chapter concurrently, then join them with transitions.
+
+        Every section is written with the chapter summary and the titles of
+        the sections around it. Once all sections are done, the transitions
+        between them are written concurrently as well, so a chapter takes
+        about as long as its slowest section plus one short transition.
+        """
+        number = outline_chapter.get('number', 'unknown')
+        titles = self._plan_sections(outline_chapter)
+        current_app.logger.info(f"Generating chapter {number} in {len(titles)} sections")
+        started = time.monotonic()
+        app = current_app._get_current_object()
+
+        def in_context(func, *args):
+            with app.app_context():
+                return func(*args)
+
+        def run_all(pool, calls):
+            futures = [pool.submit(contextvars.copy_context().run, in_context, *call) for call in calls]
+            try:
+                return [future.result() for future in futures]
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+
+        try:
+            with ThreadPoolExecutor(max_workers=current_app.config['CHAPTER_SECTION_CONCURRENCY'],
+                                    thread_name_prefix='chapter-section') as pool:
+                sections = run_all(pool, [
+                    (self._generate_section, outline_chapter, titles, index, use_cache)
+                    for index in range(len(titles))
+                ])
+                transitions = run_all(pool, [
+                    (self._generate_transition, outline_chapter, titles, index, sections, use_cache)
+                    for index in range(len(titles) - 1)
+                ])
+        except Exception as e:
+            current_app.logger.error(f"AI Chapter Generation Error: {str(e)}")
+            raise
+
+        current_app.logger.info(f"Successfully generated chapter {number} content from {len(titles)} sections "
+                                f"in {time.monotonic() - started:.1f}s")
+        return self._join_sections(sections, transitions)
+
+    @openai_retry
+    def _generate_section(self, outline_chapter, titles, index, use_cache=True):
+        return self._complete(**self._section_request(outline_chapter, titles, index),
+                              use_cache=use_cache, operation='chapter_section')
+
+    @openai_retry
+    def _generate_transition(self, outline_chapter, titles, index, sections, use_cache=True):
+        return self._complete(**self._transition_request(outline_chapter, titles, index, sections),
+                              use_cache=use_cache, operation='chapter_transition')
+
+    def _join_sections(self, sections, transitions):
+        parts = [sections[0].strip()]
+        for transition, section in zip(transitions, sections[1:]):
+            parts.append(transition.strip())
+            parts.append(section.strip())
+        return '\n\n'.join(parts)
     
-    def _create_outline_prompt(self, responses):
+    def _complete(self, model, messages, use_cache=True, parse=None, operation='completion', **params):
+        """Run a chat completion, consulting the completion cache if enabled.
+
+        ``parse`` is applied to the returned content, and only content that
+        parses is cached. ``operation`` labels the call in the usage ledger.
+        """
+        cache = self.cache if use_cache else None
+        key = CompletionCache.key(model, messages, **params) if cache else None
+        if cache:
+            content = cache.get(key)
+            if content is not None:
+                current_app.logger.info("Completion cache hit")
+                return parse(content) if parse else content
+
+        estimated_tokens = estimate_tokens(messages, params.get('max_tokens'))
+        self.rate_limiter.acquire('chat', estimated_tokens)
+        started = time.monotonic()
+        try:
+            raw = self.client.chat.completions.with_raw_response.create(
+                model=model,
+                messages=messages,
+                **params
+            )
+        except Exception as e:
+            usage_ledger.record('chat', model, operation, time.monotonic() - started, status='error')
+            if isinstance(e, RateLimitError):
+                self.rate_limiter.penalize('chat', e.response.headers)
+            raise
+        self.rate_limiter.observe('chat', raw.headers)
+        response = raw.parse()
+        usage_ledger.record(
+            'chat', model, operation, time.monotonic() - started,
+            prompt_tokens=response.usage.prompt_tokens if response.usage else None,
+            completion_tokens=response.usage.completion_tokens if response.usage else None,
+            retries_taken=raw.retries_taken
+        )
+        if response.usage:
+            self.rate_limiter.refund('chat', estimated_tokens - response.usage.total_tokens)
+        content = response.choices[0].message.content
+        result = parse(content) if parse else content
+        if cache:
+            cache.set(key, model, content)
+        return result
+
+    def _outline_request(self, responses):
+        model = "gpt-4"
+        return {
+            'model': model,
+            'messages': [
+                {"role": "system", "content": "You are an expert book outline creator specializing in creating well-structured, engaging book outlines. Focus on maintaining narrative flow and ensuring each chapter builds upon previous ones."},
+                {"role": "user", "content": self._create_outline_prompt(responses, model)}
+            ],
+            'temperature': 0.7,
+            'presence_penalty': 0.3,
+            'frequency_penalty': 0.3
+        }
+
+    def _chapter_request(self, outline_chapter):
+        return {
+            'model': "gpt-4",
+            'messages': [
+                {"role": "system", "content": "You are an expert book writer with a talent for creating engaging, flowing narrative content that maintains consistency and readability while being suitable for audio format."},
+                {"role": "user", "content": self._create_chapter_prompt(outline_chapter)}
+            ],
+            'temperature': 0.7,
+            'presence_penalty': 0.3,
+            'frequency_penalty': 0.3,
+            'max_tokens': 2000
+        }
+
+    def _section_request(self, outline_chapter, titles, index):
+        return {
+            'model': "gpt-4",
+            'messages': [
+                {"role": "system", "content": "You are an expert book writer with a talent for creating engaging, flowing narrative content that maintains consistency and readability while being suitable for audio format."},
+                {"role": "user", "content": self._create_section_prompt(outline_chapter, titles, index)}
+            ],
+            'temperature': 0.7,
+            'presence_penalty': 0.3,
+            'frequency_penalty': 0.3,
+            'max_tokens': current_app.config['CHAPTER_SECTION_MAX_TOKENS']
+        }
+
+    def _transition_request(self, outline_chapter, titles, index, sections):
+        return {
+            'model': "gpt-4",
+            'messages': [
+                {"role": "system", "content": "You are an expert book writer with a talent for creating engaging, flowing narrative content that maintains consistency and readability while being suitable for audio format."},
+                {"role": "user", "content": self._create_transition_prompt(outline_chapter, titles, index, sections)}
+            ],
+            'temperature': 0.7,
+            'max_tokens': 150
+        }
+
+    def _render_prompt(self, prompt_type, **values):
+        """Render the active ``PromptTemplate`` of ``prompt_type``, or None to use the built-in prompt."""
+        try:
+            template = prompt_templates.active(prompt_type)
+            return template.render(**values) if template is not None else None
+        except PromptTemplateError as e:
+            current_app.logger.error(f"Ignoring the active {prompt_type} prompt template: {str(e)}")
+            return None
+
+    def _create_outline_prompt(self, responses, model):
+        # Compact JSON, trimmed to OUTLINE_RESPONSES_TOKEN_BUDGET tokens
+        responses_json = prompt_builder.build_responses(responses, model).text
+        prompt = self._render_prompt('outline', responses=responses_json)
+        if prompt is not None:
+            return prompt
         return f"""Based on the following questionnaire responses, create a detailed book outline that is optimized for audio format and engaging listening experience:
         
-        {json.dumps(responses, indent=2)}
+        {responses_json}
         
         Please create a well-structured outline that:
         1. Maintains a clear narrative flow between chapters
@@ -135,6 +391,15 @@ class AIService:
         """
     
     def _create_chapter_prompt(self, chapter):
+        prompt = self._render_prompt(
+            'chapter',
+            number=chapter.get('number', ''),
+            title=chapter['title'],
+            summary=chapter['summary'],
+            key_points=', '.join(chapter['key_points'])
+        )
+        if prompt is not None:
+            return prompt
         return f"""Write a detailed chapter optimized for audio narration based on the following outline:
         
         Title: {chapter['title']}
@@ -157,3 +422,45 @@ class AIService:
         - Concludes with a clear summary
         - Uses language optimized for audio consumption
         """
+
+    def _create_section_prompt(self, chapter, titles, index):
+        outline = '\n        '.join(f"{i + 1}. {title}" for i, title in enumerate(titles))
+        if index == 0:
+            opening = "This section opens the chapter, so begin by introducing the chapter's topic."
+        else:
+            opening = f"It follows the section \"{titles[index - 1]}\"; don't repeat what that section covers."
+        if index == len(titles) - 1:
+            closing = "This section closes the chapter, so end with a clear summary of the whole chapter."
+        else:
+            closing = f"It is followed by the section \"{titles[index + 1]}\"; leave that topic to it and don't conclude the chapter."
+        return f"""Write one section of a chapter for audio narration. The other sections are being written separately and will be joined with short transitions, so write only this section.
+        
+        Chapter: {chapter['title']}
+        Chapter summary: {chapter['summary']}
+        
+        Sections of this chapter:
+        {outline}
+        
+        Write section {index + 1}: {titles[index]}
+        {opening}
+        {closing}
+        
+        Please follow these guidelines:
+        1. Write in a clear, conversational style suitable for audio narration
+        2. Include engaging examples and illustrations of concepts
+        3. Avoid complex technical jargon unless necessary
+        4. Use clear paragraph breaks and verbal signposts for audio listeners
+        5. Do not add headings or a section title
+        """
+
+    def _create_transition_prompt(self, chapter, titles, index, sections):
+        return f"""Write a one or two sentence spoken transition for an audiobook that leads listeners from one section of a chapter to the next. Reply with the transition only.
+        
+        Chapter: {chapter['title']}
+        
+        The section "{titles[index]}" ends:
+        ...{sections[index].strip()[-600:]}
+        
+        The next section, "{titles[index + 1]}", begins:
+        {sections[index + 1].strip()[:600]}...
+        """
@@ -0,0 +1,251 @@
+"""``AIService`` on ``AsyncOpenAI``, for the async views served by asgi.py.
+
+A call waiting on the LLM holds a coroutine rather than a thread, so one
+process can have hundreds of them in flight. Prompts, caching, rate
+limiting and the usage ledger are shared with ``AIService``; their database
+work runs in a worker thread so it never blocks the event loop.
+"""
+from flask import current_app
+from openai import RateLimitError, APIError
+from services.ai_service import AIService
+from services.completion_cache import CompletionCache
+from services.outline_stream import OutlineStreamParser
+from services import openai_client
+from services.openai_client import openai_retry
+from services.rate_limiter import RateLimiter, estimate_tokens
+from services.metrics import instrument
+from services import usage_ledger
+import asyncio
+import json
+import time
+
+class AsyncAIService(AIService):
+    def __init__(self):
+        # API key verification is a blocking call, so it happens in create()
+        self.client = openai_client.get_async_client()
+        self.cache = CompletionCache() if current_app.config['LLM_CACHE_ENABLED'] else None
+        self.rate_limiter = RateLimiter()
+
+    @classmethod
+    async def create(cls):
+        service = cls()
+        await asyncio.to_thread(service._verify_api_key)
+        return service
+
+    @instrument('llm', 'generate_outline')
+    @openai_retry
+    async def generate_outline(self, questionnaire_responses, use_cache=True):
+        try:
+            current_app.logger.info("Generating outline with OpenAI")
+            # Building the request may look up the active prompt template
+            request = await asyncio.to_thread(self._outline_request, questionnaire_responses)
+            outline = await self._complete(
+                **request,
+                use_cache=use_cache,
+                parse=json.loads,
+                operation='outline'
+            )
+            current_app.logger.info("Successfully generated outline")
+            return outline
+        except RateLimitError as e:
+            current_app.logger.warning(f"Rate limit hit: {str(e)}")
+            raise
+        except APIError as e:
+            current_app.logger.error(f"OpenAI API Error: {str(e)}")
+            raise
+        except json.JSONDecodeError as e:
+            current_app.logger.error(f"Invalid JSON in response: {str(e)}")
+            raise ValueError("Failed to parse AI response")
+        except Exception as e:
+            current_app.logger.error(f"AI Outline Generation Error: {str(e)}")
+            raise
+
+    @instrument('llm', 'stream_outline')
+    async def stream_outline(self, questionnaire_responses, use_cache=True):
+        """Async generator version of ``AIService.stream_outline``."""
+        request = await asyncio.to_thread(self._outline_request, questionnaire_responses)
+        cache = self.cache if use_cache else None
+        key = CompletionCache.key(**request) if cache else None
+        parser = OutlineStreamParser()
+
+        cached = await asyncio.to_thread(cache.get, key) if cache else None
+        if cached is not None:
+            current_app.logger.info("Completion cache hit for streamed outline")
+            for event in parser.feed(cached):
+                yield event
+            yield ('outline', parser.result())
+            return
+
+        current_app.logger.info("Streaming outline from OpenAI")
+        raw = None
+        usage = None
+        completed = False
+        try:
+            raw, started = await self._open_stream(**request)
+            async for chunk in raw.parse():
+                if chunk.usage:
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    for event in parser.feed(delta):
+                        yield event
+            completed = True
+            outline = parser.result()
+        except json.JSONDecodeError as e:
+            current_app.logger.error(f"Invalid JSON in streamed response: {str(e)}")
+            raise ValueError("Failed to parse AI response")
+        except RateLimitError as e:
+            current_app.logger.warning(f"Rate limit hit while streaming outline: {str(e)}")
+            raise
+        except APIError as e:
+            current_app.logger.error(f"OpenAI API Error while streaming outline: {str(e)}")
+            raise
+        finally:
+            if raw is not None:
+                usage_ledger.record(
+                    'chat', request['model'], 'outline_stream',
+                    time.monotonic() - started,
+                    status='ok' if completed else 'error',
+                    prompt_tokens=usage.prompt_tokens if usage else None,
+                    completion_tokens=usage.completion_tokens if usage else None,
+                    retries_taken=raw.retries_taken
+                )
+
+        if cache:
+            await asyncio.to_thread(cache.set, key, request['model'], json.dumps(outline))
+        current_app.logger.info("Successfully streamed outline")
+        yield ('outline', outline)
+
+    @openai_retry
+    async def _open_stream(self, model, messages, **params):
+        await self.rate_limiter.acquire_async('chat', estimate_tokens(messages, params.get('max_tokens')))
+        started = time.monotonic()
+        try:
+            raw = await self.client.chat.completions.with_raw_response.create(
+                model=model,
+                messages=messages,
+                stream=True,
+                stream_options={'include_usage': True},
+                **params
+            )
+        except Exception as e:
+            usage_ledger.record('chat', model, 'outline_stream', time.monotonic() - started, status='error')
+            if isinstance(e, RateLimitError):
+                await asyncio.to_thread(self.rate_limiter.penalize, 'chat', e.response.headers)
+            raise
+        await asyncio.to_thread(self.rate_limiter.observe, 'chat', raw.headers)
+        return raw, started
+
+    @instrument('llm', 'generate_chapter_content')
+    async def generate_chapter_content(self, outline_chapter, use_cache=True):
+        if self._writes_in_sections(outline_chapter):
+            return await self._generate_chapter_in_sections(outline_chapter, use_cache)
+        return await self._generate_chapter(outline_chapter, use_cache)
+
+    @openai_retry
+    async def _generate_chapter(self, outline_chapter, use_cache=True):
+        try:
+            current_app.logger.info(f"Generating content for chapter {outline_chapter.get('number', 'unknown')}")
+            request = await asyncio.to_thread(self._chapter_request, outline_chapter)
+            content = await self._complete(
+                **request,
+                use_cache=use_cache,
+                operation='chapter'
+            )
+            current_app.logger.info(f"Successfully generated chapter {outline_chapter.get('number', 'unknown')} content")
+            return content
+        except RateLimitError as e:
+            current_app.logger.warning(f"Rate limit hit during chapter generation: {str(e)}")
+            raise
+        except APIError as e:
+            current_app.logger.error(f"OpenAI API Error during chapter generation: {str(e)}")
+            raise
+        except Exception as e:
+            current_app.logger.error(f"AI Chapter Generation Error: {str(e)}")
+            raise
+
+    async def _generate_chapter_in_sections(self, outline_chapter, use_cache=True):
+        """``AIService._generate_chapter_in_sections`` with sections written as concurrent tasks."""
+        number = outline_chapter.get('number', 'unknown')
+        titles = self._plan_sections(outline_chapter)
+        current_app.logger.info(f"Generating chapter {number} in {len(titles)} sections")
+        semaphore = asyncio.Semaphore(current_app.config['CHAPTER_SECTION_CONCURRENCY'])
+
+        async def limited(coroutine):
+            async with semaphore:
+                return await coroutine
+
+        async def run_all(coroutines):
+            tasks = [asyncio.create_task(limited(coroutine)) for coroutine in coroutines]
+            try:
+                return await asyncio.gather(*tasks)
+            except Exception:
+                for task in tasks:
+                    task.cancel()
+                raise
+
+        try:
+            sections = await run_all(
+                self._generate_section(outline_chapter, titles, index, use_cache)
+                for index in range(len(titles))
+            )
+            transitions = await run_all(
+                self._generate_transition(outline_chapter, titles, index, sections, use_cache)
+                for index in range(len(titles) - 1)
+            )
+        except Exception as e:
+            current_app.logger.error(f"AI Chapter Generation Error: {str(e)}")
+            raise
+        current_app.logger.info(f"Successfully generated chapter {number} content from {len(titles)} sections")
+        return self._join_sections(sections, transitions)
+
+    @openai_retry
+    async def _generate_section(self, outline_chapter, titles, index, use_cache=True):
+        return await self._complete(**self._section_request(outline_chapter, titles, index),
+                                    use_cache=use_cache, operation='chapter_section')
+
+    @openai_retry
+    async def _generate_transition(self, outline_chapter, titles, index, sections, use_cache=True):
+        return await self._complete(**self._transition_request(outline_chapter, titles, index, sections),
+                                    use_cache=use_cache, operation='chapter_transition')
+
+    async def _complete(self, model, messages, use_cache=True, parse=None, operation='completion', **params):
+        cache = self.cache if use_cache else None
+        key = CompletionCache.key(model, messages, **params) if cache else None
+        if cache:
+            content = await asyncio.to_thread(cache.get, key)
+            if content is not None:
+                current_app.logger.info("Completion cache hit")
+                return parse(content) if parse else content
+
+        estimated_tokens = estimate_tokens(messages, params.get('max_tokens'))
+        await self.rate_limiter.acquire_async('chat', estimated_tokens)
+        started = time.monotonic()
+        try:
+            raw = await self.client.chat.completions.with_raw_response.create(
+                model=model,
+                messages=messages,
+                **params
+            )
+        except Exception as e:
+            usage_ledger.record('chat', model, operation, time.monotonic() - started, status='error')
+            if isinstance(e, RateLimitError):
+                await asyncio.to_thread(self.rate_limiter.penalize, 'chat', e.response.headers)
+            raise
+        await asyncio.to_thread(self.rate_limiter.observe, 'chat', raw.headers)
+        response = raw.parse()
+        usage_ledger.record(
+            'chat', model, operation, time.monotonic() - started,
+            prompt_tokens=response.usage.prompt_tokens if response.usage else None,
+            completion_tokens=response.usage.completion_tokens if response.usage else None,
+            retries_taken=raw.retries_taken
+        )
+        if response.usage:
+            await asyncio.to_thread(self.rate_limiter.refund, 'chat', estimated_tokens - response.usage.total_tokens)
+        content = response.choices[0].message.content
+        result = parse(content) if parse else content
+        if cache:
+            await asyncio.to_thread(cache.set, key, model, content)
+        return result
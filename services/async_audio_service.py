@@ -0,0 +1,129 @@
+"""``AudioService`` on ``AsyncOpenAI``, for the async views served by asgi.py.
+
+Segments are synthesized as concurrent tasks instead of pool threads, and
+the audio cache, rate limiter and file moves run in a worker thread so the
+event loop only ever waits on the network.
+"""
+from flask import current_app
+from openai import RateLimitError
+from services import mp3
+from services.audio_cache import AudioCache
+from services.audio_service import AudioService, AUDIO_DIR, PARTIAL_SUFFIX, chapter_filename
+from services import openai_client
+from services.openai_client import openai_retry
+from services.text_segmenter import segment_text
+from services.metrics import instrument
+from services import usage_ledger
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+class AsyncAudioService(AudioService):
+    def __init__(self):
+        super().__init__()
+        self.client = openai_client.get_async_client()
+
+    @instrument('tts', 'generate_audio')
+    async def generate_audio(self, text, filename=None):
+        try:
+            if filename is None:
+                filename = f"{uuid.uuid4()}.mp3"
+
+            audio_path = os.path.join(AUDIO_DIR, filename)
+            os.makedirs(os.path.dirname(audio_path), exist_ok=True)
+
+            key = None
+            if self.cache is not None:
+                key = AudioCache.key(text, self.model, self.voice, self.response_format)
+                cached_path = await asyncio.to_thread(self.cache.lookup, key, self.response_format)
+                if cached_path is not None:
+                    current_app.logger.info(f"Audio cache hit for {filename}")
+                    try:
+                        await asyncio.to_thread(self._link, cached_path, audio_path)
+                        return filename
+                    except FileNotFoundError:
+                        pass
+
+            partial_path = audio_path + PARTIAL_SUFFIX
+            started = time.monotonic()
+            try:
+                segments = segment_text(text, self.segment_max_chars)
+                if len(segments) <= 1:
+                    await self._synthesize(text, partial_path)
+                else:
+                    await self._synthesize_segments(segments, partial_path)
+                if key is not None:
+                    await asyncio.to_thread(self.cache.add, key, partial_path, len(text),
+                                            time.monotonic() - started, self.response_format)
+                os.replace(partial_path, audio_path)
+            finally:
+                if os.path.exists(partial_path):
+                    os.remove(partial_path)
+            return filename
+        except Exception as e:
+            current_app.logger.error(f"Audio Generation Error: {str(e)}")
+            raise
+
+    @openai_retry
+    async def _synthesize(self, text, path):
+        await self.rate_limiter.acquire_async('tts')
+        started = time.monotonic()
+        retries_taken = 0
+        try:
+            async with self.client.audio.speech.with_streaming_response.create(
+                model=self.model,
+                voice=self.voice,
+                input=text,
+                response_format=self.response_format
+            ) as response:
+                retries_taken = response.retries_taken
+                await asyncio.to_thread(self.rate_limiter.observe, 'tts', response.headers)
+                with open(path, 'wb') as f:
+                    async for chunk in response.iter_bytes(chunk_size=16*1024):
+                        f.write(chunk)
+                        f.flush()
+        except Exception as e:
+            usage_ledger.record('tts', self.model, 'speech', time.monotonic() - started, status='error',
+                                input_chars=len(text), retries_taken=retries_taken)
+            if isinstance(e, RateLimitError):
+                await asyncio.to_thread(self.rate_limiter.penalize, 'tts', e.response.headers)
+            raise
+        usage_ledger.record('tts', self.model, 'speech', time.monotonic() - started,
+                            input_chars=len(text), retries_taken=retries_taken)
+
+    async def _synthesize_segments(self, segments, audio_path):
+        """Synthesize segments as concurrent tasks, appending each in playback order."""
+        parts_dir = tempfile.mkdtemp(prefix='.parts-', dir=os.path.dirname(audio_path))
+        part_paths = [os.path.join(parts_dir, f"{i:04d}.mp3") for i in range(len(segments))]
+        semaphore = asyncio.Semaphore(self.segment_concurrency)
+
+        async def synthesize_part(segment, path):
+            async with semaphore:
+                await self._synthesize(segment, path)
+
+        current_app.logger.info(f"Synthesizing {len(segments)} segments for {os.path.basename(audio_path)}")
+        # Tasks copy the current context, so ledger rows keep their owner
+        tasks = [asyncio.create_task(synthesize_part(segment, path))
+                 for segment, path in zip(segments, part_paths)]
+        try:
+            with open(audio_path, 'wb') as out:
+                for task, part_path in zip(tasks, part_paths):
+                    await task
+                    await asyncio.to_thread(mp3.append_frames, part_path, out)
+                    out.flush()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            shutil.rmtree(parts_dir, ignore_errors=True)
+
+    async def generate_chapter_audio(self, chapter_content, chapter_number, audiobook_id=None):
+        try:
+            filename = chapter_filename(chapter_number, audiobook_id)
+            return await self.generate_audio(chapter_content, filename)
+        except Exception as e:
+            current_app.logger.error(f"Chapter Audio Generation Error: {str(e)}")
+            raise
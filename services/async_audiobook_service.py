@@ -0,0 +1,32 @@
+"""``AudiobookService.generate`` on the async services, for jobs run by async_jobs.py.
+
+Chapter text and audio come from ``AsyncAIService`` and
+``AsyncAudioService`` through ``AsyncChapterPipeline``, so a book waiting on
+OpenAI holds coroutines rather than threads. Database work, assembly and
+HLS packaging are the same steps as the sync path, run in a worker thread.
+"""
+from services.async_ai_service import AsyncAIService
+from services.async_audio_service import AsyncAudioService
+from services.async_chapter_pipeline import AsyncChapterPipeline
+from services.audiobook_service import AudiobookService, GENERATE_AUDIOBOOK
+from services.job_queue import register_async_handler
+from services import usage_ledger
+import asyncio
+
+class AsyncAudiobookService(AudiobookService):
+    async def generate(self, audiobook_id, lease_lost=None):
+        audiobook, outline, chapters, stale = await asyncio.to_thread(self._prepare, audiobook_id)
+        if stale:
+            ai_service = await AsyncAIService.create()
+            pipeline = AsyncChapterPipeline(ai_service, AsyncAudioService(), audiobook_id=audiobook.id)
+
+            async def checkpoint(chapter, content, audio_file):
+                await asyncio.to_thread(self._checkpoint, audiobook, chapter, audio_file, lease_lost)
+
+            with usage_ledger.owner(audiobook_id=audiobook.id):
+                await pipeline.run(stale, on_chapter_done=checkpoint)
+        return await asyncio.to_thread(self._finish, audiobook, outline, chapters, stale, lease_lost)
+
+@register_async_handler(GENERATE_AUDIOBOOK)
+async def run_generate_audiobook(payload, job):
+    await AsyncAudiobookService().generate(payload['audiobook_id'], lease_lost=job.lease_lost)
@@ -0,0 +1,73 @@
+"""``ChapterPipeline`` for the async services, with chapters as tasks on the event loop."""
+from flask import current_app
+import asyncio
+
+class AsyncChapterPipeline:
+    """Generates chapter text and audio with overlapping stages.
+
+    Each chapter is a task that writes its text (up to ``text_concurrency``
+    at a time) and then synthesizes it (up to ``audio_concurrency`` at a
+    time), so a chapter's TTS starts as soon as its text is ready. Waiting
+    chapters hold a coroutine rather than a pool thread.
+    """
+
+    def __init__(self, ai_service, audio_service, text_concurrency=None, audio_concurrency=None, audiobook_id=None):
+        self.ai_service = ai_service
+        self.audio_service = audio_service
+        self.audiobook_id = audiobook_id
+        self.text_concurrency = text_concurrency or current_app.config['CHAPTER_TEXT_CONCURRENCY']
+        self.audio_concurrency = audio_concurrency or current_app.config['CHAPTER_AUDIO_CONCURRENCY']
+
+    async def run(self, chapters, on_chapter_done=None):
+        """Generate every chapter and return ``{chapter number: audio file}``.
+
+        Behaves like ``ChapterPipeline.run``, except that
+        ``on_chapter_done(chapter, content, audio_file)`` is awaited. After
+        the first failure, chapters that haven't started a stage skip it;
+        chapters already in progress still finish and are reported before
+        the error is raised.
+        """
+        app = current_app._get_current_object()
+        text_slots = asyncio.Semaphore(self.text_concurrency)
+        audio_slots = asyncio.Semaphore(self.audio_concurrency)
+        results = {}
+        first_error = None
+
+        async def generate(chapter):
+            # Each chapter has its own app context, and so its own database session, like a pool thread
+            with app.app_context():
+                async with text_slots:
+                    if first_error is not None:
+                        return None
+                    content = await self.ai_service.generate_chapter_content(chapter)
+                async with audio_slots:
+                    if first_error is not None:
+                        return None
+                    audio_file = await self.audio_service.generate_chapter_audio(
+                        content, chapter['number'], self.audiobook_id
+                    )
+                return content, audio_file
+
+        tasks = {asyncio.create_task(generate(chapter)): chapter for chapter in chapters}
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                chapter = tasks[task]
+                try:
+                    result = task.result()
+                    if result is None:
+                        continue
+                    content, audio_file = result
+                    results[chapter['number']] = audio_file
+                    current_app.logger.info(f"Chapter {chapter['number']} finished ({len(results)}/{len(chapters)})")
+                    if on_chapter_done:
+                        await on_chapter_done(chapter, content, audio_file)
+                except Exception as e:
+                    current_app.logger.error(f"Chapter {chapter['number']} failed: {str(e)}")
+                    if first_error is None:
+                        first_error = e
+
+        if first_error is not None:
+            raise first_error
+        return {str(chapter['number']): results[chapter['number']] for chapter in chapters}
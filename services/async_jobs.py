@@ -0,0 +1,80 @@
+"""Run queued jobs on the ASGI event loop (see asgi.py).
+
+An ``AsyncJobRunner`` claims jobs that have an async handler from the same
+queue worker.py uses, and runs up to ``ASGI_JOB_CONCURRENCY`` of them at a
+time as tasks. Each job waiting on OpenAI holds coroutines rather than
+threads, so one process can keep hundreds of upstream calls in flight.
+worker.py processes can run alongside it; claims are safe across both.
+
+The runner polls every ``JOB_POLL_INTERVAL`` seconds, and ``wake()`` makes
+it claim straight away, e.g. after a request queues a job. On shutdown,
+running jobs are cancelled and their leases run out, so another worker
+picks them up again.
+"""
+from models import Job, db
+from services.job_queue import ASYNC_JOB_HANDLERS, JobQueue
+import asyncio
+import os
+import socket
+
+class AsyncJobRunner:
+    def __init__(self, app, concurrency=None, poll_interval=None):
+        self.app = app
+        self.concurrency = concurrency or app.config['ASGI_JOB_CONCURRENCY']
+        self.poll_interval = poll_interval or app.config['JOB_POLL_INTERVAL']
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:asgi"
+        self.running = set()
+        self.task = None
+        self._wakeup = None
+
+    def start(self):
+        """Start claiming jobs; call from the event loop."""
+        self._wakeup = asyncio.Event()
+        self.task = asyncio.create_task(self._run())
+        self.app.logger.info(f"Worker {self.worker_id} started with up to {self.concurrency} jobs at a time")
+
+    def wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def stop(self):
+        tasks = [task for task in (self.task, *self.running) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.app.logger.info(f"Worker {self.worker_id} stopped")
+
+    async def _run(self):
+        while True:
+            # Cleared before claiming, so a wake() during the claim isn't lost
+            self._wakeup.clear()
+            job_id = None
+            if len(self.running) < self.concurrency:
+                try:
+                    job_id = await asyncio.to_thread(self._claim)
+                except Exception as e:
+                    self.app.logger.error(f"Worker {self.worker_id} failed to claim a job: {str(e)}")
+            if job_id is not None:
+                task = asyncio.create_task(self._run_job(job_id))
+                self.running.add(task)
+                task.add_done_callback(self._job_done)
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def _job_done(self, task):
+        self.running.discard(task)
+        self.wake()
+
+    def _claim(self):
+        with self.app.app_context():
+            job = JobQueue().claim(self.worker_id, job_types=list(ASYNC_JOB_HANDLERS))
+            return job.id if job else None
+
+    async def _run_job(self, job_id):
+        # Each job has its own app context, and so its own database session
+        with self.app.app_context():
+            job = await asyncio.to_thread(db.session.get, Job, job_id)
+            await JobQueue().run_async(job, self.worker_id)
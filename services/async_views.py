@@ -0,0 +1,187 @@
+"""Native async views for the ASGI serving mode (see asgi.py).
+
+Flask runs ``async def`` views on a thread of their own, so a view waiting
+on OpenAI still pins a worker thread. ``AsgiApp`` instead awaits the views
+registered with ``@async_view`` directly on the event loop, inside a normal
+Flask request context, so CSRF, sessions, ``url_for``, metrics and error
+handlers behave as they do for sync views. Every other request, and any
+request an async view's ``when`` check declines, is passed to the Flask app
+through ``asgiref``'s WSGI adapter.
+"""
+from asgiref.wsgi import WsgiToAsgi
+from services import usage_ledger
+from werkzeug.datastructures import Headers
+import asyncio
+import io
+import sys
+
+_views = {}  # endpoint -> (view, when)
+
+def async_view(endpoint, when=None):
+    """Serve ``endpoint`` with the decorated coroutine under ASGI.
+
+    ``when`` is called inside the request context; when it returns false
+    the request goes to the endpoint's sync view instead. The coroutine may
+    return anything a Flask view can, or a ``StreamingResponse``.
+    """
+    def decorator(view):
+        _views[endpoint] = (view, when)
+        return view
+    return decorator
+
+class StreamingResponse:
+    """A response whose body is an async iterable of str or bytes chunks."""
+
+    def __init__(self, body, status=200, headers=None, mimetype=None):
+        self.body = body
+        self.status = status
+        self.headers = Headers(headers)
+        if mimetype:
+            self.headers['Content-Type'] = mimetype
+
+class AsgiApp:
+    def __init__(self, app, job_runner=None):
+        self.app = app
+        self.wsgi = WsgiToAsgi(app)
+        # Started and stopped with the server; views reach it through app.extensions
+        self.job_runner = job_runner
+        if job_runner is not None:
+            app.extensions['async_job_runner'] = job_runner
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            return await self.wsgi(scope, receive, send)
+
+        body = await _read_body(receive)
+        ctx = self.app.request_context(_environ(scope, body))
+        ctx.push()
+        try:
+            view = None
+            rule = ctx.request.url_rule
+            if rule is not None and rule.endpoint in _views:
+                view, when = _views[rule.endpoint]
+                if when is not None and not when():
+                    view = None
+            if view is not None:
+                await self._dispatch(view, ctx.request.view_args, receive, send)
+                return
+        finally:
+            ctx.pop()
+        await self.wsgi(scope, _replay(body, receive), send)
+
+    async def _dispatch(self, view, view_args, receive, send):
+        # The same steps as Flask.full_dispatch_request, with the view awaited
+        app = self.app
+        streamed = None
+        try:
+            try:
+                rv = app.preprocess_request()
+                if rv is None:
+                    rv = await view(**view_args)
+            except Exception as e:
+                rv = app.handle_user_exception(e)
+            if isinstance(rv, StreamingResponse):
+                streamed = rv
+                rv = app.response_class(status=rv.status, headers=rv.headers)
+            response = app.process_response(app.make_response(rv))
+        except Exception as e:
+            streamed = None
+            response = app.handle_exception(e)
+
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': [(name.lower().encode('latin1'), value.encode('latin1'))
+                        for name, value in response.headers.items()]
+        })
+        if streamed is None:
+            await send({'type': 'http.response.body', 'body': response.get_data()})
+            return
+
+        disconnected = asyncio.create_task(_wait_for_disconnect(receive))
+        try:
+            async for chunk in streamed.body:
+                if disconnected.done():
+                    break
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            disconnected.cancel()
+            if hasattr(streamed.body, 'aclose'):
+                await streamed.body.aclose()
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                if self.job_runner is not None:
+                    self.job_runner.start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.job_runner is not None:
+                    await self.job_runner.stop()
+                await asyncio.to_thread(usage_ledger.flush, self.app)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+def _replay(body, receive):
+    # The body has already been read; hand it to the WSGI adapter again
+    sent = False
+
+    async def replay():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        return await receive()
+    return replay
+
+async def _wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+def _environ(scope, body):
+    script_name = scope.get('root_path', '').encode('utf8').decode('latin1')
+    path_info = scope['path'].encode('utf8').decode('latin1')
+    if path_info.startswith(script_name):
+        path_info = path_info[len(script_name):]
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': script_name,
+        'PATH_INFO': path_info,
+        'QUERY_STRING': scope['query_string'].decode('ascii'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'REMOTE_ADDR': (scope.get('client') or ('',))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin1').upper().replace('-', '_')
+        if name not in ('CONTENT_LENGTH', 'CONTENT_TYPE'):
+            name = f'HTTP_{name}'
+        value = value.decode('latin1')
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
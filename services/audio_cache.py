@@ -0,0 +1,129 @@
+from flask import current_app
+from services import metrics
+import hashlib
+import json
+import os
+import shutil
+import uuid
+
+class AudioCache:
+    """Content-addressed store for synthesized audio.
+
+    Files live at ``<cache dir>/<key[:2]>/<key>.mp3``, where the key is a
+    hash of everything that affects the audio. Each entry also has a small
+    JSON sidecar recording what it cost to produce, whose mtime records when
+    the entry was last used. Once the cache grows past its disk budget, the
+    least recently used entries are evicted. Hits,
+    misses, evictions and what the hits saved are exported as Prometheus
+    counters (see metrics.py).
+    """
+
+    def __init__(self, directory=None, max_bytes=None):
+        self.directory = directory or current_app.config['TTS_CACHE_DIR']
+        self.max_bytes = max_bytes if max_bytes is not None else current_app.config['TTS_CACHE_MAX_BYTES']
+
+    @staticmethod
+    def key(text, model, voice, response_format):
+        payload = json.dumps([text, model, voice, response_format], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def path_for(self, key, response_format='mp3'):
+        return os.path.join(self.directory, key[:2], f"{key}.{response_format}")
+
+    def lookup(self, key, response_format='mp3'):
+        """Return the cached file for ``key`` and mark it recently used, or None."""
+        path = self.path_for(key, response_format)
+        if not os.path.exists(path):
+            metrics.TTS_CACHE_LOOKUPS.labels('miss').inc()
+            return None
+
+        # Recency is the sidecar's mtime. The entry itself is hard-linked into
+        # audiobooks, and touching it would change their ETags.
+        meta = self._read_meta(path)
+        try:
+            os.utime(self._meta_path(path))
+        except FileNotFoundError:
+            pass
+        chars = meta.get('chars', 0)
+        metrics.TTS_CACHE_LOOKUPS.labels('hit').inc()
+        metrics.TTS_CACHE_SAVED_CHARS.inc(chars)
+        metrics.TTS_CACHE_SAVED_SECONDS.inc(meta.get('seconds', 0.0))
+        metrics.TTS_CACHE_SAVED_COST.inc(chars * current_app.config['TTS_COST_PER_MILLION_CHARS'] / 1_000_000)
+        return path
+
+    def add(self, key, source_path, chars, seconds, response_format='mp3'):
+        """Add a finished audio file to the cache and return the entry's path.
+
+        The source is hard-linked (or copied across devices) to a temp name
+        and then renamed into place, so readers never see a partial entry.
+        """
+        path = self.path_for(key, response_format)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            try:
+                os.link(source_path, tmp_path)
+            except OSError:
+                shutil.copyfile(source_path, tmp_path)
+            with open(self._meta_path(path), 'w') as f:
+                json.dump({'chars': chars, 'seconds': round(seconds, 3)}, f)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        self.enforce_budget()
+        return path
+
+    def enforce_budget(self):
+        entries = []
+        total = 0
+        for root, dirs, files in os.walk(self.directory):
+            # Skip in-progress work such as segment part directories
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            for name in files:
+                if name.endswith('.json') or name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((self._last_used(path, st), st.st_size, path))
+                total += st.st_size
+
+        if total <= self.max_bytes:
+            return 0
+
+        evicted = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                os.remove(self._meta_path(path))
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted += 1
+            metrics.TTS_CACHE_EVICTIONS.inc()
+            metrics.TTS_CACHE_EVICTED_BYTES.inc(size)
+
+        current_app.logger.info(f"Audio cache evicted {evicted} entries to stay under {self.max_bytes} bytes")
+        return evicted
+
+    def _last_used(self, path, st):
+        try:
+            return os.stat(self._meta_path(path)).st_mtime
+        except FileNotFoundError:
+            return st.st_mtime
+
+    def _meta_path(self, path):
+        return os.path.splitext(path)[0] + '.json'
+
+    def _read_meta(self, path):
+        try:
+            with open(self._meta_path(path)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
@@ -1,42 +1,162 @@
 from flask import current_app
-import openai
+from concurrent.futures import ThreadPoolExecutor
+from services import mp3
+from services.audio_cache import AudioCache
+from services import openai_client
+from services.openai_client import openai_retry
+from services.rate_limiter import RateLimiter
+from services.text_segmenter import segment_text
+from services.metrics import instrument
+from services import usage_ledger
+import contextvars
 import os
+import shutil
+import tempfile
+import time
 import uuid
 
+AUDIO_DIR = 'static/audio'
+PARTIAL_SUFFIX = '.partial'
+
+def chapter_filename(chapter_number, audiobook_id=None):
+    filename = f"chapter_{chapter_number}.mp3"
+    if audiobook_id:
+        filename = f"{audiobook_id}/{filename}"
+    return filename
+
 class AudioService:
     def __init__(self):
-        self.client = openai.OpenAI(
-            api_key=current_app.config['OPENAI_API_KEY']
-        )
-    
+        self.client = openai_client.get_client()
+        self.model = "tts-1"
+        self.voice = "alloy"
+        self.response_format = "mp3"
+        self.cache = AudioCache() if current_app.config['TTS_CACHE_ENABLED'] else None
+        self.rate_limiter = RateLimiter()
+        self.segment_max_chars = current_app.config['TTS_SEGMENT_MAX_CHARS']
+        self.segment_concurrency = current_app.config['TTS_SEGMENT_CONCURRENCY']
+
+    @instrument('tts', 'generate_audio')
     def generate_audio(self, text, filename=None):
         try:
             if filename is None:
                 filename = f"{uuid.uuid4()}.mp3"
-            
-            response = self.client.audio.speech.create(
-                model="tts-1",
-                voice="alloy",
-                input=text
-            )
-            
+
             # Ensure audio directory exists
-            os.makedirs('static/audio', exist_ok=True)
-            
-            # Save the audio file
-            audio_path = os.path.join('static/audio', filename)
-            with open(audio_path, 'wb') as f:
-                for chunk in response.iter_bytes(chunk_size=1024*1024):
-                    f.write(chunk)
-            
+            audio_path = os.path.join(AUDIO_DIR, filename)
+            os.makedirs(os.path.dirname(audio_path), exist_ok=True)
+
+            key = None
+            if self.cache is not None:
+                key = AudioCache.key(text, self.model, self.voice, self.response_format)
+                cached_path = self.cache.lookup(key, self.response_format)
+                if cached_path is not None:
+                    current_app.logger.info(f"Audio cache hit for {filename}")
+                    try:
+                        self._link(cached_path, audio_path)
+                        return filename
+                    except FileNotFoundError:
+                        # Evicted between lookup and link
+                        pass
+
+            # Audio is written to a .partial file as it arrives, so listeners
+            # can stream the chapter before synthesis finishes
+            partial_path = audio_path + PARTIAL_SUFFIX
+            started = time.monotonic()
+            try:
+                self._render(text, partial_path)
+                if key is not None:
+                    self.cache.add(key, partial_path, len(text), time.monotonic() - started, self.response_format)
+                os.replace(partial_path, audio_path)
+            finally:
+                if os.path.exists(partial_path):
+                    os.remove(partial_path)
             return filename
         except Exception as e:
             current_app.logger.error(f"Audio Generation Error: {str(e)}")
             raise
-    
-    def generate_chapter_audio(self, chapter_content, chapter_number):
+
+    def _render(self, text, path):
+        segments = segment_text(text, self.segment_max_chars)
+        if len(segments) <= 1:
+            self._synthesize(text, path)
+        else:
+            self._synthesize_segments(segments, path)
+
+    def _link(self, cached_path, audio_path):
+        # A hard link keeps the chapter playable after the cache entry is evicted
+        tmp_path = f"{audio_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.link(cached_path, tmp_path)
+        except OSError as e:
+            if isinstance(e, FileNotFoundError):
+                raise
+            shutil.copyfile(cached_path, tmp_path)
+        os.replace(tmp_path, audio_path)
+
+    @openai_retry
+    def _synthesize(self, text, path):
+        self.rate_limiter.acquire('tts')
+        started = time.monotonic()
+        retries_taken = 0
+        try:
+            with self.client.audio.speech.with_streaming_response.create(
+                model=self.model,
+                voice=self.voice,
+                input=text,
+                response_format=self.response_format
+            ) as response:
+                retries_taken = response.retries_taken
+                self.rate_limiter.observe('tts', response.headers)
+                with open(path, 'wb') as f:
+                    for chunk in response.iter_bytes(chunk_size=16*1024):
+                        f.write(chunk)
+                        f.flush()
+        except Exception as e:
+            from openai import RateLimitError
+            usage_ledger.record('tts', self.model, 'speech', time.monotonic() - started, status='error',
+                                input_chars=len(text), retries_taken=retries_taken)
+            if isinstance(e, RateLimitError):
+                self.rate_limiter.penalize('tts', e.response.headers)
+            raise
+        usage_ledger.record('tts', self.model, 'speech', time.monotonic() - started,
+                            input_chars=len(text), retries_taken=retries_taken)
+
+    def _synthesize_segments(self, segments, audio_path):
+        """Synthesize segments concurrently and join them at MP3 frame boundaries.
+
+        Each part is appended to ``audio_path`` as soon as it and all parts
+        before it are done, so the output grows in playback order.
+        """
+        app = current_app._get_current_object()
+        parts_dir = tempfile.mkdtemp(prefix='.parts-', dir=os.path.dirname(audio_path))
+        part_paths = [os.path.join(parts_dir, f"{i:04d}.mp3") for i in range(len(segments))]
+
+        def synthesize_part(segment, path):
+            with app.app_context():
+                self._synthesize(segment, path)
+
+        try:
+            current_app.logger.info(f"Synthesizing {len(segments)} segments for {os.path.basename(audio_path)}")
+            with ThreadPoolExecutor(max_workers=self.segment_concurrency, thread_name_prefix='tts-segment') as pool:
+                # Each part runs in a copy of this context so ledger rows keep their owner
+                futures = [pool.submit(contextvars.copy_context().run, synthesize_part, segment, path)
+                           for segment, path in zip(segments, part_paths)]
+                with open(audio_path, 'wb') as out:
+                    for future, part_path in zip(futures, part_paths):
+                        try:
+                            future.result()
+                        except Exception:
+                            for pending in futures:
+                                pending.cancel()
+                            raise
+                        mp3.append_frames(part_path, out)
+                        out.flush()
+        finally:
+            shutil.rmtree(parts_dir, ignore_errors=True)
+
+    def generate_chapter_audio(self, chapter_content, chapter_number, audiobook_id=None):
         try:
-            filename = f"chapter_{chapter_number}.mp3"
+            filename = chapter_filename(chapter_number, audiobook_id)
             return self.generate_audio(chapter_content, filename)
         except Exception as e:
             current_app.logger.error(f"Chapter Audio Generation Error: {str(e)}")
@@ -0,0 +1,222 @@
+from flask import current_app
+from models import Audiobook, BookOutline, db
+from services.audio_service import AudioService, AUDIO_DIR, PARTIAL_SUFFIX, chapter_filename
+from services.chapter_pipeline import ChapterPipeline
+from services.job_queue import JobQueue, LeaseLost, register_handler
+from services import hls
+from services import mp3
+from services import usage_ledger
+import hashlib
+import json
+import os
+import uuid
+
+GENERATE_AUDIOBOOK = 'generate_audiobook'
+BOOK_FILENAME = 'book.mp3'
+HLS_DIRNAME = 'hls'
+
+def hls_dir(audiobook_id):
+    return os.path.join(AUDIO_DIR, audiobook_id, HLS_DIRNAME)
+
+def chapter_hash(chapter):
+    """Hash of an outline chapter, used to tell whether its audio is stale."""
+    payload = json.dumps(chapter, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class AudiobookService:
+    def start_generation(self, outline):
+        """Queue generation of the outline's audiobook for a worker.
+
+        An existing audiobook for the outline is reused, so only its
+        missing, failed or changed chapters are generated again. If a job
+        for the audiobook is already queued or running, no new one is added.
+        """
+        audiobook = outline.audiobook
+        if audiobook is not None:
+            active = JobQueue().active_for(audiobook.id, GENERATE_AUDIOBOOK)
+            if active is not None:
+                current_app.logger.info(f"Audiobook {audiobook.id} already has {active.status} job {active.id}")
+                return audiobook
+        else:
+            audiobook = Audiobook(
+                outline_id=outline.id,
+                chapter_files={},
+                chapter_hashes={}
+            )
+            db.session.add(audiobook)
+        audiobook.status = 'generating'
+        db.session.commit()
+
+        JobQueue().enqueue(GENERATE_AUDIOBOOK, {'audiobook_id': audiobook.id}, resource_id=audiobook.id)
+        return audiobook
+
+    def generate(self, audiobook_id, lease_lost=None):
+        """Generate the audiobook's stale chapters, then assemble and package it.
+
+        ``lease_lost`` is the running job's event; once it is set, nothing
+        more is saved and ``LeaseLost`` is raised at the next checkpoint.
+        """
+        audiobook, outline, chapters, stale = self._prepare(audiobook_id)
+        if stale:
+            # Imported here so the web process only loads openai once it's needed
+            from services.ai_service import AIService
+            pipeline = ChapterPipeline(AIService(), AudioService(), audiobook_id=audiobook.id)
+
+            def checkpoint(chapter, content, audio_file):
+                self._checkpoint(audiobook, chapter, audio_file, lease_lost)
+
+            with usage_ledger.owner(audiobook_id=audiobook.id):
+                pipeline.run(stale, on_chapter_done=checkpoint)
+        return self._finish(audiobook, outline, chapters, stale, lease_lost)
+
+    def _prepare(self, audiobook_id):
+        audiobook = db.session.get(Audiobook, audiobook_id)
+        if audiobook is None:
+            raise ValueError(f"Audiobook {audiobook_id} not found")
+        outline = db.session.get(BookOutline, audiobook.outline_id)
+        audiobook.status = 'generating'
+        db.session.commit()
+
+        chapters = outline.chapters['chapters']
+        stale = self.stale_chapters(audiobook, chapters)
+        current_app.logger.info(f"Audiobook {audiobook.id}: {len(stale)} of {len(chapters)} chapters need generating")
+
+        # Drop chapters that are no longer in the outline
+        numbers = {str(chapter['number']) for chapter in chapters}
+        audiobook.chapter_files = {n: f for n, f in (audiobook.chapter_files or {}).items() if n in numbers}
+        audiobook.chapter_hashes = {n: h for n, h in (audiobook.chapter_hashes or {}).items() if n in numbers}
+        db.session.commit()
+        return audiobook, outline, chapters, stale
+
+    def _checkpoint(self, audiobook, chapter, audio_file, lease_lost):
+        _check_lease(audiobook.id, lease_lost)
+        # Reassign rather than mutate so SQLAlchemy sees the JSON change
+        number = str(chapter['number'])
+        audiobook.chapter_files = {**audiobook.chapter_files, number: audio_file}
+        audiobook.chapter_hashes = {**(audiobook.chapter_hashes or {}), number: chapter_hash(chapter)}
+        db.session.commit()
+
+    def _finish(self, audiobook, outline, chapters, stale, lease_lost):
+        _check_lease(audiobook.id, lease_lost)
+        # Rebuild in outline order now that every chapter is present
+        audiobook.chapter_files = {str(c['number']): audiobook.chapter_files[str(c['number'])] for c in chapters}
+        regenerated = {str(c['number']) for c in stale}
+        self.assemble(audiobook, outline, chapters, regenerated=regenerated)
+        self.package_hls(audiobook, chapters, regenerated=regenerated)
+        _check_lease(audiobook.id, lease_lost)
+        audiobook.status = 'completed'
+        db.session.commit()
+        current_app.logger.info(f"Audiobook {audiobook.id} generated with {len(chapters)} chapters")
+        return audiobook
+
+    def assemble(self, audiobook, outline, chapters, regenerated=()):
+        """Record chapter durations and join the chapters into one book file.
+
+        Durations are read from MP3 frame headers, and only chapters that
+        were ``regenerated`` or have no recorded duration are scanned. The
+        book file has an ID3 chapter marker for each chapter.
+        """
+        known = audiobook.chapter_durations or {}
+        durations = {}
+        parts = []
+        for chapter in chapters:
+            number = str(chapter['number'])
+            path = os.path.join(AUDIO_DIR, audiobook.chapter_files[number])
+            durations[number] = known.get(number) if number not in regenerated else None
+            if durations[number] is None:
+                durations[number] = round(mp3.duration(path), 3)
+            parts.append((f"Chapter {chapter['number']}: {chapter['title']}", path, durations[number]))
+
+        book_file = f"{audiobook.id}/{BOOK_FILENAME}"
+        book_path = os.path.join(AUDIO_DIR, book_file)
+        os.makedirs(os.path.dirname(book_path), exist_ok=True)
+        tmp_path = f"{book_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            total = mp3.write_book(tmp_path, outline.title or outline.chapters.get('title'), parts)
+            os.replace(tmp_path, book_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        audiobook.chapter_durations = durations
+        audiobook.total_duration = round(total)
+        audiobook.book_file = book_file
+        current_app.logger.info(f"Audiobook {audiobook.id} assembled into {book_file} ({audiobook.total_duration}s)")
+
+    def package_hls(self, audiobook, chapters, regenerated=()):
+        """Cut chapters into HLS segments and write the audiobook's playlists.
+
+        Chapters that weren't ``regenerated`` keep their existing segments.
+        """
+        directory = hls_dir(audiobook.id)
+        target_seconds = current_app.config['HLS_SEGMENT_SECONDS']
+        known = audiobook.chapter_playlists or {}
+        playlists = {}
+        for chapter in chapters:
+            number = str(chapter['number'])
+            playlist = known.get(number)
+            if number in regenerated or playlist is None or not os.path.exists(os.path.join(directory, playlist)):
+                path = os.path.join(AUDIO_DIR, audiobook.chapter_files[number])
+                playlist = hls.segment_chapter(path, directory, f"chapter_{number}", target_seconds)
+            playlists[number] = playlist
+        hls.write_book_playlists(directory, list(playlists.values()))
+        audiobook.chapter_playlists = playlists
+        current_app.logger.info(f"Audiobook {audiobook.id} packaged for HLS")
+
+    def stale_chapters(self, audiobook, chapters):
+        """Chapters whose audio is missing or was made from a different outline entry."""
+        files = audiobook.chapter_files or {}
+        # Audiobooks made before hashes were recorded keep their existing chapters
+        hashes = audiobook.chapter_hashes
+        stale = []
+        for chapter in chapters:
+            number = str(chapter['number'])
+            filename = files.get(number)
+            if (filename is None
+                    or (hashes is not None and hashes.get(number) != chapter_hash(chapter))
+                    or not os.path.exists(os.path.join(AUDIO_DIR, filename))):
+                stale.append(chapter)
+        return stale
+
+    def status(self, audiobook):
+        job = JobQueue().latest_for(audiobook.id)
+        chapters = audiobook.outline.chapters.get('chapters', [])
+        return {
+            'id': audiobook.id,
+            'status': audiobook.status,
+            'completed_chapters': len(chapters) - len(self.stale_chapters(audiobook, chapters)),
+            'total_chapters': len(chapters),
+            'chapters': [{
+                'number': chapter['number'],
+                'title': chapter['title'],
+                'audio': self._chapter_audio_state(audiobook, chapter['number'])
+            } for chapter in chapters],
+            'job': {
+                'status': job.status,
+                'attempts': job.attempts,
+                'max_attempts': job.max_attempts,
+                'error': job.last_error.strip().splitlines()[-1] if job.last_error else None
+            } if job else None
+        }
+
+    def _chapter_audio_state(self, audiobook, chapter_number):
+        filename = (audiobook.chapter_files or {}).get(str(chapter_number)) or chapter_filename(chapter_number, audiobook.id)
+        audio_path = os.path.join(AUDIO_DIR, filename)
+        if os.path.exists(audio_path):
+            return 'ready'
+        if os.path.exists(audio_path + PARTIAL_SUFFIX):
+            return 'synthesizing'
+        return 'pending'
+
+def _check_lease(audiobook_id, lease_lost):
+    if lease_lost is not None and lease_lost.is_set():
+        raise LeaseLost(f"Lease on audiobook {audiobook_id} lost; another worker has taken over")
+
+def _mark_audiobook_failed(payload):
+    audiobook = db.session.get(Audiobook, payload['audiobook_id'])
+    if audiobook:
+        audiobook.status = 'failed'
+
+@register_handler(GENERATE_AUDIOBOOK, on_failure=_mark_audiobook_failed)
+def run_generate_audiobook(payload, job):
+    AudiobookService().generate(payload['audiobook_id'], lease_lost=job.lease_lost)
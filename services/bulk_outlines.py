@@ -0,0 +1,110 @@
+"""Generate outlines for many questionnaire responses at once.
+
+Used by the ``generate-outlines`` command in migrations.py. Responses that
+already have an outline are skipped, so an interrupted run can simply be
+started again.
+"""
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from flask import current_app
+from models import QuestionnaireResponse, BookOutline, db
+from services.ai_service import AIService
+from services import usage_ledger
+from sqlalchemy.orm import load_only
+import contextvars
+import time
+import uuid
+
+def select_responses(status=None, template_id=None, since=None, until=None, limit=None):
+    """Responses matching the filters that don't have an outline yet, oldest first."""
+    query = QuestionnaireResponse.query.options(
+        load_only(QuestionnaireResponse.id, QuestionnaireResponse.responses)
+    ).outerjoin(BookOutline, BookOutline.questionnaire_id == QuestionnaireResponse.id).filter(
+        BookOutline.id.is_(None),
+        QuestionnaireResponse.status != 'deleted'
+    )
+    if status:
+        query = query.filter(QuestionnaireResponse.status == status)
+    if template_id:
+        query = query.filter(QuestionnaireResponse.template_id == template_id)
+    if since:
+        query = query.filter(QuestionnaireResponse.created_at >= since)
+    if until:
+        query = query.filter(QuestionnaireResponse.created_at < until)
+    query = query.order_by(QuestionnaireResponse.created_at, QuestionnaireResponse.id)
+    if limit:
+        query = query.limit(limit)
+    return query.all()
+
+class BulkOutlineGenerator:
+    """Generates outlines with a bounded worker pool and saves them in batches.
+
+    Each outline goes through ``AIService.generate_outline``, so the usual
+    retries, rate limiting and completion cache all apply.
+    """
+
+    def __init__(self, concurrency=4, batch_size=20, echo=print):
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.echo = echo
+
+    def run(self, responses):
+        """Generate outlines for ``responses`` and return a summary dict."""
+        app = current_app._get_current_object()
+        started = time.monotonic()
+        summary = {'selected': len(responses), 'generated': 0, 'failed': 0, 'interrupted': False}
+        pending_outlines = []
+
+        def generate(responses_data, outline_id):
+            with app.app_context(), usage_ledger.owner(outline_id=outline_id):
+                return AIService().generate_outline(responses_data)
+
+        def save_batch():
+            if not pending_outlines:
+                return
+            db.session.add_all(pending_outlines)
+            db.session.commit()
+            summary['generated'] += len(pending_outlines)
+            pending_outlines.clear()
+            self.echo(f"Saved {summary['generated']} of {summary['selected']} outlines")
+
+        pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='bulk-outline')
+        futures = {}
+        try:
+            for response in responses:
+                outline_id = str(uuid.uuid4())
+                future = pool.submit(contextvars.copy_context().run, generate, response.responses, outline_id)
+                futures[future] = (response.id, outline_id)
+
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    response_id, outline_id = futures[future]
+                    try:
+                        outline_data = future.result()
+                    except Exception as e:
+                        summary['failed'] += 1
+                        current_app.logger.error(f"Bulk outline generation failed for response {response_id}: {str(e)}")
+                        self.echo(f"Failed response {response_id}: {str(e)}")
+                        continue
+                    pending_outlines.append(BookOutline(
+                        id=outline_id,
+                        questionnaire_id=response_id,
+                        chapters=outline_data,
+                        status='draft'
+                    ))
+                    if len(pending_outlines) >= self.batch_size:
+                        save_batch()
+        except KeyboardInterrupt:
+            # Keep what is finished; the next run picks up the rest
+            summary['interrupted'] = True
+            self.echo("Interrupted, saving finished outlines...")
+            pool.shutdown(wait=False, cancel_futures=True)
+        finally:
+            save_batch()
+            pool.shutdown(wait=not summary['interrupted'])
+
+        elapsed = time.monotonic() - started
+        summary['elapsed_seconds'] = round(elapsed, 1)
+        summary['outlines_per_minute'] = round(summary['generated'] / elapsed * 60, 1) if elapsed else 0.0
+        return summary
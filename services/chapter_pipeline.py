@@ -0,0 +1,94 @@
+from flask import current_app
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import contextvars
+
+class ChapterPipeline:
+    """Generates chapter text and audio with overlapping stages.
+
+    Chapter texts are generated in parallel (up to ``text_concurrency`` at a
+    time) and each chapter's TTS starts as soon as its text is ready, so
+    audio for one chapter is synthesized while later chapters are still
+    being written.
+    """
+
+    def __init__(self, ai_service, audio_service, text_concurrency=None, audio_concurrency=None, audiobook_id=None):
+        self.ai_service = ai_service
+        self.audio_service = audio_service
+        self.audiobook_id = audiobook_id
+        self.text_concurrency = text_concurrency or current_app.config['CHAPTER_TEXT_CONCURRENCY']
+        self.audio_concurrency = audio_concurrency or current_app.config['CHAPTER_AUDIO_CONCURRENCY']
+
+    def run(self, chapters, on_chapter_done=None):
+        """Generate every chapter and return ``{chapter number: audio file}``.
+
+        The result is in outline order no matter which chapter finishes
+        first. ``on_chapter_done(chapter, content, audio_file)`` is called
+        from the calling thread as each chapter completes. If a chapter
+        fails, or ``on_chapter_done`` raises, chapters that haven't started
+        are cancelled. Chapters already in progress still finish and are
+        reported before the first error is raised.
+        """
+        app = current_app._get_current_object()
+        results = {}
+        first_error = None
+
+        def in_context(func, *args):
+            with app.app_context():
+                return func(*args)
+
+        def submit(pool, func, *args):
+            # A copy of the caller's context carries context variables such as the usage ledger owner
+            return pool.submit(contextvars.copy_context().run, in_context, func, *args)
+
+        with ThreadPoolExecutor(max_workers=self.text_concurrency, thread_name_prefix='chapter-text') as text_pool, \
+                ThreadPoolExecutor(max_workers=self.audio_concurrency, thread_name_prefix='chapter-audio') as audio_pool:
+            text_futures = {
+                submit(text_pool, self.ai_service.generate_chapter_content, chapter): chapter
+                for chapter in chapters
+            }
+            audio_futures = {}
+            contents = {}
+            pending = set(text_futures)
+
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.cancelled():
+                        continue
+                    chapter = text_futures.get(future) or audio_futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        current_app.logger.error(f"Chapter {chapter['number']} failed: {str(e)}")
+                        if first_error is None:
+                            first_error = e
+                            for other in pending:
+                                other.cancel()
+                        continue
+
+                    if future in text_futures:
+                        if first_error is not None:
+                            continue
+                        contents[chapter['number']] = result
+                        audio_future = submit(
+                            audio_pool, self.audio_service.generate_chapter_audio,
+                            result, chapter['number'], self.audiobook_id
+                        )
+                        audio_futures[audio_future] = chapter
+                        pending.add(audio_future)
+                    else:
+                        results[chapter['number']] = result
+                        current_app.logger.info(f"Chapter {chapter['number']} finished ({len(results)}/{len(chapters)})")
+                        if on_chapter_done:
+                            try:
+                                on_chapter_done(chapter, contents[chapter['number']], result)
+                            except Exception as e:
+                                # Stop as for a failed chapter, e.g. when the job's lease was lost
+                                if first_error is None:
+                                    first_error = e
+                                    for other in pending:
+                                        other.cancel()
+
+        if first_error is not None:
+            raise first_error
+        return {str(chapter['number']): results[chapter['number']] for chapter in chapters}
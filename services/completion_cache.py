@@ -0,0 +1,111 @@
+from flask import current_app
+from models import CompletionCacheEntry, db
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import hashlib
+import json
+import threading
+
+# Per-process front for the database table, so repeat calls skip the round trip
+_memory = OrderedDict()
+_memory_lock = threading.Lock()
+_MEMORY_SIZE = 256
+# How often a key served from memory refreshes its row's last_used_at, so
+# pruning sees it as recently used without a write per hit
+_TOUCH_INTERVAL = timedelta(seconds=60)
+
+class CompletionCache:
+    """Opt-in cache of chat completion results, stored in the app database.
+
+    Entries are keyed on the model, messages and sampling parameters and
+    expire after ``LLM_CACHE_TTL_SECONDS``. When the table grows past
+    ``LLM_CACHE_MAX_ENTRIES``, the least recently used rows are removed.
+    Reads and writes use their own session, so they never commit a caller's
+    unfinished work.
+    """
+
+    def __init__(self):
+        self.ttl = timedelta(seconds=current_app.config['LLM_CACHE_TTL_SECONDS'])
+        self.max_entries = current_app.config['LLM_CACHE_MAX_ENTRIES']
+
+    @staticmethod
+    def key(model, messages, **params):
+        payload = json.dumps({'model': model, 'messages': messages, 'params': params}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        now = datetime.utcnow()
+        touch = False
+        with _memory_lock:
+            cached = _memory.get(key)
+            if cached is not None:
+                content, expires_at, touched_at = cached
+                if expires_at > now:
+                    _memory.move_to_end(key)
+                    if now - touched_at >= _TOUCH_INTERVAL:
+                        _memory[key] = (content, expires_at, now)
+                        touch = True
+                else:
+                    del _memory[key]
+                    cached = None
+        if cached is not None:
+            if touch:
+                self._touch(key, now)
+            return content
+
+        with Session(db.engine) as session:
+            entry = session.get(CompletionCacheEntry, key)
+            if entry is None or entry.expires_at <= now:
+                return None
+            entry.last_used_at = now
+            content, expires_at = entry.content, entry.expires_at
+            session.commit()
+
+        self._remember(key, content, expires_at)
+        return content
+
+    def set(self, key, model, content):
+        now = datetime.utcnow()
+        expires_at = now + self.ttl
+        with Session(db.engine) as session:
+            entry = session.get(CompletionCacheEntry, key)
+            if entry is None:
+                entry = CompletionCacheEntry(key=key, model=model)
+                session.add(entry)
+            entry.content = content
+            entry.created_at = now
+            entry.last_used_at = now
+            entry.expires_at = expires_at
+            try:
+                session.commit()
+            except IntegrityError:
+                # Another worker stored the same completion first
+                session.rollback()
+            else:
+                self._prune(session, now)
+
+        self._remember(key, content, expires_at)
+
+    def _touch(self, key, now):
+        with Session(db.engine) as session:
+            session.execute(update(CompletionCacheEntry).where(CompletionCacheEntry.key == key)
+                            .values(last_used_at=now))
+            session.commit()
+
+    def _prune(self, session, now):
+        session.execute(delete(CompletionCacheEntry).where(CompletionCacheEntry.expires_at <= now))
+        count = session.scalar(select(func.count()).select_from(CompletionCacheEntry))
+        if count > self.max_entries:
+            oldest = select(CompletionCacheEntry.key).order_by(CompletionCacheEntry.last_used_at).limit(count - self.max_entries)
+            session.execute(delete(CompletionCacheEntry).where(CompletionCacheEntry.key.in_(oldest)))
+        session.commit()
+
+    def _remember(self, key, content, expires_at):
+        with _memory_lock:
+            _memory[key] = (content, expires_at, datetime.utcnow())
+            _memory.move_to_end(key)
+            while len(_memory) > _MEMORY_SIZE:
+                _memory.popitem(last=False)
@@ -0,0 +1,153 @@
+"""HLS packaging of chapter audio.
+
+Each chapter MP3 is cut at frame boundaries into segments of about
+``HLS_SEGMENT_SECONDS``, without re-encoding. The segments are packed audio
+in the HLS sense: plain MP3 frames that start with an ID3 PRIV timestamp.
+A chapter's segments and media playlist go in a directory named after a
+digest of its audio, so their URLs never change content and can be cached
+forever. Each audiobook also gets a ``book.m3u8`` covering every chapter
+and a ``master.m3u8`` that points to it. Those two are rewritten whenever
+chapters change.
+"""
+from services import mp3
+import hashlib
+import math
+import os
+import shutil
+import tempfile
+
+PLAYLIST = 'index.m3u8'
+BOOK_PLAYLIST = 'book.m3u8'
+MASTER_PLAYLIST = 'master.m3u8'
+# Playlists that change when the audiobook is regenerated; everything else is immutable
+MUTABLE_FILES = (BOOK_PLAYLIST, MASTER_PLAYLIST)
+
+_TIMESTAMP_OWNER = b'com.apple.streaming.transportStreamTimestamp\x00'
+
+def segment_chapter(mp3_path, hls_dir, name, target_seconds):
+    """Package one chapter and return its playlist path relative to ``hls_dir``.
+
+    The chapter is read once. Its segments are written to a temporary
+    directory that is renamed to ``<name>-<digest>`` at the end. If that
+    directory already exists, the same audio was packaged before and it is
+    reused.
+    """
+    os.makedirs(hls_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix='.hls-', dir=hls_dir)
+    digest = hashlib.sha256()
+    durations = []
+    segment = None
+    seconds = 0.0
+    try:
+        with open(mp3_path, 'rb') as f:
+            for header, frame in mp3.iter_frames(f):
+                if mp3.is_info_frame(header, frame):
+                    continue
+                if segment is None:
+                    segment = open(os.path.join(tmp_dir, _segment_name(len(durations))), 'wb')
+                    segment.write(_timestamp_tag(sum(durations)))
+                segment.write(frame)
+                digest.update(frame)
+                seconds += header.samples / header.sample_rate
+                if seconds >= target_seconds:
+                    segment.close()
+                    segment = None
+                    durations.append(seconds)
+                    seconds = 0.0
+        if segment is not None:
+            segment.close()
+            segment = None
+            durations.append(seconds)
+
+        _write_playlist(os.path.join(tmp_dir, PLAYLIST), [
+            [(duration, _segment_name(index)) for index, duration in enumerate(durations)]
+        ])
+        version = f"{name}-{digest.hexdigest()[:16]}"
+        if os.path.exists(os.path.join(hls_dir, version)):
+            shutil.rmtree(tmp_dir)
+        else:
+            os.rename(tmp_dir, os.path.join(hls_dir, version))
+        return f"{version}/{PLAYLIST}"
+    finally:
+        if segment is not None:
+            segment.close()
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def write_book_playlists(hls_dir, chapter_playlists):
+    """Write ``book.m3u8`` from the chapter playlists in order, plus ``master.m3u8``.
+
+    Directories no longer referenced by any chapter are removed.
+    """
+    chapters = []
+    peak_bandwidth = 0
+    for playlist in chapter_playlists:
+        version = os.path.dirname(playlist)
+        entries = []
+        for duration, uri in read_playlist(os.path.join(hls_dir, playlist)):
+            entries.append((duration, f"{version}/{uri}"))
+            if duration > 0:
+                size = os.path.getsize(os.path.join(hls_dir, version, uri))
+                peak_bandwidth = max(peak_bandwidth, math.ceil(size * 8 / duration))
+        chapters.append(entries)
+
+    _write_playlist(os.path.join(hls_dir, BOOK_PLAYLIST), chapters)
+    _write_atomic(os.path.join(hls_dir, MASTER_PLAYLIST), '\n'.join([
+        '#EXTM3U',
+        '#EXT-X-VERSION:3',
+        f'#EXT-X-STREAM-INF:BANDWIDTH={peak_bandwidth},CODECS="mp4a.40.34"',
+        BOOK_PLAYLIST,
+        ''
+    ]))
+
+    referenced = {os.path.dirname(playlist) for playlist in chapter_playlists}
+    for entry in os.listdir(hls_dir):
+        path = os.path.join(hls_dir, entry)
+        if os.path.isdir(path) and entry not in referenced and not entry.startswith('.hls-'):
+            shutil.rmtree(path, ignore_errors=True)
+
+def read_playlist(path):
+    """``(duration, uri)`` for each segment of a media playlist written here."""
+    entries = []
+    duration = None
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('#EXTINF:'):
+                duration = float(line[len('#EXTINF:'):].split(',')[0])
+            elif line and not line.startswith('#'):
+                entries.append((duration, line))
+    return entries
+
+def _write_playlist(path, chapters):
+    # One list of (duration, uri) per chapter; chapters after the first restart their timestamps
+    durations = [duration for entries in chapters for duration, _ in entries]
+    lines = [
+        '#EXTM3U',
+        '#EXT-X-VERSION:3',
+        f'#EXT-X-TARGETDURATION:{math.ceil(max(durations, default=0))}',
+        '#EXT-X-MEDIA-SEQUENCE:0',
+        '#EXT-X-PLAYLIST-TYPE:VOD',
+    ]
+    for index, entries in enumerate(chapters):
+        if index:
+            lines.append('#EXT-X-DISCONTINUITY')
+        for duration, uri in entries:
+            lines.append(f'#EXTINF:{duration:.3f},')
+            lines.append(uri)
+    lines.append('#EXT-X-ENDLIST')
+    _write_atomic(path, '\n'.join(lines) + '\n')
+
+def _write_atomic(path, text):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def _segment_name(index):
+    return f"segment_{index:05d}.mp3"
+
+def _timestamp_tag(seconds):
+    # Packed audio segments start with their 33-bit, 90 kHz presentation time
+    pts = round(seconds * 90000) & ((1 << 33) - 1)
+    return mp3.id3_tag([mp3.id3_frame('PRIV', _TIMESTAMP_OWNER + pts.to_bytes(8, 'big'))])
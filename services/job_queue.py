@@ -0,0 +1,293 @@
+from flask import current_app
+from models import Job, db
+from services.structured_logging import correlation
+from datetime import datetime, timedelta
+from sqlalchemy import or_, and_
+import asyncio
+import threading
+import traceback
+
+class LeaseLost(Exception):
+    """Raised by a handler that stopped because its job's lease was lost."""
+
+# job type -> (handler, on_failure)
+JOB_HANDLERS = {}
+# job type -> coroutine handler, for jobs run on an event loop (see async_jobs.py)
+ASYNC_JOB_HANDLERS = {}
+
+def register_handler(job_type, on_failure=None):
+    """Register a function that runs jobs of the given type.
+
+    The handler receives the job payload and the claimed job. ``on_failure``
+    is called with the payload once a job has used up all its attempts.
+    """
+    def decorator(func):
+        JOB_HANDLERS[job_type] = (func, on_failure)
+        return func
+    return decorator
+
+def register_async_handler(job_type):
+    """Register a coroutine function that runs jobs of the given type with ``run_async``.
+
+    It takes the same arguments as the sync handler, which must also be
+    registered; its ``on_failure`` is used for both.
+    """
+    def decorator(func):
+        ASYNC_JOB_HANDLERS[job_type] = func
+        return func
+    return decorator
+
+class JobQueue:
+    def __init__(self):
+        self.lease_seconds = current_app.config['JOB_LEASE_SECONDS']
+        self.max_attempts = current_app.config['JOB_MAX_ATTEMPTS']
+
+    def enqueue(self, job_type, payload, resource_id=None):
+        job = Job(
+            type=job_type,
+            resource_id=resource_id,
+            payload=payload,
+            status='queued',
+            attempts=0,
+            max_attempts=self.max_attempts
+        )
+        db.session.add(job)
+        db.session.commit()
+        current_app.logger.info(f"Enqueued {job_type} job {job.id}")
+        return job
+
+    def latest_for(self, resource_id):
+        return Job.query.filter_by(resource_id=resource_id).order_by(Job.created_at.desc()).first()
+
+    def active_for(self, resource_id, job_type=None):
+        """The queued or running job for ``resource_id``, if there is one."""
+        query = Job.query.filter(Job.resource_id == resource_id, Job.status.in_(('queued', 'running')))
+        if job_type is not None:
+            query = query.filter(Job.type == job_type)
+        return query.order_by(Job.created_at).first()
+
+    def _claimable(self, now):
+        # Queued jobs, plus running jobs whose worker stopped renewing its lease
+        return or_(
+            Job.status == 'queued',
+            and_(Job.status == 'running', Job.lease_expires_at < now)
+        )
+
+    def claim(self, worker_id, job_types=None):
+        """Claim the oldest runnable job for ``worker_id``, or return None.
+
+        The claim is a conditional UPDATE on the row's previous state, so two
+        workers racing for the same job can't both win it. ``job_types``
+        limits the claim to jobs of those types.
+        """
+        self.reap_expired()
+        now = datetime.utcnow()
+        candidates = Job.query.with_entities(Job.id).filter(
+            self._claimable(now),
+            Job.attempts < Job.max_attempts
+        )
+        if job_types is not None:
+            candidates = candidates.filter(Job.type.in_(job_types))
+        candidates = candidates.order_by(Job.created_at).limit(5)
+        if db.engine.dialect.name == 'postgresql':
+            candidates = candidates.with_for_update(skip_locked=True)
+
+        for (job_id,) in candidates.all():
+            claimed = Job.query.filter(
+                Job.id == job_id,
+                self._claimable(now),
+                Job.attempts < Job.max_attempts
+            ).update({
+                Job.status: 'running',
+                Job.locked_by: worker_id,
+                Job.lease_expires_at: now + timedelta(seconds=self.lease_seconds),
+                Job.attempts: Job.attempts + 1
+            }, synchronize_session=False)
+            db.session.commit()
+            if claimed:
+                job = db.session.get(Job, job_id)
+                current_app.logger.info(f"Worker {worker_id} claimed job {job.id} (attempt {job.attempts})")
+                return job
+
+        db.session.commit()
+        return None
+
+    def reap_expired(self):
+        """Fail jobs whose lease expired on their final attempt."""
+        now = datetime.utcnow()
+        expired = Job.query.filter(
+            Job.status == 'running',
+            Job.lease_expires_at < now,
+            Job.attempts >= Job.max_attempts
+        ).all()
+        for job in expired:
+            current_app.logger.error(f"Job {job.id} lost its lease on the final attempt")
+            self._mark_failed(job, 'Worker stopped responding')
+        if expired:
+            db.session.commit()
+
+    def extend_lease(self, job_id, worker_id):
+        extended = Job.query.filter_by(id=job_id, locked_by=worker_id, status='running').update({
+            Job.lease_expires_at: datetime.utcnow() + timedelta(seconds=self.lease_seconds)
+        }, synchronize_session=False)
+        db.session.commit()
+        return bool(extended)
+
+    def complete(self, job, worker_id):
+        """Mark ``job`` completed if ``worker_id`` still holds its lease.
+
+        Returns False, dropping the result, if the lease expired and the job
+        was reclaimed or reaped in the meantime.
+        """
+        completed = self._finish(job, worker_id, {
+            Job.status: 'completed',
+            Job.completed_at: datetime.utcnow(),
+            Job.lease_expires_at: None,
+            Job.last_error: None
+        })
+        db.session.commit()
+        return completed
+
+    def fail(self, job, error, worker_id, final=False):
+        """Requeue ``job``, or fail it for good on its last attempt or if ``final``.
+
+        Like ``complete``, does nothing and returns False if ``worker_id``
+        no longer holds the lease.
+        """
+        requeue = not final and job.attempts < job.max_attempts
+        values = {Job.lease_expires_at: None, Job.last_error: error}
+        if requeue:
+            values.update({Job.status: 'queued', Job.locked_by: None})
+        else:
+            values.update({Job.status: 'failed', Job.attempts: Job.max_attempts})
+        if not self._finish(job, worker_id, values):
+            db.session.commit()
+            return False
+
+        if requeue:
+            current_app.logger.warning(f"Job {job.id} failed on attempt {job.attempts}, requeueing: {error}")
+        else:
+            current_app.logger.error(f"Job {job.id} failed permanently: {error}")
+            self._run_failure_hook(job)
+        db.session.commit()
+        return True
+
+    def _finish(self, job, worker_id, values):
+        # Conditional on the lease, like extend_lease, so a worker that lost
+        # it can't overwrite the state set by the job's new owner
+        finished = Job.query.filter_by(id=job.id, locked_by=worker_id, status='running').update(
+            values, synchronize_session=False)
+        if not finished:
+            current_app.logger.warning(f"Worker {worker_id} no longer holds the lease on job {job.id}; "
+                                       f"dropping its result")
+        return bool(finished)
+
+    def _mark_failed(self, job, error):
+        job.status = 'failed'
+        job.lease_expires_at = None
+        job.last_error = error
+        self._run_failure_hook(job)
+
+    def _run_failure_hook(self, job):
+        _, on_failure = JOB_HANDLERS.get(job.type, (None, None))
+        if on_failure:
+            try:
+                on_failure(job.payload)
+            except Exception as e:
+                current_app.logger.error(f"Failure hook for job {job.id} raised: {str(e)}")
+
+    def run(self, job, worker_id):
+        """Run ``job`` with its handler, renewing the lease while it runs.
+
+        ``job.lease_lost`` is set if the lease can't be renewed because
+        another worker took the job over. Long handlers should check it and
+        stop, for example by raising ``LeaseLost``; whatever they return is
+        dropped either way.
+        """
+        handler, _ = JOB_HANDLERS.get(job.type, (None, None))
+        if handler is None:
+            self.fail(job, f"No handler registered for job type '{job.type}'", worker_id, final=True)
+            return
+
+        job.lease_lost = threading.Event()
+        stop_heartbeat = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._heartbeat,
+            args=(current_app._get_current_object(), job.id, worker_id, stop_heartbeat, job.lease_lost),
+            daemon=True
+        )
+        heartbeat.start()
+        with correlation(f"job-{job.id}"):
+            try:
+                handler(job.payload, job)
+            except Exception:
+                db.session.rollback()
+                self.fail(job, traceback.format_exc(), worker_id)
+            else:
+                self.complete(job, worker_id)
+            finally:
+                stop_heartbeat.set()
+                heartbeat.join()
+
+    async def run_async(self, job, worker_id):
+        """``run`` for jobs with an async handler, on the running event loop.
+
+        Database work runs in worker threads. The lease is renewed by a
+        task with its own app context, and ``job.lease_lost`` is set as in
+        ``run``.
+        """
+        handler = ASYNC_JOB_HANDLERS.get(job.type)
+        if handler is None:
+            await asyncio.to_thread(self.fail, job, f"No async handler registered for job type '{job.type}'",
+                                    worker_id, final=True)
+            return
+
+        job.lease_lost = threading.Event()
+        heartbeat = asyncio.create_task(self._heartbeat_async(
+            current_app._get_current_object(), job.id, worker_id, job.lease_lost
+        ))
+        with correlation(f"job-{job.id}"):
+            try:
+                await handler(job.payload, job)
+            except Exception:
+                await asyncio.to_thread(db.session.rollback)
+                await asyncio.to_thread(self.fail, job, traceback.format_exc(), worker_id)
+            else:
+                await asyncio.to_thread(self.complete, job, worker_id)
+            finally:
+                heartbeat.cancel()
+                await asyncio.gather(heartbeat, return_exceptions=True)
+
+    async def _heartbeat_async(self, app, job_id, worker_id, lease_lost):
+        interval = max(1, self.lease_seconds // 3)
+        while True:
+            await asyncio.sleep(interval)
+            if not await asyncio.to_thread(self._renew_in_context, app, job_id, worker_id):
+                lease_lost.set()
+                return
+
+    def _renew_in_context(self, app, job_id, worker_id):
+        # A context of its own, so renewals don't share the handler's session
+        with app.app_context():
+            try:
+                if self.extend_lease(job_id, worker_id):
+                    return True
+                app.logger.warning(f"Worker {worker_id} no longer holds the lease on job {job_id}")
+                return False
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f"Lease renewal failed for job {job_id}: {str(e)}")
+                return True
+
+    def _heartbeat(self, app, job_id, worker_id, stop, lease_lost):
+        with app.app_context():
+            interval = max(1, self.lease_seconds // 3)
+            while not stop.wait(interval):
+                try:
+                    if not self.extend_lease(job_id, worker_id):
+                        app.logger.warning(f"Worker {worker_id} no longer holds the lease on job {job_id}")
+                        lease_lost.set()
+                        return
+                except Exception as e:
+                    db.session.rollback()
+                    app.logger.error(f"Lease renewal failed for job {job_id}: {str(e)}")
@@ -0,0 +1,177 @@
+"""Prometheus metrics for requests, SQL and OpenAI calls, served at ``/metrics``.
+
+Each request records its latency, plus the number and total time of the SQL
+statements it ran and the time it spent waiting on the LLM and TTS. These are
+labelled by blueprint and endpoint, so a slow p99 can be traced to the
+database, the LLM or TTS. Service calls are also recorded on their own,
+including those made by background workers. The TTS audio cache counts its
+hits, misses and evictions, and the synthesis time and cost its hits saved.
+
+When several processes serve the app (or workers run alongside it), set
+``PROMETHEUS_MULTIPROC_DIR`` to a shared, empty directory so ``/metrics``
+reports all of them.
+"""
+from flask import g, has_request_context, request, Response
+from functools import wraps
+from prometheus_client import CollectorRegistry, Counter, Histogram, REGISTRY, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import multiprocess
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import inspect
+import os
+import time
+
+REQUEST_LABELS = ['blueprint', 'endpoint']
+SERVICE_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Time to handle a request',
+    REQUEST_LABELS + ['method', 'status'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+)
+REQUEST_SQL_STATEMENTS = Histogram(
+    'http_request_sql_statements', 'SQL statements run by a request',
+    REQUEST_LABELS, buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+)
+REQUEST_SQL_SECONDS = Histogram(
+    'http_request_sql_duration_seconds', 'Total time a request spent in SQL statements',
+    REQUEST_LABELS, buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+REQUEST_SERVICE_SECONDS = Histogram(
+    'http_request_service_duration_seconds', 'Total time a request spent waiting on the LLM or TTS',
+    REQUEST_LABELS + ['service'], buckets=SERVICE_BUCKETS
+)
+SERVICE_CALL_SECONDS = Histogram(
+    'service_call_duration_seconds', 'Duration of AIService and AudioService calls',
+    ['service', 'operation', 'outcome'], buckets=SERVICE_BUCKETS
+)
+PROMPT_RESPONSES_TOKENS = Histogram(
+    'llm_prompt_responses_tokens', 'Tokens of questionnaire responses in outline prompts, before and after trimming',
+    ['stage'], buckets=(100, 250, 500, 1000, 2000, 4000, 6000, 8000, 16000, 32000, 64000)
+)
+TTS_CACHE_LOOKUPS = Counter('tts_cache_lookups_total', 'Audio cache lookups', ['result'])
+TTS_CACHE_EVICTIONS = Counter('tts_cache_evictions_total', 'Audio cache entries evicted to stay under the disk budget')
+TTS_CACHE_EVICTED_BYTES = Counter('tts_cache_evicted_bytes_total', 'Bytes of audio evicted from the cache')
+TTS_CACHE_SAVED_CHARS = Counter('tts_cache_saved_characters_total', 'Characters not sent to TTS thanks to cache hits')
+TTS_CACHE_SAVED_SECONDS = Counter('tts_cache_saved_seconds_total',
+                                  'Synthesis time the cached entries took, saved by cache hits')
+TTS_CACHE_SAVED_COST = Counter('tts_cache_saved_cost_dollars_total',
+                               'TTS cost of the characters saved by cache hits, at TTS_COST_PER_MILLION_CHARS')
+
+def init_app(app):
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.add_url_rule('/metrics', 'metrics', _metrics_view)
+
+def instrument(service, operation):
+    """Time a service method as ``service``/``operation`` ('llm' or 'tts').
+
+    Generator methods are timed across the whole iteration, so a streamed
+    outline counts the time spent waiting on every chunk. Coroutines and
+    async generators are timed the same way.
+    """
+    def decorator(func):
+        if inspect.isasyncgenfunction(func):
+            @wraps(func)
+            async def async_generator_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                outcome = 'error'
+                try:
+                    async for item in func(*args, **kwargs):
+                        yield item
+                    outcome = 'ok'
+                finally:
+                    _observe_call(service, operation, outcome, time.perf_counter() - started)
+            return async_generator_wrapper
+
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def coroutine_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                outcome = 'error'
+                try:
+                    result = await func(*args, **kwargs)
+                    outcome = 'ok'
+                    return result
+                finally:
+                    _observe_call(service, operation, outcome, time.perf_counter() - started)
+            return coroutine_wrapper
+
+        if inspect.isgeneratorfunction(func):
+            @wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                outcome = 'error'
+                try:
+                    yield from func(*args, **kwargs)
+                    outcome = 'ok'
+                finally:
+                    _observe_call(service, operation, outcome, time.perf_counter() - started)
+            return generator_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            outcome = 'error'
+            try:
+                result = func(*args, **kwargs)
+                outcome = 'ok'
+                return result
+            finally:
+                _observe_call(service, operation, outcome, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+def _observe_call(service, operation, outcome, seconds):
+    SERVICE_CALL_SECONDS.labels(service, operation, outcome).observe(seconds)
+    # Calls made from pipeline threads have no request and aren't attributed to one
+    if has_request_context() and 'metrics_services' in g:
+        g.metrics_services[service] = g.metrics_services.get(service, 0.0) + seconds
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['metrics_started'].pop()
+    if has_request_context() and 'metrics_sql_seconds' in g:
+        g.metrics_sql_statements += 1
+        g.metrics_sql_seconds += time.perf_counter() - started
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(context):
+    # after_cursor_execute doesn't run for failed statements
+    if context.connection is not None:
+        started = context.connection.info.get('metrics_started')
+        if started:
+            started.pop()
+
+def _start_request():
+    g.metrics_started = time.perf_counter()
+    g.metrics_sql_statements = 0
+    g.metrics_sql_seconds = 0.0
+    g.metrics_services = {}
+
+def _finish_request(response):
+    # Streamed responses are measured up to the point their body starts
+    if 'metrics_started' not in g:
+        return response
+    blueprint = request.blueprint or ''
+    endpoint = request.endpoint or 'not_found'
+    REQUEST_LATENCY.labels(blueprint, endpoint, request.method, response.status_code).observe(
+        time.perf_counter() - g.metrics_started
+    )
+    REQUEST_SQL_STATEMENTS.labels(blueprint, endpoint).observe(g.metrics_sql_statements)
+    REQUEST_SQL_SECONDS.labels(blueprint, endpoint).observe(g.metrics_sql_seconds)
+    for service, seconds in g.metrics_services.items():
+        REQUEST_SERVICE_SECONDS.labels(blueprint, endpoint, service).observe(seconds)
+    return response
+
+def _metrics_view():
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,225 @@
+"""MP3 frame parsing helpers.
+
+Works directly on MPEG audio frame headers so chapter audio can be joined,
+timed and tagged without decoding or re-encoding it.
+"""
+from collections import namedtuple
+
+FrameHeader = namedtuple('FrameHeader', [
+    'version', 'layer', 'bitrate', 'sample_rate', 'padding', 'channel_mode', 'frame_length', 'samples'
+])
+
+# MPEG version bits -> version
+_VERSIONS = {0: 2.5, 2: 2, 3: 1}
+# Layer bits -> layer
+_LAYERS = {1: 3, 2: 2, 3: 1}
+
+_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+
+_SAMPLE_RATES = {
+    1: [44100, 48000, 32000],
+    2: [22050, 24000, 16000],
+    2.5: [11025, 12000, 8000],
+}
+
+MONO = 3
+
+def parse_frame_header(data):
+    """Parse a 4-byte MPEG audio frame header, or return None if it isn't one."""
+    if len(data) < 4 or data[0] != 0xFF or (data[1] & 0xE0) != 0xE0:
+        return None
+
+    version = _VERSIONS.get((data[1] >> 3) & 0x03)
+    layer = _LAYERS.get((data[1] >> 1) & 0x03)
+    bitrate_index = data[2] >> 4
+    sample_rate_index = (data[2] >> 2) & 0x03
+    if version is None or layer is None or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    bitrate = _BITRATES[(1 if version == 1 else 2, layer)][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][sample_rate_index]
+    padding = (data[2] >> 1) & 0x01
+    channel_mode = data[3] >> 6
+
+    if layer == 1:
+        samples = 384
+        frame_length = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples = 1152 if (layer == 2 or version == 1) else 576
+        frame_length = (samples // 8) * bitrate // sample_rate + padding
+
+    return FrameHeader(version, layer, bitrate, sample_rate, padding, channel_mode, frame_length, samples)
+
+def id3v2_size(data):
+    """Return the total size of an ID3v2 tag starting at ``data``, or 0."""
+    if len(data) < 10 or data[:3] != b'ID3':
+        return 0
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    has_footer = data[5] & 0x10
+    return 10 + size + (10 if has_footer else 0)
+
+def xing_offset(header):
+    """Offset of a Xing/Info tag inside a layer III frame with this header."""
+    if header.version == 1:
+        side_info = 17 if header.channel_mode == MONO else 32
+    else:
+        side_info = 9 if header.channel_mode == MONO else 17
+    return 4 + side_info
+
+def is_info_frame(header, frame):
+    """True if the frame carries a Xing, Info or VBRI tag instead of audio."""
+    if header.layer != 3:
+        return False
+    offset = xing_offset(header)
+    return frame[offset:offset + 4] in (b'Xing', b'Info') or frame[36:40] == b'VBRI'
+
+def info_frame_count(header, frame):
+    """Number of audio frames declared by a Xing/Info or VBRI frame, or None."""
+    offset = xing_offset(header)
+    if frame[offset:offset + 4] in (b'Xing', b'Info'):
+        flags = int.from_bytes(frame[offset + 4:offset + 8], 'big')
+        if flags & 0x01 and len(frame) >= offset + 12:
+            return int.from_bytes(frame[offset + 8:offset + 12], 'big')
+        return None
+    if frame[36:40] == b'VBRI' and len(frame) >= 54:
+        return int.from_bytes(frame[50:54], 'big')
+    return None
+
+def iter_frames(fileobj, chunk_size=64 * 1024):
+    """Yield ``(header, frame_bytes)`` for each audio frame in ``fileobj``.
+
+    Reads in chunks so memory stays bounded regardless of file size. ID3v2
+    tags, a trailing ID3v1 tag and any junk between frames are skipped.
+    """
+    buffer = bytearray()
+    eof = False
+    position = 0
+
+    def fill(size):
+        nonlocal eof
+        while not eof and len(buffer) - position < size:
+            chunk = fileobj.read(chunk_size)
+            if not chunk:
+                eof = True
+            else:
+                buffer.extend(chunk)
+        return len(buffer) - position >= size
+
+    while fill(4):
+        # Compact the buffer once the consumed prefix grows large
+        if position > chunk_size:
+            del buffer[:position]
+            position = 0
+
+        head = bytes(buffer[position:position + 10])
+        if head[:3] == b'ID3' and fill(10):
+            tag_size = id3v2_size(bytes(buffer[position:position + 10]))
+            fill(tag_size)
+            position += min(tag_size, len(buffer) - position)
+            continue
+        if head[:3] == b'TAG' and not fill(129) and len(buffer) - position == 128:
+            break  # ID3v1 tag at the end of the file
+
+        header = parse_frame_header(head[:4])
+        if header is None or header.frame_length < 4:
+            position += 1  # Resync on the next byte
+            continue
+        if not fill(header.frame_length):
+            break  # Truncated final frame
+        frame = bytes(buffer[position:position + header.frame_length])
+        position += header.frame_length
+        yield header, frame
+
+def append_frames(path, out):
+    """Append the audio frames of the MP3 at ``path`` to the open file ``out``.
+
+    Tags and Xing/Info frames are dropped, since their frame counts would be
+    wrong for the joined stream. Nothing is decoded. Returns the number of
+    frames written.
+    """
+    frames = 0
+    with open(path, 'rb') as part:
+        for header, frame in iter_frames(part):
+            if is_info_frame(header, frame):
+                continue
+            out.write(frame)
+            frames += 1
+    return frames
+
+def duration(path):
+    """Playing time of the MP3 at ``path`` in seconds.
+
+    Uses the frame count of a leading Xing/Info or VBRI frame when there is
+    one; otherwise every frame header is read and their samples added up.
+    """
+    seconds = 0.0
+    with open(path, 'rb') as f:
+        for header, frame in iter_frames(f):
+            if is_info_frame(header, frame):
+                frames = info_frame_count(header, frame)
+                if frames is not None and seconds == 0.0:
+                    return frames * header.samples / header.sample_rate
+                continue
+            seconds += header.samples / header.sample_rate
+    return seconds
+
+def chapter_tag(title, chapters):
+    """An ID3v2.3 tag with a ``CTOC`` table of contents and a ``CHAP`` frame per chapter.
+
+    ``chapters`` is a list of ``(title, start_seconds, end_seconds)``.
+    """
+    if len(chapters) > 255:
+        raise ValueError("An ID3 table of contents holds at most 255 chapters")
+    element_ids = [f"chp{index}".encode('ascii') for index in range(len(chapters))]
+    frames = [_text_frame('TIT2', title)] if title else []
+    frames.append(id3_frame('CTOC', b'toc\x00' + bytes([0x03, len(chapters)])
+                            + b''.join(element_id + b'\x00' for element_id in element_ids)))
+    for element_id, (chapter_title, start, end) in zip(element_ids, chapters):
+        frames.append(id3_frame('CHAP', element_id + b'\x00'
+                                + round(start * 1000).to_bytes(4, 'big')
+                                + round(end * 1000).to_bytes(4, 'big')
+                                + b'\xff' * 8  # byte offsets not used
+                                + _text_frame('TIT2', chapter_title)))
+    return id3_tag(frames)
+
+def write_book(output_path, title, chapters):
+    """Write ``chapters`` into one MP3 that starts with an ID3 chapter tag.
+
+    ``chapters`` is a list of ``(title, path, seconds)``. Chapter times come
+    from the given durations, so the tag is written up front and the audio
+    is then streamed in one pass with constant memory. Returns the total
+    duration in seconds.
+    """
+    markers = []
+    start = 0.0
+    for chapter_title, _, seconds in chapters:
+        markers.append((chapter_title, start, start + seconds))
+        start += seconds
+    with open(output_path, 'wb') as out:
+        out.write(chapter_tag(title, markers))
+        for _, path, _ in chapters:
+            append_frames(path, out)
+    return start
+
+def id3_tag(frames):
+    """An ID3v2.3 tag holding the given encoded frames."""
+    body = b''.join(frames)
+    return b'ID3\x03\x00\x00' + _syncsafe(len(body)) + body
+
+def id3_frame(frame_id, body):
+    """One encoded ID3v2.3 frame."""
+    return frame_id.encode('ascii') + len(body).to_bytes(4, 'big') + b'\x00\x00' + body
+
+def _text_frame(frame_id, text):
+    # Encoding 1 is UTF-16 with a byte order mark
+    return id3_frame(frame_id, b'\x01' + text.encode('utf-16') + b'\x00\x00')
+
+def _syncsafe(size):
+    return bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F])
@@ -0,0 +1,144 @@
+"""Process-wide OpenAI client shared by AIService and AudioService.
+
+Building an ``openai.OpenAI`` per request throws away its HTTP connection
+pool, so services get one pooled keep-alive client per process from here.
+The async services get one ``openai.AsyncOpenAI`` per event loop. API key
+verification also runs once per process and its result is cached.
+
+``openai`` and ``httpx`` are imported when the first client is built, not
+with this module, so processes that never call OpenAI don't load them.
+"""
+import asyncio
+from flask import current_app
+from tenacity import retry, stop_after_attempt, wait_random_exponential, retry_if_exception
+import contextvars
+import os
+import sys
+import threading
+import time
+
+_attempt = contextvars.ContextVar('openai_attempt', default=1)
+
+def _note_attempt(retry_state):
+    _attempt.set(retry_state.attempt_number)
+
+def current_attempt():
+    """Attempt number of the ``openai_retry`` call running in this context."""
+    return _attempt.get()
+
+def _retryable(exception):
+    # Only a loaded openai can have raised one of its errors
+    openai = sys.modules.get('openai')
+    return openai is not None and isinstance(exception, (openai.RateLimitError, openai.APIError))
+
+# Retry policy for OpenAI calls. The randomized backoff keeps workers that
+# failed together from retrying together.
+openai_retry = retry(stop=stop_after_attempt(3),
+                     wait=wait_random_exponential(multiplier=1, min=4, max=10),
+                     retry=retry_if_exception(_retryable),
+                     before=_note_attempt,
+                     reraise=True)
+
+_lock = threading.Lock()
+_clients = {}        # api key -> openai.OpenAI
+_async_clients = {}  # (api key, event loop) -> openai.AsyncOpenAI
+_verified = {}       # api key -> monotonic time of the last successful verification
+_pid = os.getpid()
+
+def _reset():
+    """Forget clients inherited from a parent process; their sockets are shared."""
+    global _lock, _pid
+    _lock = threading.Lock()
+    _clients.clear()
+    _async_clients.clear()
+    _verified.clear()
+    _pid = os.getpid()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset)
+
+def _check_pid():
+    # Backstop for fork paths that skip the at-fork hooks
+    if os.getpid() != _pid:
+        _reset()
+
+def get_client():
+    _check_pid()
+    api_key = current_app.config['OPENAI_API_KEY']
+    client = _clients.get(api_key)
+    if client is not None:
+        return client
+
+    with _lock:
+        client = _clients.get(api_key)
+        if client is None:
+            import httpx
+            import openai
+            client = openai.OpenAI(
+                api_key=api_key,
+                http_client=openai.DefaultHttpxClient(
+                    limits=httpx.Limits(
+                        max_connections=current_app.config['OPENAI_MAX_CONNECTIONS'],
+                        max_keepalive_connections=current_app.config['OPENAI_MAX_KEEPALIVE_CONNECTIONS'],
+                        keepalive_expiry=60
+                    )
+                )
+            )
+            _clients[api_key] = client
+            current_app.logger.info(f"Created pooled OpenAI client for process {os.getpid()}")
+    return client
+
+def get_async_client():
+    """Pooled ``AsyncOpenAI`` client for the running event loop."""
+    _check_pid()
+    api_key = current_app.config['OPENAI_API_KEY']
+    # httpx async pools belong to the loop that created them
+    key = (api_key, asyncio.get_running_loop())
+    client = _async_clients.get(key)
+    if client is None:
+        import httpx
+        import openai
+        client = openai.AsyncOpenAI(
+            api_key=api_key,
+            http_client=openai.DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=current_app.config['OPENAI_ASYNC_MAX_CONNECTIONS'],
+                    max_keepalive_connections=current_app.config['OPENAI_MAX_KEEPALIVE_CONNECTIONS'],
+                    keepalive_expiry=60
+                )
+            )
+        )
+        _async_clients[key] = client
+        current_app.logger.info(f"Created pooled async OpenAI client for process {os.getpid()}")
+    return client
+
+def verify_api_key(force=False):
+    """Check the configured API key, at most once per ``OPENAI_VERIFY_TTL_SECONDS``.
+
+    Uses a model lookup rather than a completion, so verification costs no
+    tokens. Raises the underlying OpenAI error on failure.
+    """
+    _check_pid()
+    api_key = current_app.config['OPENAI_API_KEY']
+    ttl = current_app.config['OPENAI_VERIFY_TTL_SECONDS']
+    verified_at = _verified.get(api_key)
+    if not force and verified_at is not None and time.monotonic() - verified_at < ttl:
+        return
+
+    get_client().models.retrieve(current_app.config['OPENAI_VERIFY_MODEL'])
+    _verified[api_key] = time.monotonic()
+    current_app.logger.info("OpenAI API key verification successful")
+
+def health_check():
+    """Verify connectivity right now and report the outcome instead of raising."""
+    started = time.monotonic()
+    try:
+        verify_api_key(force=True)
+        return {'ok': True, 'latency_ms': round((time.monotonic() - started) * 1000, 1)}
+    except Exception as e:
+        current_app.logger.error(f"OpenAI health check failed: {str(e)}")
+        return {
+            'ok': False,
+            'latency_ms': round((time.monotonic() - started) * 1000, 1),
+            'error': type(e).__name__
+        }
@@ -0,0 +1,81 @@
+import json
+
+class OutlineStreamParser:
+    """Incrementally parses a streamed outline JSON document.
+
+    Feed it text deltas as they arrive. ``feed`` returns events for the
+    parts of the outline that became complete: ``('title', str)`` once the
+    top-level title has been read, and ``('chapter', dict)`` for each object
+    in the top-level ``chapters`` array. Anything before the first ``{``
+    (such as a Markdown code fence) is ignored.
+    """
+
+    def __init__(self):
+        self.buffer = []
+        self.stack = []
+        self.in_string = False
+        self.escape = False
+        self.string_start = None
+        self.expect_key = False
+        self.current_key = None
+        self.in_chapters = False
+        self.chapter_start = None
+
+    def feed(self, text):
+        events = []
+        for char in text:
+            self._consume(char, events)
+        return events
+
+    def _consume(self, char, events):
+        if not self.buffer and char != '{':
+            return
+        self.buffer.append(char)
+
+        if self.in_string:
+            if self.escape:
+                self.escape = False
+            elif char == '\\':
+                self.escape = True
+            elif char == '"':
+                self.in_string = False
+                self._string_closed(events)
+            return
+
+        if char == '"':
+            self.in_string = True
+            self.string_start = len(self.buffer) - 1
+        elif char in '{[':
+            if char == '[' and len(self.stack) == 1 and self.current_key == 'chapters':
+                self.in_chapters = True
+            elif char == '{' and self.in_chapters and len(self.stack) == 2:
+                self.chapter_start = len(self.buffer) - 1
+            self.stack.append(char)
+            self.expect_key = char == '{'
+        elif char in '}]':
+            if self.stack:
+                self.stack.pop()
+            if char == '}' and self.chapter_start is not None and len(self.stack) == 2:
+                events.append(('chapter', json.loads(''.join(self.buffer[self.chapter_start:]))))
+                self.chapter_start = None
+            elif char == ']' and self.in_chapters and len(self.stack) == 1:
+                self.in_chapters = False
+        elif char == ',':
+            self.expect_key = bool(self.stack) and self.stack[-1] == '{'
+        elif char == ':':
+            self.expect_key = False
+
+    def _string_closed(self, events):
+        # Only top-level keys and the title matter; chapter fields are parsed whole
+        if len(self.stack) != 1:
+            return
+        if self.expect_key:
+            self.current_key = json.loads(''.join(self.buffer[self.string_start:]))
+        elif self.current_key == 'title':
+            events.append(('title', json.loads(''.join(self.buffer[self.string_start:]))))
+
+    def result(self):
+        """Parse the whole document once the stream has finished."""
+        text = ''.join(self.buffer)
+        end = text.rfind('}')
+        return json.loads(text[:end + 1] if end != -1 else text)
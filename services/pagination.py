@@ -0,0 +1,48 @@
+"""Keyset (cursor) pagination for list views, newest first.
+
+Pages are ordered by ``created_at DESC, id DESC`` and each page starts
+after the last row of the previous one, so the database walks an index
+instead of counting past an ``OFFSET``. Fetching page N costs the same no
+matter how large the table is.
+"""
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import tuple_
+import base64
+
+DEFAULT_PER_PAGE = 20
+MAX_PER_PAGE = 100
+
+Page = namedtuple('Page', ['items', 'next_cursor'])
+
+def encode_cursor(item):
+    raw = f"{item.created_at.isoformat()}|{item.id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """Return ``(created_at, id)`` from a cursor, or ``None`` if it is malformed."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        created_at, item_id = raw.split('|', 1)
+        return datetime.fromisoformat(created_at), item_id
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+def paginate(query, model, cursor=None, per_page=DEFAULT_PER_PAGE):
+    """Return the page of ``query`` that follows ``cursor``.
+
+    A malformed cursor is treated as no cursor, which yields the first page.
+    """
+    per_page = max(1, min(per_page or DEFAULT_PER_PAGE, MAX_PER_PAGE))
+    position = decode_cursor(cursor)
+    if position is not None:
+        created_at, item_id = position
+        # A row-value comparison lets the (created_at, id) index seek straight to the cursor
+        query = query.filter(tuple_(model.created_at, model.id) < tuple_(created_at, item_id))
+
+    # One extra row tells us whether there is a next page
+    items = query.order_by(model.created_at.desc(), model.id.desc()).limit(per_page + 1).all()
+    next_cursor = encode_cursor(items[per_page - 1]) if len(items) > per_page else None
+    return Page(items[:per_page], next_cursor)
@@ -0,0 +1,139 @@
+"""Compact, token-budgeted questionnaire responses for outline prompts.
+
+Responses are serialized as compact JSON, with empty answers dropped and runs
+of whitespace collapsed, then counted with the model's tokenizer. If they are
+still over ``OUTLINE_RESPONSES_TOKEN_BUDGET``, the least important text goes
+first:
+
+1. Long answers are cut short. All answers share one length cap, the largest
+   that fits the budget, so long answers keep their opening.
+2. If the cap reaches ``MIN_ANSWER_CHARS`` and the responses still don't fit,
+   answers are dropped from the end of the questionnaire.
+
+Token counts before and after trimming are logged and recorded in the
+``llm_prompt_responses_tokens`` histogram.
+"""
+from collections import namedtuple
+from flask import current_app
+from services.metrics import PROMPT_RESPONSES_TOKENS
+from services.rate_limiter import CHARS_PER_TOKEN
+import copy
+import json
+import re
+import threading
+import tiktoken
+
+MIN_ANSWER_CHARS = 80
+TRUNCATED = '…'
+
+BuiltResponses = namedtuple('BuiltResponses', ['text', 'tokens_before', 'tokens_after', 'truncated', 'dropped'])
+
+_encodings = {}  # model -> tiktoken Encoding, or None to estimate from characters
+_encodings_lock = threading.Lock()
+
+def count_tokens(text, model):
+    """Tokens in ``text`` for ``model``, estimated from its length if no tokenizer is available."""
+    encoding = _encoding(model)
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+def _encoding(model):
+    if model not in _encodings:
+        with _encodings_lock:
+            if model not in _encodings:
+                try:
+                    try:
+                        encoding = tiktoken.encoding_for_model(model)
+                    except KeyError:
+                        encoding = tiktoken.get_encoding('cl100k_base')
+                except Exception as e:
+                    # tiktoken downloads its tables on first use, which fails offline
+                    current_app.logger.warning(f"No tokenizer for {model}, estimating tokens from characters: {str(e)}")
+                    encoding = None
+                _encodings[model] = encoding
+    return _encodings[model]
+
+def build_responses(responses, model, budget=None):
+    """Serialize ``responses`` for a ``model`` prompt within ``budget`` tokens."""
+    budget = budget or current_app.config['OUTLINE_RESPONSES_TOKEN_BUDGET']
+    compacted = _compact(responses)
+    answers = list(_answers(compacted))
+    text = _dumps(compacted)
+    tokens_before = tokens = count_tokens(text, model)
+    truncated = dropped = 0
+
+    if tokens > budget:
+        fits = lambda cap, keep: count_tokens(_dumps(_trim(compacted, answers, cap, keep)), model) <= budget
+        longest = max((len(answer) for _, answer in answers), default=0)
+        if fits(MIN_ANSWER_CHARS, len(answers)):
+            # Largest cap that fits
+            low, high = MIN_ANSWER_CHARS, longest
+            while low < high:
+                middle = (low + high + 1) // 2
+                if fits(middle, len(answers)):
+                    low = middle
+                else:
+                    high = middle - 1
+            cap, keep = low, len(answers)
+        else:
+            # Most answers that fit at the minimum cap
+            low, high = 0, len(answers) - 1
+            while low < high:
+                middle = (low + high + 1) // 2
+                if fits(MIN_ANSWER_CHARS, middle):
+                    low = middle
+                else:
+                    high = middle - 1
+            cap, keep = MIN_ANSWER_CHARS, low
+        text = _dumps(_trim(compacted, answers, cap, keep))
+        tokens = count_tokens(text, model)
+        truncated = sum(1 for _, answer in answers[:keep] if len(answer) > cap)
+        dropped = len(answers) - keep
+        current_app.logger.warning(
+            f"Questionnaire responses were {tokens_before} tokens, over the {budget} token budget; "
+            f"trimmed to {tokens} tokens ({truncated} answers shortened, {dropped} dropped)"
+        )
+    else:
+        current_app.logger.info(f"Questionnaire responses are {tokens} tokens")
+
+    PROMPT_RESPONSES_TOKENS.labels('before').observe(tokens_before)
+    PROMPT_RESPONSES_TOKENS.labels('after').observe(tokens)
+    return BuiltResponses(text, tokens_before, tokens, truncated, dropped)
+
+def _compact(value):
+    if isinstance(value, dict):
+        compacted = {key: _compact(item) for key, item in value.items()}
+        return {key: item for key, item in compacted.items() if item not in (None, '', [], {})}
+    if isinstance(value, list):
+        return [item for item in map(_compact, value) if item not in (None, '', [], {})]
+    if isinstance(value, str):
+        return re.sub(r'\s+', ' ', value).strip()
+    return value
+
+def _answers(value, path=()):
+    # (path, text) of every string answer, in questionnaire order
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from _answers(item, path + (key,))
+    elif isinstance(value, list):
+        for index, item in enumerate(value):
+            yield from _answers(item, path + (index,))
+    elif isinstance(value, str):
+        yield path, value
+
+def _trim(compacted, answers, cap, keep):
+    trimmed = copy.deepcopy(compacted)
+    for index, (path, answer) in enumerate(answers):
+        *parents, last = path
+        container = trimmed
+        for key in parents:
+            container = container[key]
+        if index >= keep:
+            container[last] = None
+        elif len(answer) > cap:
+            container[last] = answer[:cap].rstrip() + TRUNCATED
+    return _compact(trimmed)
+
+def _dumps(value):
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False)
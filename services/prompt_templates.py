@@ -0,0 +1,117 @@
+"""Render the active outline and chapter ``PromptTemplate`` rows for AIService.
+
+Placeholders are written ``{name}`` and must be declared in the template's
+``variables``. Other braces, like the JSON example in an outline prompt,
+are left as they are. Compiled templates are cached per process, keyed on
+id and ``updated_at``, and the active template for each type is looked up
+at most once per ``PROMPT_TEMPLATE_TTL_SECONDS``, so a 20-chapter book
+reads and parses its chapter template once. Editing a prompt calls
+``invalidate()``; other processes see the edit when their lookup expires.
+"""
+from flask import current_app
+from models import PromptTemplate, db
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+import re
+import threading
+import time
+
+PLACEHOLDER = re.compile(r'\{([A-Za-z_][A-Za-z0-9_]*)\}')
+
+# Values AIService supplies when rendering each type of prompt
+VARIABLES = {
+    'outline': {'responses'},
+    'chapter': {'number', 'title', 'summary', 'key_points'},
+}
+
+_lock = threading.Lock()
+_compiled = {}  # template id -> (updated_at, CompiledPrompt or PromptTemplateError)
+_active = {}    # prompt type -> (expires at, (template id, updated_at) or None)
+
+class PromptTemplateError(ValueError):
+    pass
+
+class CompiledPrompt:
+    def __init__(self, content, variables):
+        # Literal text alternating with placeholder names
+        self.parts = PLACEHOLDER.split(content)
+        self.placeholders = set(self.parts[1::2])
+        undeclared = self.placeholders - set(variables or ())
+        if undeclared:
+            raise PromptTemplateError(f"Template uses undeclared variables: {', '.join(sorted(undeclared))}")
+
+    def render(self, **values):
+        missing = self.placeholders - values.keys()
+        if missing:
+            raise PromptTemplateError(f"No value for template variables: {', '.join(sorted(missing))}")
+        parts = list(self.parts)
+        parts[1::2] = [str(values[name]) for name in self.parts[1::2]]
+        return ''.join(parts)
+
+def validate(prompt_type, content, variables):
+    """Raise ``PromptTemplateError`` unless the template can be rendered as a ``prompt_type`` prompt."""
+    if prompt_type not in VARIABLES:
+        raise PromptTemplateError(f"Unknown prompt type '{prompt_type}', expected one of: {', '.join(sorted(VARIABLES))}")
+    compiled = CompiledPrompt(content, variables)
+    unavailable = compiled.placeholders - VARIABLES[prompt_type]
+    if unavailable:
+        raise PromptTemplateError(
+            f"{', '.join(sorted(unavailable))} not available in {prompt_type} prompts; "
+            f"use {', '.join(sorted(VARIABLES[prompt_type]))}"
+        )
+    return compiled
+
+def active(prompt_type):
+    """The compiled active template for ``prompt_type``, or None if there isn't one.
+
+    Raises ``PromptTemplateError`` if the active template doesn't compile.
+    """
+    now = time.monotonic()
+    entry = _active.get(prompt_type)
+    if entry is None or entry[0] <= now:
+        # A session of our own, so callers' transactions are left alone
+        with Session(db.engine) as session:
+            row = session.execute(
+                select(PromptTemplate.id, PromptTemplate.updated_at)
+                .where(PromptTemplate.type == prompt_type, PromptTemplate.is_active.is_(True))
+                .order_by(PromptTemplate.updated_at.desc(), PromptTemplate.created_at.desc())
+                .limit(1)
+            ).first()
+        entry = (now + current_app.config['PROMPT_TEMPLATE_TTL_SECONDS'], tuple(row) if row else None)
+        with _lock:
+            _active[prompt_type] = entry
+    if entry[1] is None:
+        return None
+
+    template_id, updated_at = entry[1]
+    cached = _compiled.get(template_id)
+    if cached is None or cached[0] != updated_at:
+        cached = _compile(template_id)
+        if cached is None:
+            invalidate(template_id)
+            return None
+    if isinstance(cached[1], PromptTemplateError):
+        raise cached[1]
+    return cached[1]
+
+def invalidate(template_id=None):
+    """Forget cached lookups after prompts change, and ``template_id``'s compiled template."""
+    with _lock:
+        _active.clear()
+        if template_id is not None:
+            _compiled.pop(template_id, None)
+
+def _compile(template_id):
+    with Session(db.engine) as session:
+        prompt = session.get(PromptTemplate, template_id)
+        if prompt is None:
+            return None
+        try:
+            compiled = validate(prompt.type, prompt.template_content, prompt.variables)
+        except PromptTemplateError as e:
+            # Remembered too, so a broken template isn't re-parsed for every chapter
+            compiled = e
+        entry = (prompt.updated_at, compiled)
+    with _lock:
+        _compiled[template_id] = entry
+    return entry
@@ -0,0 +1,71 @@
+"""Count SQL statements so N+1 query patterns are caught early.
+
+``count_queries()`` counts the statements run on the current thread while
+it is open, for checks like::
+
+    with count_queries() as counter:
+        client.get('/questionnaires/list')
+    assert counter.count <= 3, counter.statements
+
+``@query_budget(n)`` wraps a view the same way and reports it when the view
+runs more than ``n`` statements. With ``QUERY_BUDGET_STRICT`` enabled, or
+when the app is in testing or debug mode, it raises ``QueryBudgetExceeded``
+so the request fails; otherwise it logs a warning.
+"""
+from contextlib import contextmanager
+from flask import current_app
+from functools import wraps
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import threading
+
+_local = threading.local()
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+class QueryCounter:
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _record(conn, cursor, statement, parameters, context, executemany):
+    for counter in getattr(_local, 'counters', ()):
+        counter.statements.append(statement)
+
+@contextmanager
+def count_queries():
+    counter = QueryCounter()
+    counters = getattr(_local, 'counters', None)
+    if counters is None:
+        counters = _local.counters = []
+    counters.append(counter)
+    try:
+        yield counter
+    finally:
+        counters.remove(counter)
+
+def strict():
+    # Fail loudly in tests and development, only warn in production
+    return current_app.config['QUERY_BUDGET_STRICT'] or current_app.testing or current_app.debug
+
+def query_budget(max_queries):
+    """Fail or warn when the decorated view runs more than ``max_queries`` statements."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            with count_queries() as counter:
+                result = view(*args, **kwargs)
+            if counter.count > max_queries:
+                message = (f"{view.__name__} ran {counter.count} SQL statements, budget is {max_queries}: "
+                           + ' | '.join(' '.join(s.split())[:120] for s in counter.statements))
+                if strict():
+                    raise QueryBudgetExceeded(message)
+                current_app.logger.warning(message)
+            return result
+        return wrapper
+    return decorator
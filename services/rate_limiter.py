@@ -0,0 +1,187 @@
+from flask import current_app
+from models import RateLimitBucket, db
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from datetime import datetime
+import asyncio
+import random
+import re
+import time
+
+# Approximate characters per token when a real count isn't available
+CHARS_PER_TOKEN = 4
+
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+_DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+def parse_duration(value):
+    """Parse OpenAI reset headers such as ``'6m0s'`` or ``'120ms'`` into seconds."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+def estimate_tokens(messages, max_tokens=None):
+    prompt_chars = sum(len(message.get('content') or '') for message in messages)
+    completion = max_tokens or current_app.config['OPENAI_COMPLETION_TOKEN_ESTIMATE']
+    return prompt_chars // CHARS_PER_TOKEN + completion
+
+class RateLimiter:
+    """Token buckets for OpenAI requests and tokens, shared by every worker.
+
+    Bucket state lives in the ``rate_limit_buckets`` table and is updated
+    under a row lock, so all processes draw from the same budget. ``chat``
+    and ``tts`` have separate request buckets, and chat also has a
+    tokens-per-minute bucket. Callers wait for capacity before sending,
+    rather than sending and retrying on 429. Limits are corrected from the
+    ``x-ratelimit-*`` headers on each response.
+    """
+
+    def __init__(self):
+        config = current_app.config
+        self.enabled = config['RATE_LIMIT_ENABLED']
+        self.max_wait = config['RATE_LIMIT_MAX_WAIT_SECONDS']
+        self.limits = {
+            'chat:requests': config['OPENAI_CHAT_RPM'],
+            'chat:tokens': config['OPENAI_CHAT_TPM'],
+            'tts:requests': config['OPENAI_TTS_RPM'],
+        }
+
+    def acquire(self, kind, tokens=0):
+        """Block until ``kind`` ('chat' or 'tts') has room for one request of ``tokens``."""
+        if not self.enabled:
+            return
+        amounts = self._amounts(kind, tokens)
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            wait = self._try_take(amounts)
+            if self._done_waiting(kind, wait, deadline):
+                return
+            time.sleep(self._backoff(wait))
+
+    async def acquire_async(self, kind, tokens=0):
+        """``acquire`` for coroutines: waits without holding the event loop or a thread."""
+        if not self.enabled:
+            return
+        amounts = self._amounts(kind, tokens)
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            wait = await asyncio.to_thread(self._try_take, amounts)
+            if self._done_waiting(kind, wait, deadline):
+                return
+            await asyncio.sleep(self._backoff(wait))
+
+    def _amounts(self, kind, tokens):
+        amounts = {f'{kind}:requests': 1}
+        if tokens and f'{kind}:tokens' in self.limits:
+            amounts[f'{kind}:tokens'] = tokens
+        return amounts
+
+    def _done_waiting(self, kind, wait, deadline):
+        if wait <= 0:
+            return True
+        if time.monotonic() + wait > deadline:
+            current_app.logger.warning(f"Rate limiter wait for {kind} exceeded {self.max_wait}s, sending anyway")
+            return True
+        return False
+
+    def _backoff(self, wait):
+        # Jitter so waiting workers don't all wake at the same moment
+        return wait + random.uniform(0, min(1.0, wait))
+
+    def refund(self, kind, tokens):
+        """Return over-estimated tokens once the actual usage is known."""
+        if not self.enabled or not tokens or f'{kind}:tokens' not in self.limits:
+            return
+        self._adjust(f'{kind}:tokens', lambda bucket: min(bucket.capacity, bucket.tokens + tokens))
+
+    def observe(self, kind, headers):
+        """Update buckets from a response's ``x-ratelimit-*`` headers."""
+        if not self.enabled or headers is None:
+            return
+        for resource in ('requests', 'tokens'):
+            name = f'{kind}:{resource}'
+            if name not in self.limits:
+                continue
+            limit = _to_float(headers.get(f'x-ratelimit-limit-{resource}'))
+            remaining = _to_float(headers.get(f'x-ratelimit-remaining-{resource}'))
+            if limit is None and remaining is None:
+                continue
+
+            def update(bucket, limit=limit, remaining=remaining):
+                if limit:
+                    bucket.capacity = limit
+                    bucket.refill_rate = limit / 60.0
+                if remaining is not None:
+                    return min(bucket.tokens, remaining)
+                return bucket.tokens
+            self._adjust(name, update)
+
+    def penalize(self, kind, headers=None):
+        """Drain the request bucket after a 429 so every worker backs off together."""
+        if not self.enabled:
+            return
+        retry_after = None
+        if headers is not None:
+            retry_after = _to_float(headers.get('retry-after')) or parse_duration(headers.get('x-ratelimit-reset-requests'))
+        retry_after = retry_after or 1.0
+        self._adjust(f'{kind}:requests', lambda bucket: min(bucket.tokens, -retry_after * bucket.refill_rate))
+
+    def _try_take(self, amounts):
+        """Deduct ``amounts`` if every bucket has room; otherwise return seconds to wait."""
+        with Session(db.engine) as session:
+            buckets = self._lock_buckets(session, sorted(amounts))
+            now = datetime.utcnow()
+            wait = 0.0
+            for bucket in buckets:
+                self._refill(bucket, now)
+                # A request bigger than the whole bucket only needs a full bucket
+                needed = min(amounts[bucket.name], bucket.capacity)
+                if bucket.tokens < needed:
+                    wait = max(wait, (needed - bucket.tokens) / bucket.refill_rate)
+            if wait <= 0:
+                for bucket in buckets:
+                    bucket.tokens -= amounts[bucket.name]
+            session.commit()
+            return wait
+
+    def _adjust(self, name, update):
+        with Session(db.engine) as session:
+            bucket, = self._lock_buckets(session, [name])
+            self._refill(bucket, datetime.utcnow())
+            bucket.tokens = update(bucket)
+            session.commit()
+
+    def _lock_buckets(self, session, names):
+        query = select(RateLimitBucket).where(RateLimitBucket.name.in_(names)).order_by(RateLimitBucket.name)
+        buckets = session.scalars(query.with_for_update()).all()
+        missing = set(names) - {bucket.name for bucket in buckets}
+        if missing:
+            for name in missing:
+                limit = float(self.limits[name])
+                session.add(RateLimitBucket(name=name, capacity=limit, tokens=limit, refill_rate=limit / 60.0, updated_at=datetime.utcnow()))
+            try:
+                session.commit()
+            except IntegrityError:
+                # Another worker created it first
+                session.rollback()
+            buckets = session.scalars(query.with_for_update()).all()
+        return buckets
+
+    def _refill(self, bucket, now):
+        elapsed = max(0.0, (now - bucket.updated_at).total_seconds())
+        bucket.tokens = min(bucket.capacity, bucket.tokens + elapsed * bucket.refill_rate)
+        bucket.updated_at = now
+
+def _to_float(value):
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
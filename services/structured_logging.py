@@ -0,0 +1,209 @@
+"""JSON logs written by a background thread, tagged with a correlation id.
+
+``app.logger`` gets a single handler that puts records on a bounded
+in-memory queue. A ``QueueListener`` thread formats them and does the file
+and console writes, so a request never waits on disk. If the queue is full,
+the record is dropped instead of blocking, and the next record that gets
+through reports how many were lost.
+
+Each record carries the correlation id of the request or job that logged
+it. Requests take theirs from an ``X-Request-ID`` header or generate one,
+and echo it in the response. Jobs use ``job-<id>``. Worker threads started
+with ``contextvars.copy_context()`` inherit the id.
+
+Every process writes its own log file, since rotating a file that other
+processes still have open loses or mangles their lines. ``LOG_FILE_SUFFIX``
+is added to the ``LOG_FILE`` name, so ``worker-0`` makes
+``logs/audiov4.worker-0.log``; worker.py sets it for each worker process.
+``{pid}`` in the suffix is replaced with the process id, for servers that
+fork several processes from one configuration.
+
+INFO and DEBUG lines are sampled per call site. Each line of code may log
+``LOG_SAMPLE_BURST`` lines a second, then only one in ``LOG_SAMPLE_RATE``,
+so a hot loop can't flood the log. Warnings and errors are always kept.
+"""
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from flask import g, request
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import os
+import queue
+import re
+import sys
+import threading
+import uuid
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+# Incoming ids are only trusted if they look like one
+VALID_REQUEST_ID = re.compile(r'^[A-Za-z0-9._:-]{1,128}$')
+
+# Attributes every LogRecord has; anything else came from ``extra=``
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {
+    'message', 'asctime', 'correlation_id', 'sampled_out', 'dropped'
+}
+
+_correlation_id = contextvars.ContextVar('log_correlation_id', default=None)
+_exception_formatter = logging.Formatter()
+
+def init_app(app):
+    for handler in list(app.logger.handlers):
+        # Replace the handlers of an earlier create_app() in this process
+        if isinstance(handler, _NonBlockingQueueHandler):
+            handler.listener.stop()
+        app.logger.removeHandler(handler)
+
+    log_file = process_log_file(app.config['LOG_FILE'], app.config['LOG_FILE_SUFFIX'])
+    os.makedirs(os.path.dirname(log_file) or '.', exist_ok=True)
+    file_handler = RotatingFileHandler(log_file, maxBytes=app.config['LOG_MAX_BYTES'],
+                                       backupCount=app.config['LOG_BACKUP_COUNT'])
+    file_handler.setFormatter(JsonFormatter())
+    console_handler = logging.StreamHandler(sys.stderr)
+    console_handler.setFormatter(logging.Formatter('[%(asctime)s] %(levelname)s in %(module)s: %(message)s'))
+
+    handler = _NonBlockingQueueHandler(queue.Queue(app.config['LOG_QUEUE_SIZE']))
+    if app.config['LOG_SAMPLING_ENABLED']:
+        handler.addFilter(SamplingFilter(app.config['LOG_SAMPLE_BURST'], app.config['LOG_SAMPLE_RATE']))
+    handler.listener = _Listener(handler.queue, file_handler, console_handler)
+    handler.listener.start()
+    atexit.register(handler.listener.stop)
+
+    app.logger.addHandler(handler)
+    app.logger.setLevel(app.config['LOG_LEVEL'])
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_end_request)
+
+def process_log_file(log_file, suffix):
+    """``log_file`` with ``suffix`` added before its extension."""
+    if not suffix:
+        return log_file
+    root, ext = os.path.splitext(log_file)
+    return f"{root}.{suffix.format(pid=os.getpid())}{ext}"
+
+@contextmanager
+def correlation(correlation_id):
+    """Tag records logged in this context with ``correlation_id``."""
+    token = _correlation_id.set(correlation_id)
+    try:
+        yield
+    finally:
+        _correlation_id.reset(token)
+
+def current_correlation_id():
+    return _correlation_id.get()
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'correlation_id': getattr(record, 'correlation_id', None),
+            'module': record.module,
+            'line': record.lineno,
+            'thread': record.threadName,
+            'process': record.process,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        for key in ('sampled_out', 'dropped'):
+            if getattr(record, key, 0):
+                entry[key] = getattr(record, key)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class SamplingFilter(logging.Filter):
+    """Keep ``burst`` INFO/DEBUG records a second per call site, then one in ``rate``."""
+
+    def __init__(self, burst, rate):
+        super().__init__()
+        self.burst = burst
+        self.rate = max(1, rate)
+        self.lock = threading.Lock()
+        self.sites = {}  # (path, line) -> [window start, records in window, dropped since last kept]
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        key = (record.pathname, record.lineno)
+        with self.lock:
+            site = self.sites.get(key)
+            if site is None or record.created - site[0] >= 1:
+                site = self.sites[key] = [record.created, 0, site[2] if site else 0]
+            site[1] += 1
+            over = site[1] - self.burst
+            if over > 0 and over % self.rate:
+                site[2] += 1
+                return False
+            record.sampled_out, site[2] = site[2], 0
+        return True
+
+class _NonBlockingQueueHandler(QueueHandler):
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.listener = None
+        self.dropped = 0
+        self.dropped_lock = threading.Lock()
+
+    def prepare(self, record):
+        # Runs on the logging thread: capture what the listener can't see
+        # from its own thread, and render the traceback while it exists
+        record = copy.copy(record)
+        record.correlation_id = _correlation_id.get()
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        if self.dropped:
+            with self.dropped_lock:
+                record.dropped, self.dropped = self.dropped, 0
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self.dropped_lock:
+                self.dropped += 1
+
+class _Listener(QueueListener):
+    def stop(self):
+        # Also registered with atexit, so it may run twice
+        if self._thread is not None:
+            super().stop()
+            for handler in self.handlers:
+                handler.close()
+
+    def enqueue_sentinel(self):
+        # The queue may be full; stopping waits for room rather than failing
+        self.queue.put(self._sentinel)
+
+def _start_request():
+    correlation_id = request.headers.get(REQUEST_ID_HEADER, '')
+    if not VALID_REQUEST_ID.match(correlation_id):
+        correlation_id = uuid.uuid4().hex
+    g.correlation_id = correlation_id
+    _correlation_id.set(correlation_id)
+
+def _finish_request(response):
+    if 'correlation_id' in g:
+        response.headers[REQUEST_ID_HEADER] = g.correlation_id
+    return response
+
+def _end_request(exc):
+    # Server threads are reused; don't let the id leak into the next request
+    _correlation_id.set(None)
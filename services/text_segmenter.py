@@ -0,0 +1,71 @@
+import re
+
+# The speech endpoint rejects inputs longer than this many characters
+TTS_MAX_INPUT_CHARS = 4096
+
+_PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+# Split on the whitespace after sentence-ending punctuation, keeping up to
+# two closing quotes or brackets with the sentence they close
+_CLOSER = r'["\'”’)\]]'
+_SENTENCE_END = re.compile(rf'(?:(?<=[.!?…])|(?<=[.!?…]{_CLOSER})|(?<=[.!?…]{_CLOSER}{_CLOSER}))\s+')
+
+def split_paragraphs(text):
+    return [p.strip() for p in _PARAGRAPH_BREAK.split(text) if p.strip()]
+
+def split_sentences(paragraph):
+    return [s.strip() for s in _SENTENCE_END.split(paragraph) if s.strip()]
+
+def _split_words(sentence, max_chars):
+    # Last resort for a single sentence longer than the budget
+    pieces, current = [], ''
+    for word in sentence.split():
+        while len(word) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ''
+            pieces.append(word[:max_chars])
+            word = word[max_chars:]
+        candidate = f"{current} {word}" if current else word
+        if len(candidate) > max_chars:
+            pieces.append(current)
+            current = word
+        else:
+            current = candidate
+    if current:
+        pieces.append(current)
+    return pieces
+
+def segment_text(text, max_chars=TTS_MAX_INPUT_CHARS):
+    """Split text into TTS-sized segments at natural boundaries.
+
+    Whole paragraphs are packed together while they fit within
+    ``max_chars``. A paragraph that is too long on its own is split into
+    sentences, and a sentence that is too long is split between words.
+    """
+    max_chars = min(max_chars, TTS_MAX_INPUT_CHARS)
+    units = []
+    for paragraph in split_paragraphs(text):
+        if len(paragraph) <= max_chars:
+            units.append((paragraph, True))
+            continue
+        for sentence in split_sentences(paragraph):
+            if len(sentence) <= max_chars:
+                units.append((sentence, False))
+            else:
+                units.extend((piece, False) for piece in _split_words(sentence, max_chars))
+        # Close the paragraph so the next one starts on a fresh line
+        units[-1] = (units[-1][0], True)
+
+    segments, current = [], ''
+    separator = ''
+    for unit, ends_paragraph in units:
+        candidate = f"{current}{separator}{unit}" if current else unit
+        if len(candidate) > max_chars and current:
+            segments.append(current)
+            current = unit
+        else:
+            current = candidate
+        separator = '\n\n' if ends_paragraph else ' '
+    if current:
+        segments.append(current)
+    return segments
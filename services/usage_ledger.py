@@ -0,0 +1,229 @@
+"""Ledger of OpenAI calls: model, tokens or characters, latency, retries and owner.
+
+``record()`` only puts the row on an in-memory queue. A background thread
+writes queued rows in batches, so the ledger adds no latency to the calls it
+measures. Rows are attributed to the outline or audiobook set with
+``owner()`` in the calling context.
+"""
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from flask import current_app
+from models import OpenAIUsage, BookOutline, Audiobook, db
+from services import openai_client
+from sqlalchemy import case, func, insert, select
+from sqlalchemy.orm import Session
+import atexit
+import contextvars
+import math
+import queue
+import threading
+import uuid
+
+# USD per million prompt and completion tokens
+CHAT_PRICES = {
+    'gpt-4': (30.0, 60.0),
+    'gpt-4-turbo': (10.0, 30.0),
+    'gpt-4o': (2.5, 10.0),
+    'gpt-4o-mini': (0.15, 0.6),
+    'gpt-3.5-turbo': (0.5, 1.5),
+}
+
+_owner = contextvars.ContextVar('usage_owner', default={})
+_writer_lock = threading.Lock()
+
+@contextmanager
+def owner(outline_id=None, audiobook_id=None):
+    """Attribute OpenAI calls made in this context to an outline or audiobook."""
+    token = _owner.set({'outline_id': outline_id, 'audiobook_id': audiobook_id})
+    try:
+        yield
+    finally:
+        _owner.reset(token)
+
+def record(kind, model, operation, latency, status='ok', prompt_tokens=None, completion_tokens=None,
+           input_chars=None, retries_taken=0):
+    """Queue one API call for the ledger.
+
+    ``retries_taken`` is the OpenAI client's own retry count for the call.
+    Retries made by ``openai_retry`` are added to it.
+    """
+    app = current_app._get_current_object()
+    if not app.config['USAGE_LEDGER_ENABLED']:
+        return
+    _writer(app).put({
+        'id': str(uuid.uuid4()),
+        'kind': kind,
+        'model': model,
+        'operation': operation,
+        'status': status,
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens,
+        'input_chars': input_chars,
+        'latency_ms': round(latency * 1000, 1),
+        'retries': (retries_taken or 0) + openai_client.current_attempt() - 1,
+        'created_at': datetime.utcnow(),
+        **_owner.get()
+    })
+
+def flush(app=None):
+    """Write everything queued so far; used at shutdown and by tools that need the rows now."""
+    app = app or current_app._get_current_object()
+    writer = app.extensions.get('usage_ledger')
+    if writer is not None:
+        writer.flush()
+
+def _writer(app):
+    writer = app.extensions.get('usage_ledger')
+    if writer is None:
+        with _writer_lock:
+            writer = app.extensions.get('usage_ledger')
+            if writer is None:
+                writer = app.extensions['usage_ledger'] = _LedgerWriter(app)
+    return writer
+
+class _LedgerWriter:
+    def __init__(self, app):
+        self.app = app
+        self.queue = queue.Queue()
+        self.batch_size = app.config['USAGE_LEDGER_BATCH_SIZE']
+        self.interval = app.config['USAGE_LEDGER_FLUSH_SECONDS']
+        self.write_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='usage-ledger', daemon=True)
+        self.thread.start()
+        atexit.register(self.flush)
+
+    def put(self, row):
+        self.queue.put(row)
+        if self.queue.qsize() >= self.batch_size:
+            self.wake.set()
+
+    def _run(self):
+        # Write every flush interval, or sooner once a full batch is waiting
+        while True:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            self.flush()
+
+    def flush(self):
+        # Draining under the lock means rows queued before a flush call are
+        # written by the time it returns, whichever thread writes them
+        with self.write_lock:
+            rows = []
+            while True:
+                try:
+                    rows.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if rows:
+                self._write(rows)
+
+    def _write(self, rows):
+        with self.app.app_context():
+            try:
+                with Session(db.engine) as session:
+                    session.execute(insert(OpenAIUsage), rows)
+                    session.commit()
+            except Exception as e:
+                # Losing ledger rows must never break generation
+                self.app.logger.error(f"Failed to write {len(rows)} OpenAI usage rows: {str(e)}")
+
+def call_cost(row):
+    """Cost in USD of a ledger row, or of summed rows for one model; None when unpriced."""
+    if row.kind == 'tts':
+        return (row.input_chars or 0) * current_app.config['TTS_COST_PER_MILLION_CHARS'] / 1_000_000
+    prices = CHAT_PRICES.get(row.model)
+    if prices is None:
+        return None
+    return ((row.prompt_tokens or 0) * prices[0] + (row.completion_tokens or 0) * prices[1]) / 1_000_000
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of ``values``, or None when empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(len(ordered) * fraction)) - 1]
+
+def summary(days=30):
+    """Latency percentiles and cost per model and per book over the last ``days``."""
+    since = datetime.utcnow() - timedelta(days=days)
+    # Audiobook calls count towards the outline the audiobook was made from
+    book_id = func.coalesce(OpenAIUsage.outline_id, Audiobook.outline_id).label('book_id')
+    is_audiobook = OpenAIUsage.audiobook_id.isnot(None).label('is_audiobook')
+
+    def recent(*columns):
+        return (select(*columns)
+                .outerjoin(Audiobook, Audiobook.id == OpenAIUsage.audiobook_id)
+                .where(OpenAIUsage.created_at >= since))
+
+    # Cost is linear in tokens and characters, so it can be priced from the
+    # sums for each model, rather than row by row
+    groups = db.session.execute(
+        recent(
+            OpenAIUsage.kind, OpenAIUsage.model, book_id, is_audiobook,
+            func.count().label('calls'),
+            func.sum(case((OpenAIUsage.status == 'ok', 0), else_=1)).label('errors'),
+            func.sum(OpenAIUsage.retries).label('retries'),
+            func.sum(OpenAIUsage.prompt_tokens).label('prompt_tokens'),
+            func.sum(OpenAIUsage.completion_tokens).label('completion_tokens'),
+            func.sum(OpenAIUsage.input_chars).label('input_chars')
+        ).group_by(OpenAIUsage.kind, OpenAIUsage.model, book_id, is_audiobook)
+    ).all()
+
+    models = {}
+    books = {}
+    for group in groups:
+        cost = call_cost(group)
+        _add(models.setdefault((group.kind, group.model), _bucket()), group, cost)
+        if group.book_id:
+            book = books.setdefault(group.book_id, _bucket(outline_cost=0.0, audiobook_cost=0.0))
+            _add(book, group, cost)
+            book['audiobook_cost' if group.is_audiobook else 'outline_cost'] += cost or 0.0
+
+    # Percentiles need every latency, but only that column
+    latencies = db.session.execute(
+        recent(OpenAIUsage.kind, OpenAIUsage.model, book_id, OpenAIUsage.latency_ms)
+        .where(OpenAIUsage.latency_ms.isnot(None))
+    ).all()
+    for kind, model, outline_id, latency_ms in latencies:
+        models[(kind, model)]['latencies'].append(latency_ms)
+        if outline_id:
+            books[outline_id]['latencies'].append(latency_ms)
+
+    titles = dict(db.session.execute(
+        select(BookOutline.id, BookOutline.title).where(BookOutline.id.in_(list(books)))
+    ).all()) if books else {}
+
+    return {
+        'days': days,
+        'models': sorted((
+            {'kind': kind, 'model': model, **_finish(stats)}
+            for (kind, model), stats in models.items()
+        ), key=lambda m: -m['cost']),
+        'books': sorted((
+            {'outline_id': outline_id, 'title': titles.get(outline_id), **_finish(stats)}
+            for outline_id, stats in books.items()
+        ), key=lambda b: -b['cost'])
+    }
+
+def _bucket(**extra):
+    return {'calls': 0, 'errors': 0, 'retries': 0, 'prompt_tokens': 0, 'completion_tokens': 0,
+            'input_chars': 0, 'cost': 0.0, 'latencies': [], **extra}
+
+def _add(stats, group, cost):
+    stats['calls'] += group.calls
+    stats['errors'] += group.errors or 0
+    stats['retries'] += group.retries or 0
+    stats['prompt_tokens'] += group.prompt_tokens or 0
+    stats['completion_tokens'] += group.completion_tokens or 0
+    stats['input_chars'] += group.input_chars or 0
+    stats['cost'] += cost or 0.0
+
+def _finish(stats):
+    latencies = stats.pop('latencies')
+    stats['p50_latency_ms'] = percentile(latencies, 0.5)
+    stats['p95_latency_ms'] = percentile(latencies, 0.95)
+    for key in ('cost', 'outline_cost', 'audiobook_cost'):
+        if key in stats:
+            stats[key] = round(stats[key], 4)
+    return stats
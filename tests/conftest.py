@@ -0,0 +1,46 @@
+from app import create_app, db
+import pytest
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # AUDIO_DIR and the cache directories are relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setenv('LOG_FILE', str(tmp_path / 'logs' / 'test.log'))
+    monkeypatch.setenv('OPENAI_API_KEY', 'test')
+    monkeypatch.setenv('TTS_CACHE_ENABLED', 'false')
+    monkeypatch.setenv('RATE_LIMIT_ENABLED', 'false')
+    monkeypatch.setenv('USAGE_LEDGER_ENABLED', 'false')
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        import models  # noqa: F401  registers the tables
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def outline(app):
+    from models import BookOutline, QuestionnaireResponse, Template
+    template = Template(title='Memoir', sections=[{'title': 'Childhood', 'questions': []}])
+    response = QuestionnaireResponse(template=template, responses={'childhood': 'A small town.'})
+    outline = BookOutline(questionnaire=response, chapters={'title': 'A Small Town', 'chapters': [
+        {'number': n, 'title': f"Chapter {n}", 'summary': f"Summary {n}.",
+         'key_points': [f"First point of chapter {n}", f"Second point of chapter {n}"]} for n in (1, 2)
+    ]})
+    db.session.add_all([template, response, outline])
+    db.session.commit()
+    return outline
+
+@pytest.fixture
+def fake_openai(app, monkeypatch):
+    """The local stand-in for the OpenAI API from benchmarks/, answering without delay."""
+    from benchmarks.fake_openai import FakeOpenAI
+    fake = FakeOpenAI(chat_latency='fixed:0', speech_latency='fixed:0', stream_interval_ms=0,
+                      retry_after_ms=0, chapter_words=60, seed=1).start()
+    monkeypatch.setenv('OPENAI_BASE_URL', fake.url)
+    # Clients are cached per API key, so a fresh key gets one pointed at this server
+    app.config['OPENAI_API_KEY'] = f"fake-{fake.server.server_address[1]}"
+    yield fake
+    fake.stop()
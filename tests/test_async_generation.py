@@ -0,0 +1,59 @@
+from models import Audiobook, Job, db
+from services.async_jobs import AsyncJobRunner
+from services.async_views import AsgiApp
+from services.audio_service import AUDIO_DIR
+from services import mp3
+import services.async_audiobook_service  # noqa: F401  registers the async job handler
+import asyncio
+import httpx
+import os
+import pytest
+
+async def wait_for(check, timeout=30):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not await check():
+        assert asyncio.get_running_loop().time() < deadline, 'timed out'
+        await asyncio.sleep(0.05)
+
+@pytest.mark.parametrize('sections', [False, True])
+def test_asgi_generates_the_audiobook_on_the_event_loop(app, outline, fake_openai, sections):
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.config['CHAPTER_SECTIONS_ENABLED'] = sections
+    # Too slow a poll to finish in time: the async view has to wake the runner
+    application = AsgiApp(app, job_runner=AsyncJobRunner(app, poll_interval=60))
+    outline_id = outline.id
+
+    async def scenario():
+        application.job_runner.start()
+        transport = httpx.ASGITransport(app=application)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+                response = await client.post(f"/audiobooks/generate/{outline_id}",
+                                              headers={'X-Requested-With': 'XMLHttpRequest'})
+                assert response.status_code == 202
+                status_url = response.json()['status_url']
+
+                async def finished():
+                    job = (await client.get(status_url)).json()['job']
+                    return job['status'] in ('completed', 'failed')
+                await wait_for(finished)
+                return response.json()['audiobook_id']
+        finally:
+            await application.job_runner.stop()
+
+    audiobook_id = asyncio.run(scenario())
+
+    db.session.expire_all()
+    job = Job.query.filter_by(resource_id=audiobook_id).one()
+    assert (job.status, job.last_error) == ('completed', None)
+    assert job.locked_by.endswith(':asgi')
+    audiobook = db.session.get(Audiobook, audiobook_id)
+    assert audiobook.status == 'completed'
+    assert sorted(audiobook.chapter_files) == ['1', '2']
+    for filename in audiobook.chapter_files.values():
+        with open(os.path.join(AUDIO_DIR, filename), 'rb') as f:
+            assert sum(1 for _ in mp3.iter_frames(f)) > 0
+    assert os.path.exists(os.path.join(AUDIO_DIR, audiobook.book_file))
+    # Two sections and a transition per chapter when written in sections
+    assert fake_openai.counts['chat'] == (6 if sections else 2)
+    assert fake_openai.counts['speech'] >= 2
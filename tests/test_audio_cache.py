@@ -0,0 +1,62 @@
+from prometheus_client import REGISTRY
+from services.audio_cache import AudioCache
+import os
+import pytest
+
+def counter(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+@pytest.fixture
+def cache(app, tmp_path):
+    app.config['TTS_COST_PER_MILLION_CHARS'] = 15.0
+    return AudioCache(str(tmp_path / 'cache'), max_bytes=1000)
+
+def write(path, size):
+    with open(path, 'wb') as f:
+        f.write(b'\xff' * size)
+    return str(path)
+
+def test_hits_misses_and_savings_are_counted(cache, tmp_path):
+    key = AudioCache.key('Hello there.', 'tts-1', 'alloy', 'mp3')
+    hits, misses = counter('tts_cache_lookups_total', result='hit'), counter('tts_cache_lookups_total', result='miss')
+    chars, seconds = counter('tts_cache_saved_characters_total'), counter('tts_cache_saved_seconds_total')
+    cost = counter('tts_cache_saved_cost_dollars_total')
+
+    assert cache.lookup(key) is None
+    assert counter('tts_cache_lookups_total', result='miss') == misses + 1
+    cache.add(key, write(tmp_path / 'chapter.mp3', 100), chars=200_000, seconds=4.5)
+    assert cache.lookup(key) == cache.path_for(key)
+
+    assert counter('tts_cache_lookups_total', result='hit') == hits + 1
+    assert counter('tts_cache_saved_characters_total') == chars + 200_000
+    assert counter('tts_cache_saved_seconds_total') == pytest.approx(seconds + 4.5)
+    assert counter('tts_cache_saved_cost_dollars_total') == pytest.approx(cost + 3.0)
+
+def test_evictions_are_counted(cache, tmp_path):
+    evictions = counter('tts_cache_evictions_total')
+    evicted_bytes = counter('tts_cache_evicted_bytes_total')
+    for n in range(3):
+        key = AudioCache.key(f"Text {n}", 'tts-1', 'alloy', 'mp3')
+        cache.add(key, write(tmp_path / f"{n}.mp3", 400), chars=6, seconds=0.1)
+
+    assert counter('tts_cache_evictions_total') == evictions + 1
+    assert counter('tts_cache_evicted_bytes_total') == evicted_bytes + 400
+
+def test_hits_leave_linked_files_untouched_and_refresh_recency(cache, tmp_path):
+    keys = [AudioCache.key(f"Text {n}", 'tts-1', 'alloy', 'mp3') for n in range(3)]
+    old, recent = 1_000_000_000, 1_000_000_100
+    for key in keys[:2]:
+        path = cache.add(key, write(tmp_path / f"{key}.mp3", 400), chars=6, seconds=0.1)
+        os.utime(path, (old, old))
+        os.utime(cache._meta_path(path), (old, old))
+    # The first entry was added first but used last
+    os.utime(cache._meta_path(cache.path_for(keys[1])), (recent, recent))
+    chapter = tmp_path / f"{keys[0]}.mp3"  # hard-linked to the first entry
+
+    assert cache.lookup(keys[0]) == cache.path_for(keys[0])
+    assert os.stat(chapter).st_mtime == old
+    assert os.stat(cache.path_for(keys[0])).st_mtime == old
+
+    cache.add(keys[2], write(tmp_path / 'new.mp3', 400), chars=6, seconds=0.1)
+    assert os.path.exists(cache.path_for(keys[0]))
+    assert not os.path.exists(cache.path_for(keys[1]))
@@ -0,0 +1,128 @@
+from benchmarks.fake_openai import MP3_FRAME
+from contextlib import contextmanager
+from services import mp3
+from services.audio_service import AUDIO_DIR, PARTIAL_SUFFIX, AudioService
+from tenacity import wait_none
+from types import SimpleNamespace
+import os
+import pytest
+import threading
+
+MP3_HEADER = bytes([0xFF, 0xFB, 0x90, 0x64])  # 128 kbps, 44.1 kHz: 417-byte frames
+ID3_TAG = b'ID3\x04\x00\x00\x00\x00\x00\x00'
+
+def frame(marker):
+    return MP3_HEADER + bytes([marker]) * 413
+
+class FakeSpeech:
+    """Stands in for ``client.audio.speech.with_streaming_response``.
+
+    Each input is answered with a tagged MP3 whose frames are filled with
+    the input's position in ``inputs``, so the joined file shows the order.
+    """
+
+    def __init__(self, inputs, fail_on=None):
+        self.inputs = inputs
+        self.fail_on = fail_on
+        self.requested = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def create(self, model, voice, input, response_format):
+        with self.lock:
+            self.requested.append(input)
+        if input == self.fail_on:
+            raise RuntimeError('speech failed')
+        marker = self.inputs.index(input) + 1
+        yield FakeResponse(ID3_TAG + frame(marker) * 3)
+
+class FakeResponse:
+    retries_taken = 0
+    headers = {}
+
+    def __init__(self, body):
+        self.body = body
+
+    def iter_bytes(self, chunk_size):
+        for i in range(0, len(self.body), 100):
+            yield self.body[i:i + 100]
+
+def fake_client(speech):
+    return SimpleNamespace(audio=SimpleNamespace(speech=SimpleNamespace(with_streaming_response=speech)))
+
+TEXT = '\n\n'.join(f"Paragraph {n} has a few words in it." for n in range(1, 7))
+
+@pytest.fixture
+def service(app):
+    app.config['TTS_SEGMENT_MAX_CHARS'] = 40
+    return AudioService()
+
+def test_segments_are_requested_in_order_and_joined_at_frame_boundaries(service):
+    service.segment_concurrency = 1
+    segments = TEXT.split('\n\n')
+    speech = FakeSpeech(segments)
+    service.client = fake_client(speech)
+
+    filename = service.generate_audio(TEXT, 'book/chapter_1.mp3')
+
+    assert speech.requested == segments
+    path = os.path.join(AUDIO_DIR, filename)
+    with open(path, 'rb') as f:
+        frames = [data for _, data in mp3.iter_frames(f)]
+    assert frames == [frame(n) for n in range(1, len(segments) + 1) for _ in range(3)]
+    with open(path, 'rb') as f:
+        assert f.read() == b''.join(frames)
+    assert os.listdir(os.path.dirname(path)) == ['chapter_1.mp3']
+
+def test_concurrent_segments_are_joined_in_order(service):
+    segments = TEXT.split('\n\n')
+    speech = FakeSpeech(segments)
+    service.client = fake_client(speech)
+
+    filename = service.generate_audio(TEXT, 'book/chapter_1.mp3')
+
+    assert sorted(speech.requested) == sorted(segments)
+    with open(os.path.join(AUDIO_DIR, filename), 'rb') as f:
+        markers = [data[4] for _, data in mp3.iter_frames(f)]
+    assert markers == [n for n in range(1, len(segments) + 1) for _ in range(3)]
+
+def test_failed_segment_leaves_no_file(service):
+    segments = TEXT.split('\n\n')
+    service.client = fake_client(FakeSpeech(segments, fail_on=segments[3]))
+
+    with pytest.raises(RuntimeError):
+        service.generate_audio(TEXT, 'book/chapter_1.mp3')
+
+    path = os.path.join(AUDIO_DIR, 'book', 'chapter_1.mp3')
+    assert not os.path.exists(path)
+    assert not os.path.exists(path + PARTIAL_SUFFIX)
+    assert os.listdir(os.path.dirname(path)) == []
+
+def test_segments_streamed_from_the_fake_endpoint_are_joined(app, fake_openai):
+    app.config['TTS_SEGMENT_MAX_CHARS'] = 40
+    segments = TEXT.split('\n\n')
+
+    filename = AudioService().generate_audio(TEXT, 'book/chapter_1.mp3')
+
+    assert fake_openai.counts['speech'] == len(segments)
+    with open(os.path.join(AUDIO_DIR, filename), 'rb') as f:
+        frames = [data for _, data in mp3.iter_frames(f)]
+    assert frames == [MP3_FRAME] * sum(len(fake_openai.speech(segment)) // len(MP3_FRAME) for segment in segments)
+
+def test_rate_limited_segment_is_retried(app, fake_openai, monkeypatch):
+    # More 429s than the client retries itself, so openai_retry has to try again
+    fake_openai.rate_limit_first = 3
+    monkeypatch.setattr(AudioService._synthesize.retry, 'wait', wait_none())
+    app.config['TTS_SEGMENT_MAX_CHARS'] = 40
+    service = AudioService()
+    service.segment_concurrency = 1
+    segments = TEXT.split('\n\n')
+
+    filename = service.generate_audio(TEXT, 'book/chapter_1.mp3')
+
+    assert fake_openai.counts['rate_limited'] == 3
+    assert fake_openai.counts['speech'] == len(segments)
+    with open(os.path.join(AUDIO_DIR, filename), 'rb') as f:
+        frames = sum(1 for _ in mp3.iter_frames(f))
+    assert frames == sum(len(fake_openai.speech(segment)) // len(MP3_FRAME) for segment in segments)
+    assert os.listdir(os.path.join(AUDIO_DIR, 'book')) == ['chapter_1.mp3']
@@ -0,0 +1,39 @@
+from models import Audiobook, db
+from services.audio_service import AUDIO_DIR
+import os
+import pytest
+
+MP3_FRAME = bytes([0xFF, 0xFB, 0x90, 0x64]) + bytes(413)
+
+@pytest.fixture
+def audiobook(outline):
+    audiobook = Audiobook(outline_id=outline.id, chapter_files={}, chapter_hashes={}, status='completed')
+    db.session.add(audiobook)
+    db.session.commit()
+    audiobook.chapter_files = {'1': f"{audiobook.id}/chapter_1.mp3"}
+    audiobook.book_file = f"{audiobook.id}/book.mp3"
+    db.session.commit()
+    os.makedirs(os.path.join(AUDIO_DIR, audiobook.id))
+    for filename in audiobook.chapter_files['1'], audiobook.book_file:
+        with open(os.path.join(AUDIO_DIR, filename), 'wb') as f:
+            f.write(MP3_FRAME * 10)
+    return audiobook
+
+@pytest.mark.parametrize('path', ['chapters/1/audio', 'book.mp3'])
+def test_audio_is_revalidated_not_cached_for_a_fixed_time(app, audiobook, path):
+    client = app.test_client()
+    url = f"/audiobooks/{audiobook.id}/{path}"
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.cache_control.no_cache
+    assert response.cache_control.max_age is None
+    assert response.get_etag()[0]
+
+    assert client.get(url, headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+    # A regenerated file gets a new ETag
+    filename = audiobook.chapter_files['1'] if path.startswith('chapters') else audiobook.book_file
+    with open(os.path.join(AUDIO_DIR, filename), 'wb') as f:
+        f.write(MP3_FRAME * 12)
+    assert client.get(url, headers={'If-None-Match': response.headers['ETag']}).status_code == 200
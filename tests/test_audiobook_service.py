@@ -0,0 +1,31 @@
+from models import Job
+from services.audiobook_service import GENERATE_AUDIOBOOK, AudiobookService
+from services.job_queue import JobQueue
+
+def test_start_generation_queues_one_job(outline):
+    audiobook = AudiobookService().start_generation(outline)
+    again = AudiobookService().start_generation(outline)
+
+    assert again.id == audiobook.id
+    jobs = Job.query.filter_by(resource_id=audiobook.id).all()
+    assert [(job.type, job.status) for job in jobs] == [(GENERATE_AUDIOBOOK, 'queued')]
+
+def test_start_generation_waits_for_a_running_job(outline):
+    audiobook = AudiobookService().start_generation(outline)
+    job = JobQueue().claim('worker-1')
+    assert job.resource_id == audiobook.id
+
+    AudiobookService().start_generation(outline)
+
+    assert Job.query.filter_by(resource_id=audiobook.id).count() == 1
+
+def test_start_generation_requeues_after_the_job_finishes(outline):
+    audiobook = AudiobookService().start_generation(outline)
+    queue = JobQueue()
+    job = queue.claim('worker-1')
+    queue.complete(job, 'worker-1')
+
+    AudiobookService().start_generation(outline)
+
+    statuses = sorted(job.status for job in Job.query.filter_by(resource_id=audiobook.id))
+    assert statuses == ['completed', 'queued']
@@ -0,0 +1,48 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from models import CompletionCacheEntry, db
+from services import completion_cache
+from services.completion_cache import CompletionCache
+import pytest
+
+@pytest.fixture
+def cache(app, monkeypatch):
+    monkeypatch.setattr(completion_cache, '_memory', OrderedDict())
+    app.config['LLM_CACHE_MAX_ENTRIES'] = 2
+    return CompletionCache()
+
+def last_used(key):
+    db.session.expire_all()
+    return db.session.get(CompletionCacheEntry, key).last_used_at
+
+def age(key, seconds):
+    # Backdate both the row and its copy in memory
+    then = datetime.utcnow() - timedelta(seconds=seconds)
+    CompletionCacheEntry.query.filter_by(key=key).update({CompletionCacheEntry.last_used_at: then})
+    db.session.commit()
+    content, expires_at, _ = completion_cache._memory[key]
+    completion_cache._memory[key] = (content, expires_at, then)
+    return then
+
+def test_memory_hits_refresh_last_used_at_at_most_once_a_minute(cache):
+    cache.set('a', 'gpt-4', 'A')
+    then = age('a', 30)
+    assert cache.get('a') == 'A'
+    assert last_used('a') == then
+
+    then = age('a', 90)
+    assert cache.get('a') == 'A'
+    assert last_used('a') > then
+
+def test_entries_hot_in_memory_survive_pruning(cache):
+    cache.set('a', 'gpt-4', 'A')
+    age('a', 300)
+    cache.set('b', 'gpt-4', 'B')
+    age('b', 200)
+    # 'a' is older in the table, but it keeps being served from memory
+    assert cache.get('a') == 'A'
+
+    cache.set('c', 'gpt-4', 'C')
+
+    db.session.expire_all()
+    assert sorted(entry.key for entry in CompletionCacheEntry.query) == ['a', 'c']
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+from models import Job, db
+from services.job_queue import JOB_HANDLERS, JobQueue, LeaseLost
+import pytest
+
+@pytest.fixture
+def queue(app):
+    return JobQueue()
+
+def expire_lease(job_id):
+    Job.query.filter_by(id=job_id).update({Job.lease_expires_at: datetime.utcnow() - timedelta(seconds=1)})
+    db.session.commit()
+
+def test_complete_after_losing_the_lease_is_dropped(queue):
+    job_id = queue.enqueue('test', {}).id
+    stale = queue.claim('worker-1')
+    expire_lease(job_id)
+    current = queue.claim('worker-2')
+    assert current.id == job_id
+
+    assert queue.complete(stale, 'worker-1') is False
+    job = db.session.get(Job, job_id)
+    assert (job.status, job.locked_by, job.completed_at) == ('running', 'worker-2', None)
+
+    assert queue.complete(current, 'worker-2') is True
+    assert db.session.get(Job, job_id).status == 'completed'
+
+def test_fail_after_losing_the_lease_is_dropped(queue, monkeypatch):
+    hook_calls = []
+    monkeypatch.setitem(JOB_HANDLERS, 'test', (None, hook_calls.append))
+    job_id = queue.enqueue('test', {'n': 1}).id
+    stale = queue.claim('worker-1')
+    expire_lease(job_id)
+    queue.claim('worker-2')
+
+    assert queue.fail(stale, 'boom', 'worker-1', final=True) is False
+    job = db.session.get(Job, job_id)
+    assert (job.status, job.locked_by, job.last_error) == ('running', 'worker-2', None)
+    assert hook_calls == []
+
+def test_fail_requeues_then_fails_for_good(queue, monkeypatch):
+    hook_calls = []
+    monkeypatch.setitem(JOB_HANDLERS, 'test', (None, hook_calls.append))
+    job_id = queue.enqueue('test', {'n': 1}).id
+    for attempt in range(1, queue.max_attempts + 1):
+        job = queue.claim('worker-1')
+        assert job.attempts == attempt
+        assert queue.fail(job, f"error {attempt}", 'worker-1') is True
+
+    job = db.session.get(Job, job_id)
+    assert (job.status, job.last_error) == ('failed', f"error {queue.max_attempts}")
+    assert hook_calls == [{'n': 1}]
+
+def test_losing_the_lease_signals_the_handler(app, monkeypatch):
+    app.config['JOB_LEASE_SECONDS'] = 1
+    queue = JobQueue()  # renews the lease every second
+    signalled = []
+
+    def handler(payload, job):
+        # Another worker takes the job over while this one is still running it
+        Job.query.filter_by(id=job.id).update({Job.locked_by: 'worker-2'})
+        db.session.commit()
+        signalled.append(job.lease_lost.wait(10))
+        raise LeaseLost('stopping')
+
+    monkeypatch.setitem(JOB_HANDLERS, 'test', (handler, None))
+    job_id = queue.enqueue('test', {}).id
+    queue.run(queue.claim('worker-1'), 'worker-1')
+
+    assert signalled == [True]
+    job = db.session.get(Job, job_id)
+    assert (job.status, job.locked_by, job.last_error) == ('running', 'worker-2', None)
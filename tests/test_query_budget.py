@@ -0,0 +1,59 @@
+from models import Audiobook, BookOutline, PromptTemplate, QuestionnaireResponse, Template, db
+from services.query_budget import QueryBudgetExceeded, query_budget
+import pytest
+
+@pytest.fixture
+def books(app, outline):
+    # Several rows per list, so a query per row would go over the budget
+    for n in range(5):
+        template = Template(title=f"Template {n}", sections=[{'title': 'Section', 'questions': []}])
+        response = QuestionnaireResponse(template=template, responses={'answer': n})
+        db.session.add_all([
+            template, response,
+            BookOutline(questionnaire=response, chapters={'title': f"Book {n}", 'chapters': []}),
+            PromptTemplate(name=f"Prompt {n}", type='chapter', template_content='Write {title}.')
+        ])
+    audiobook = Audiobook(outline_id=outline.id, chapter_files={}, chapter_hashes={}, status='generating')
+    db.session.add(audiobook)
+    db.session.commit()
+    return outline, audiobook
+
+def test_strict_in_testing(app):
+    assert app.testing
+    assert not app.config['QUERY_BUDGET_STRICT']
+
+def test_list_and_detail_views_stay_within_budget(app, books):
+    outline, audiobook = books
+    client = app.test_client()
+    urls = [
+        '/templates',
+        '/questionnaires/list',
+        f"/questionnaires/response/{outline.questionnaire_id}",
+        '/prompts',
+        f"/outlines/{outline.id}",
+        f"/audiobooks/{audiobook.id}",
+        f"/audiobooks/{audiobook.id}/status",
+    ]
+    for url in urls:
+        assert client.get(url).status_code == 200, url
+
+def test_view_over_budget_raises(app, books):
+    @app.route('/test/over-budget')
+    @query_budget(1)
+    def over_budget():
+        return ', '.join(template.title for template in Template.query.all()
+                         if template.questionnaire_responses)
+
+    with pytest.raises(QueryBudgetExceeded, match=r'over_budget ran \d+ SQL statements, budget is 1'):
+        app.test_client().get('/test/over-budget')
+
+def test_view_over_budget_only_warns_in_production(app, books, caplog):
+    app.config['TESTING'] = False
+
+    @app.route('/test/over-budget')
+    @query_budget(1)
+    def over_budget():
+        return str(Template.query.count() + QuestionnaireResponse.query.count())
+
+    assert app.test_client().get('/test/over-budget').status_code == 200
+    assert 'over_budget ran 2 SQL statements' in caplog.text
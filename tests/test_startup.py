@@ -0,0 +1,12 @@
+from benchmarks import startup
+import pytest
+
+@pytest.mark.parametrize('target', sorted(startup.TARGETS))
+def test_cold_start_is_within_budget_and_lazy(target, tmp_path):
+    env = startup.environment(str(tmp_path))
+    assert startup.check(target, env, runs=3, budget_ms=startup.BUDGETS_MS[target]) == []
+
+def test_eager_imports_are_reported(tmp_path, monkeypatch):
+    monkeypatch.setitem(startup.TARGETS, 'main', ['-c', 'import main, openai'])
+    env = startup.environment(str(tmp_path))
+    assert startup.eager_modules('main', env) == ['openai', 'httpx']
@@ -0,0 +1,22 @@
+from app import create_app
+from services.structured_logging import process_log_file
+import json
+import os
+
+def test_process_log_file():
+    assert process_log_file('logs/audiov4.log', '') == 'logs/audiov4.log'
+    assert process_log_file('logs/audiov4.log', 'worker-2') == 'logs/audiov4.worker-2.log'
+    assert process_log_file('logs/audiov4', 'web-{pid}') == f"logs/audiov4.web-{os.getpid()}"
+
+def test_log_file_suffix(app, tmp_path, monkeypatch):
+    monkeypatch.setenv('LOG_FILE_SUFFIX', 'worker-3')
+    worker_app = create_app()
+    worker_app.logger.warning('from the worker')
+    worker_app.logger.handlers[0].listener.stop()
+
+    def messages(name):
+        with open(tmp_path / 'logs' / name) as f:
+            return [json.loads(line)['message'] for line in f]
+
+    assert 'from the worker' in messages('test.worker-3.log')
+    assert 'from the worker' not in messages('test.log')
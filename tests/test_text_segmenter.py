@@ -0,0 +1,25 @@
+from services.text_segmenter import segment_text, split_sentences
+
+TEXT = (
+    'She whispered, “Is anyone there?” Nobody answered. (The house had been empty for years.) '
+    'He said "stop." Then he ran! Why [it was late]? It ended…\n\n'
+    "A second paragraph, shorter. It says 'done.' And it is."
+)
+
+def _visible(text):
+    return ''.join(text.split())
+
+def test_split_sentences_keeps_closing_quotes_and_brackets():
+    assert split_sentences('alpha “quoted.” beta end) gamma. delta') == [
+        'alpha “quoted.”', 'beta end) gamma.', 'delta'
+    ]
+    assert split_sentences('He said "stop.") Then he ran.') == ['He said "stop.")', 'Then he ran.']
+
+def test_split_sentences_only_removes_whitespace():
+    assert _visible(''.join(split_sentences(TEXT))) == _visible(TEXT)
+
+def test_segment_text_only_removes_whitespace():
+    for max_chars in (10, 30, 60, 200, 4096):
+        segments = segment_text(TEXT, max_chars)
+        assert all(len(segment) <= max_chars for segment in segments)
+        assert _visible(''.join(segments)) == _visible(TEXT)
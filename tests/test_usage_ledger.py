@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta
+from models import Audiobook, OpenAIUsage, db
+from services import usage_ledger
+from services.query_budget import count_queries
+import pytest
+
+@pytest.fixture
+def usage(app, outline):
+    audiobook = Audiobook(outline_id=outline.id, chapter_files={}, chapter_hashes={}, status='complete')
+    db.session.add(audiobook)
+    db.session.flush()
+    rows = [
+        OpenAIUsage(kind='chat', model='gpt-4o', prompt_tokens=1000, completion_tokens=500,
+                    latency_ms=latency, retries=1, outline_id=outline.id)
+        for latency in (100.0, 200.0, 300.0, 400.0)
+    ] + [
+        OpenAIUsage(kind='chat', model='gpt-4o', status='error', latency_ms=None, outline_id=outline.id),
+        OpenAIUsage(kind='tts', model='tts-1', input_chars=2000, latency_ms=50.0, audiobook_id=audiobook.id),
+        OpenAIUsage(kind='chat', model='unpriced', prompt_tokens=10, completion_tokens=10, latency_ms=5.0),
+        # Outside the window
+        OpenAIUsage(kind='chat', model='gpt-4o', prompt_tokens=10 ** 6, completion_tokens=10 ** 6,
+                    latency_ms=9000.0, outline_id=outline.id, created_at=datetime.utcnow() - timedelta(days=40)),
+    ]
+    db.session.add_all(rows)
+    db.session.commit()
+    return outline, audiobook
+
+def test_summary_by_model_and_book(app, usage):
+    outline, audiobook = usage
+    with count_queries() as counter:
+        summary = usage_ledger.summary(30)
+    assert counter.count <= 3, counter.statements
+
+    models = {(m['kind'], m['model']): m for m in summary['models']}
+    chat = models[('chat', 'gpt-4o')]
+    assert (chat['calls'], chat['errors'], chat['retries']) == (5, 1, 4)
+    assert (chat['prompt_tokens'], chat['completion_tokens']) == (4000, 2000)
+    assert chat['cost'] == round((4000 * 2.5 + 2000 * 10.0) / 1_000_000, 4)
+    assert (chat['p50_latency_ms'], chat['p95_latency_ms']) == (200.0, 400.0)
+    tts = models[('tts', 'tts-1')]
+    assert tts['input_chars'] == 2000
+    assert tts['cost'] == round(2000 * 15.0 / 1_000_000, 4)
+    assert models[('chat', 'unpriced')]['cost'] == 0.0
+
+    # The audiobook's TTS call counts towards its outline
+    [book] = summary['books']
+    assert book['outline_id'] == outline.id
+    assert book['title'] == outline.title
+    assert book['calls'] == 6
+    assert book['outline_cost'] == chat['cost']
+    assert book['audiobook_cost'] == tts['cost']
+    assert book['cost'] == round(chat['cost'] + tts['cost'], 4)
+    assert (book['p50_latency_ms'], book['p95_latency_ms']) == (200.0, 400.0)
+
+def test_usage_view(app, usage):
+    client = app.test_client()
+    assert client.get('/usage').status_code == 200
+    response = client.get('/usage?days=7', headers={'Accept': 'application/json'})
+    assert response.json['days'] == 7
+    assert len(response.json['models']) == 3
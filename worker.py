@@ -0,0 +1,71 @@
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+def run_worker(worker_index, poll_interval):
+    # Each process builds its own app so no database connections are shared across the fork
+    from app import create_app
+    from services.job_queue import JobQueue
+    import services.audiobook_service  # noqa: F401 - registers the audiobook job handler
+
+    # Rotating a log file shared with other processes isn't safe, so each worker writes its own
+    os.environ['LOG_FILE_SUFFIX'] = f"worker-{worker_index}"
+    app = create_app()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{worker_index}"
+    stopping = False
+
+    def request_stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    with app.app_context():
+        queue = JobQueue()
+        app.logger.info(f"Worker {worker_id} started")
+        while not stopping:
+            try:
+                job = queue.claim(worker_id)
+            except Exception as e:
+                app.logger.error(f"Worker {worker_id} failed to claim a job: {str(e)}")
+                job = None
+            if job is None:
+                time.sleep(poll_interval)
+                continue
+            queue.run(job, worker_id)
+        app.logger.info(f"Worker {worker_id} stopped")
+
+def main():
+    parser = argparse.ArgumentParser(description='Run AudioV4 background job workers')
+    parser.add_argument('--processes', type=int, default=int(os.environ.get('WORKER_PROCESSES', 2)))
+    parser.add_argument('--poll-interval', type=float, default=float(os.environ.get('JOB_POLL_INTERVAL', 2)))
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        run_worker(0, args.poll_interval)
+        return
+
+    ctx = multiprocessing.get_context('spawn')
+    processes = [
+        ctx.Process(target=run_worker, args=(i, args.poll_interval), name=f"worker-{i}")
+        for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+
+    def forward_stop(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, forward_stop)
+    signal.signal(signal.SIGINT, forward_stop)
+    for process in processes:
+        process.join()
+
+if __name__ == '__main__':
+    main()